@@ -0,0 +1,19 @@
+"""
+Общая настройка окружения для бенчмарков
+Бенчмарки запускаются из корня проекта: python benchmarks/bench_<name>.py
+"""
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'src' / 'backend'
+
+
+def setup():
+    """Подключаем src/backend и поднимаем Django (модели mock_business зависят от настроек)"""
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+    import django
+    django.setup()
@@ -0,0 +1,59 @@
+"""
+Бенчмарк хешеров паролей: проверок в секунду на одно ядро и при --threads потоках
+(bcrypt и hashlib отпускают GIL, поэтому пул потоков async-логина масштабируется по ядрам)
+
+python benchmarks/bench_hashers.py --rounds 10 --threads 4
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import _django
+
+_django.setup()
+
+from django.test import override_settings  # noqa: E402
+
+from authentication.hashers import BcryptHasher, PBKDF2Hasher, ScryptHasher  # noqa: E402
+
+# (название, хешер, параметры, память на одну проверку)
+CONFIGS = [
+    ('bcrypt cost=10', BcryptHasher(), {'AUTH_BCRYPT_ROUNDS': 10}, '4 KB'),
+    ('bcrypt cost=12', BcryptHasher(), {'AUTH_BCRYPT_ROUNDS': 12}, '4 KB'),
+    ('scrypt n=2^14 r=8 p=1', ScryptHasher(), {'AUTH_SCRYPT_N': 2 ** 14, 'AUTH_SCRYPT_R': 8, 'AUTH_SCRYPT_P': 1},
+     '16 MB'),
+    ('scrypt n=2^15 r=8 p=1', ScryptHasher(), {'AUTH_SCRYPT_N': 2 ** 15, 'AUTH_SCRYPT_R': 8, 'AUTH_SCRYPT_P': 1},
+     '32 MB'),
+    ('pbkdf2_sha256 600k', PBKDF2Hasher(), {'AUTH_PBKDF2_ITERATIONS': 600_000}, '-'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rounds', type=int, default=10, help='проверок на каждый хешер')
+    parser.add_argument('--threads', type=int, default=4, help='потоков во втором замере')
+    args = parser.parse_args()
+
+    print(f'{"hasher":<24}{"ms/verify":>10}{"verify/s/core":>15}{f"verify/s x{args.threads}":>14}{"memory":>8}')
+    for name, hasher, params, memory in CONFIGS:
+        with override_settings(**params):
+            encoded = hasher.encode('Bench-password-1')
+
+        def verify(_):
+            assert hasher.verify('Bench-password-1', encoded)
+
+        started = time.perf_counter()
+        for i in range(args.rounds):
+            verify(i)
+        single = (time.perf_counter() - started) / args.rounds
+
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            started = time.perf_counter()
+            list(pool.map(verify, range(args.rounds * args.threads)))
+            threaded = (time.perf_counter() - started) / (args.rounds * args.threads)
+
+        print(f'{name:<24}{single * 1000:>10.1f}{1 / single:>15.1f}{1 / threaded:>14.1f}{memory:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Бенчмарк памяти на один товар (tracemalloc): прежнее представление vs __slots__
+
+python benchmarks/bench_memory.py --items 100000
+"""
+import argparse
+import tracemalloc
+import uuid
+from datetime import datetime
+
+import _django
+
+_django.setup()
+
+from authentication.models import User  # noqa: E402
+from mock_business.models import MockProduct  # noqa: E402
+
+
+class LegacyProduct:
+    """Прежнее представление: __dict__, datetime и ссылка на User в каждом экземпляре"""
+
+    def __init__(self, name, price, owner):
+        self.id = str(uuid.uuid4())[:8]
+        self.name = name
+        self.price = float(price)
+        self.owner = owner
+        self.created_at = datetime.now()
+
+
+def owner_for(i, owners):
+    """
+    Как в запросах: request.user - отдельный экземпляр User на каждый запрос,
+    поэтому у каждого товара своя копия объекта владельца
+    """
+    pk = i % owners
+    return User(pk=pk, email=f'owner{pk}@example.ru')
+
+
+def measure(factory, items, owners):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    store = [factory(f'Product {i}', 100 + i, owner_for(i, owners)) for i in range(items)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del store
+    return total / items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=100_000)
+    parser.add_argument('--owners', type=int, default=1_000)
+    args = parser.parse_args()
+
+    legacy = measure(LegacyProduct, args.items, args.owners)
+    compact = measure(MockProduct, args.items, args.owners)
+
+    print(f'legacy (__dict__ + datetime + User): {legacy:.0f} bytes/item')
+    print(f'compact (__slots__ + int ts + owner id): {compact:.0f} bytes/item ({legacy / compact:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Бенчмарк выборки "только свои товары": полный перебор vs индекс по владельцу
+
+python benchmarks/bench_owner_index.py --items 1000000 --owners 10000
+"""
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+import _django
+
+_django.setup()
+
+from mock_business.models import MockProduct  # noqa: E402
+from mock_business.store import MockStore  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=1_000_000)
+    parser.add_argument('--owners', type=int, default=10_000)
+    parser.add_argument('--queries', type=int, default=100)
+    args = parser.parse_args()
+
+    owners = [SimpleNamespace(pk=i, email=f'owner{i}@example.ru') for i in range(args.owners)]
+    store = MockStore()
+
+    started = time.perf_counter()
+    for i in range(args.items):
+        store.add(MockProduct(f'Product {i}', 100, random.choice(owners)))
+    print(f'fill: {args.items} items, {args.owners} owners: {time.perf_counter() - started:.2f}s')
+
+    sample = random.sample(owners, min(args.queries, len(owners)))
+
+    started = time.perf_counter()
+    for owner in sample:
+        scanned = [p for p in store.values() if p.owner_id == owner.pk]
+    scan = (time.perf_counter() - started) / len(sample)
+
+    started = time.perf_counter()
+    for owner in sample:
+        indexed = list(store.owned_by(owner.pk))
+    index = (time.perf_counter() - started) / len(sample)
+
+    assert len(scanned) == len(indexed)
+    print(f'full scan: {scan * 1000:.3f} ms/query')
+    print(f'owner index: {index * 1000:.3f} ms/query ({scan / index:.0f}x)')
+
+
+if __name__ == '__main__':
+    main()
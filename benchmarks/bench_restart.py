@@ -0,0 +1,53 @@
+"""
+Бенчмарк перезапуска in-memory хранилища: загрузка снимка (mmap) + проигрывание хвоста журнала
+
+python benchmarks/bench_restart.py --items 1000000 --tail 10000
+"""
+import argparse
+import tempfile
+import time
+from types import SimpleNamespace
+
+import _django
+
+_django.setup()
+
+from mock_business.models import MockProduct  # noqa: E402
+from mock_business.persistence import StoreJournal  # noqa: E402
+from mock_business.store import MockStore  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=1_000_000)
+    parser.add_argument('--owners', type=int, default=10_000)
+    parser.add_argument('--tail', type=int, default=10_000, help='операций в журнале после снимка')
+    args = parser.parse_args()
+
+    owners = [SimpleNamespace(pk=i, email=f'owner{i}@example.ru') for i in range(args.owners)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = StoreJournal(directory, 'products', MockProduct, snapshot_every=10 ** 12).attach(MockStore())
+        store.load_items(MockProduct(f'Product {i}', 100, owners[i % args.owners]) for i in range(args.items))
+
+        started = time.perf_counter()
+        store.journal.compact()
+        print(f'snapshot of {args.items} items: {time.perf_counter() - started:.2f}s')
+
+        started = time.perf_counter()
+        for i in range(args.tail):
+            store.add(MockProduct(f'Tail {i}', 100, owners[i % args.owners]))
+        print(f'journal: {args.tail} appends: {time.perf_counter() - started:.2f}s')
+        expected = len(store)
+        store.journal.close()
+        del store
+
+        started = time.perf_counter()
+        restored = StoreJournal(directory, 'products', MockProduct).attach(MockStore())
+        elapsed = time.perf_counter() - started
+        assert len(restored) == expected
+        print(f'restart (snapshot + {args.tail} log records): {elapsed:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
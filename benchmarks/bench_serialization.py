@@ -0,0 +1,48 @@
+"""
+Бенчмарк рендеринга страницы списка: to_dict() + JSONRenderer vs закешированный JSON объектов
+
+python benchmarks/bench_serialization.py --items 1000 --rounds 200
+"""
+import argparse
+import time
+from types import SimpleNamespace
+
+import _django
+
+_django.setup()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from mock_business.models import MockProduct  # noqa: E402
+from mock_business.serialization import EncodedItems, FragmentJSONRenderer  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    owner = SimpleNamespace(pk=1, email='owner@example.ru')
+    products = [MockProduct(f'Товар {i}', 100 + i, owner) for i in range(args.items)]
+
+    renderer = JSONRenderer()
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        plain = renderer.render({'total': len(products), 'products': [p.to_dict() for p in products], 'next': None})
+    plain_time = (time.perf_counter() - started) / args.rounds
+
+    fragments = FragmentJSONRenderer()
+    fragments.render({'products': EncodedItems(products)})  # прогрев кеша (первый запрос после изменения)
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        cached = fragments.render({'total': len(products), 'products': EncodedItems(products), 'next': None})
+    cached_time = (time.perf_counter() - started) / args.rounds
+
+    assert plain == cached
+    print(f'to_dict + JSONRenderer: {plain_time * 1000:.2f} ms/page ({args.items} items)')
+    print(f'cached fragments: {cached_time * 1000:.2f} ms/page ({plain_time / cached_time:.0f}x)')
+
+
+if __name__ == '__main__':
+    main()
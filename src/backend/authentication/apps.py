@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class AuthenticationConfig(AppConfig):
     name = 'authentication'
+
+    def ready(self):
+        # Подключаем сигналы инвалидации кеша пользователей
+        from . import signals  # noqa: F401
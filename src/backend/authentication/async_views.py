@@ -0,0 +1,124 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework import status
+
+from . import throttling
+from .models import User
+from .password_pool import PoolOverloaded, password_pool
+from .serializers import RegisterSerializer, LoginSerializer
+from .views import auth_payload, get_email
+
+
+# Async-версии login/register для ASGI (config/asgi.py, AUTH_ASYNC_VIEWS):
+# bcrypt считается в ограниченном пуле потоков, event loop в это время обслуживает другие запросы,
+# а при переполнении пула запрос сразу получает 503
+def json_response(data, status=status.HTTP_200_OK, headers=None):
+    # Как JSONRenderer DRF: кириллица без экранирования
+    return JsonResponse(data, status=status, headers=headers, json_dumps_params={'ensure_ascii': False})
+
+
+def overloaded():
+    return json_response(
+        {'error': 'Сервер перегружен, повторите попытку позже'},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={'Retry-After': '1'}
+    )
+
+
+def throttled(wait):
+    body, headers = throttling.throttled_response_args(wait)
+    return json_response(body, status=status.HTTP_429_TOO_MANY_REQUESTS, headers=headers)
+
+
+def parse_body(request):
+    """JSON-объект из тела запроса (None - тело не JSON-объект)"""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@csrf_exempt
+@require_POST
+async def register(request):
+    """
+    Регистрация нового пользователя (async)
+    POST /api/auth/register/
+    """
+    data = parse_body(request)
+    if data is None:
+        return json_response({'error': 'Ожидается JSON-объект'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Лимит попыток - до проверки email в БД и хеширования пароля
+    wait = await throttling.aretry_after(request, 'register', get_email(data))
+    if wait:
+        return throttled(wait)
+
+    serializer = RegisterSerializer(data=data)
+    # Проверка уникальности email ходит в БД
+    if not await sync_to_async(serializer.is_valid)():
+        return json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    user, password = serializer.new_user(serializer.validated_data)
+    try:
+        await password_pool.run(user.set_password, password)
+    except PoolOverloaded:
+        return overloaded()
+    await user.asave()
+
+    # Роли для claims токена читаются из БД
+    return json_response(await sync_to_async(auth_payload)(user), status=status.HTTP_201_CREATED)
+
+
+@csrf_exempt
+@require_POST
+async def login(request):
+    """
+    Вход пользователя (async)
+    POST /api/auth/login/
+    """
+    data = parse_body(request)
+    if data is None:
+        return json_response({'error': 'Ожидается JSON-объект'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Лимит попыток по IP и по аккаунту - до поиска пользователя и bcrypt
+    wait = await throttling.aretry_after(request, 'login', get_email(data))
+    if wait:
+        return throttled(wait)
+
+    serializer = LoginSerializer(data=data)
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    email = serializer.validated_data['email']
+    password = serializer.validated_data['password']
+
+    user = await User.objects.filter(email=email).afirst()
+    if user is None:
+        return json_response({'error': 'Неверный email или пароль'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    try:
+        valid = await password_pool.run(user.check_password, password)
+    except PoolOverloaded:
+        return overloaded()
+    if not valid:
+        return json_response({'error': 'Неверный email или пароль'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    if not user.is_active:
+        return json_response({'error': 'Аккаунт деактивирован'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    # Хеш устаревшим алгоритмом или с устаревшими параметрами - пересчитываем, пока знаем пароль
+    if user.password_needs_rehash():
+        try:
+            await password_pool.run(user.set_password, password)
+        except PoolOverloaded:
+            pass  # вход уже успешен; перехешируем при следующем
+        else:
+            await user.asave(update_fields=['password'])
+
+    return json_response(await sync_to_async(auth_payload)(user))
@@ -0,0 +1,181 @@
+import base64
+import hashlib
+import hmac
+import secrets
+from functools import lru_cache
+
+import bcrypt
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+class BcryptHasher:
+    """
+    bcrypt: хеш в формате самой библиотеки ($2b$<cost>$...), как у всех существующих паролей
+    Стоимость - AUTH_BCRYPT_ROUNDS
+    """
+    algorithm = 'bcrypt'
+
+    def identifies(self, encoded):
+        return encoded.startswith(('$2a$', '$2b$', '$2y$'))
+
+    def encode(self, password):
+        salt = bcrypt.gensalt(rounds=settings.AUTH_BCRYPT_ROUNDS)
+        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+    def verify(self, password, encoded):
+        try:
+            return bcrypt.checkpw(password.encode('utf-8'), encoded.encode('utf-8'))
+        except ValueError:  # повреждённый хеш
+            return False
+
+    def needs_rehash(self, encoded):
+        try:
+            cost = int(encoded.split('$')[2])
+        except (IndexError, ValueError):
+            return True
+        return cost != settings.AUTH_BCRYPT_ROUNDS
+
+
+class ScryptHasher:
+    """
+    scrypt из hashlib: scrypt$<n>$<r>$<p>$<соль>$<хеш>
+    n - стоимость по CPU и памяти (степень двойки), r - размер блока, p - параллелизм:
+    одна проверка занимает 128 * n * r байт памяти - это и делает перебор на GPU дорогим.
+    Параметры - AUTH_SCRYPT_N / AUTH_SCRYPT_R / AUTH_SCRYPT_P, проверка идёт с параметрами из хеша
+    """
+    algorithm = 'scrypt'
+    dklen = 64
+
+    def identifies(self, encoded):
+        return encoded.startswith(self.algorithm + '$')
+
+    @staticmethod
+    def params():
+        return settings.AUTH_SCRYPT_N, settings.AUTH_SCRYPT_R, settings.AUTH_SCRYPT_P
+
+    def _derive(self, password, salt, n, r, p):
+        return hashlib.scrypt(
+            password.encode('utf-8'), salt=salt, n=n, r=r, p=p, dklen=self.dklen,
+            maxmem=256 * n * r * p + 2 ** 20  # по умолчанию OpenSSL ограничивает 32 МБ
+        )
+
+    def encode(self, password):
+        n, r, p = self.params()
+        salt = secrets.token_bytes(16)
+        digest = self._derive(password, salt, n, r, p)
+        return f'{self.algorithm}${n}${r}${p}${_b64encode(salt)}${_b64encode(digest)}'
+
+    def _split(self, encoded):
+        algorithm, n, r, p, salt, digest = encoded.split('$')
+        return int(n), int(r), int(p), _b64decode(salt), _b64decode(digest)
+
+    def verify(self, password, encoded):
+        try:
+            n, r, p, salt, digest = self._split(encoded)
+            return hmac.compare_digest(self._derive(password, salt, n, r, p), digest)
+        except ValueError:
+            return False
+
+    def needs_rehash(self, encoded):
+        try:
+            n, r, p, _, _ = self._split(encoded)
+        except ValueError:
+            return True
+        return (n, r, p) != self.params()
+
+
+class PBKDF2Hasher:
+    """
+    PBKDF2-HMAC-SHA256 из hashlib: pbkdf2_sha256$<итерации>$<соль>$<хеш> (тот же формат, что у Django)
+    Число итераций - AUTH_PBKDF2_ITERATIONS
+    """
+    algorithm = 'pbkdf2_sha256'
+
+    def identifies(self, encoded):
+        return encoded.startswith(self.algorithm + '$')
+
+    def _derive(self, password, salt, iterations):
+        return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('ascii'), iterations)
+
+    def encode(self, password):
+        iterations = settings.AUTH_PBKDF2_ITERATIONS
+        salt = secrets.token_urlsafe(16)
+        digest = self._derive(password, salt, iterations)
+        return f'{self.algorithm}${iterations}${salt}${base64.b64encode(digest).decode("ascii")}'
+
+    def _split(self, encoded):
+        algorithm, iterations, salt, digest = encoded.split('$')
+        return int(iterations), salt, base64.b64decode(digest)
+
+    def verify(self, password, encoded):
+        try:
+            iterations, salt, digest = self._split(encoded)
+            return hmac.compare_digest(self._derive(password, salt, iterations), digest)
+        except ValueError:
+            return False
+
+    def needs_rehash(self, encoded):
+        try:
+            iterations, _, _ = self._split(encoded)
+        except ValueError:
+            return True
+        return iterations != settings.AUTH_PBKDF2_ITERATIONS
+
+
+@lru_cache
+def get_hashers():
+    """
+    Хешеры из AUTH_PASSWORD_HASHERS (пути к классам)
+    Первый хеширует новые пароли, остальные только проверяют старые хеши
+    """
+    hashers = [import_string(path)() for path in settings.AUTH_PASSWORD_HASHERS]
+    if not hashers:
+        raise ImproperlyConfigured('AUTH_PASSWORD_HASHERS не может быть пустым')
+    return hashers
+
+
+@receiver(setting_changed)
+def reset_hashers(*, setting, **kwargs):
+    if setting == 'AUTH_PASSWORD_HASHERS':
+        get_hashers.cache_clear()
+
+
+def identify_hasher(encoded):
+    """Хешер по префиксу сохранённого хеша (None - формат неизвестен или пароль не задан)"""
+    if not encoded:
+        return None
+    for hasher in get_hashers():
+        if hasher.identifies(encoded):
+            return hasher
+    return None
+
+
+def make_password(password):
+    """Хеш пароля основным хешером"""
+    return get_hashers()[0].encode(password)
+
+
+def check_password(password, encoded):
+    """Проверка пароля хешером, который определяется по формату хеша"""
+    hasher = identify_hasher(encoded)
+    return hasher is not None and hasher.verify(password, encoded)
+
+
+def needs_rehash(encoded):
+    """Хеш не основным хешером или с устаревшими параметрами - пересчитать при успешном входе"""
+    hasher = identify_hasher(encoded)
+    if hasher is None:
+        return False  # неизвестный формат не проверяется, значит и входа с ним не будет
+    return hasher is not get_hashers()[0] or hasher.needs_rehash(encoded)
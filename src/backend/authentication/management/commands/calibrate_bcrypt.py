@@ -0,0 +1,63 @@
+import statistics
+import time
+
+import bcrypt
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+MIN_ROUNDS = 4
+MAX_ROUNDS = 31
+
+
+def measure_hashpw(rounds, samples):
+    """Медианное время bcrypt.hashpw (мс) со стоимостью rounds"""
+    password = b'calibration-password'
+    timings = []
+    for _ in range(samples):
+        salt = bcrypt.gensalt(rounds=rounds)
+        start = time.perf_counter()
+        bcrypt.hashpw(password, salt)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    """
+    Подбор стоимости bcrypt под железо: замеряет bcrypt.hashpw на этом хосте
+    и рекомендует наибольшую стоимость, при которой хеш считается не дольше --target-ms.
+    Каждая следующая стоимость вдвое дороже предыдущей, поэтому замер останавливается,
+    как только время превысит цель
+    """
+    help = 'Замерить bcrypt.hashpw и подобрать AUTH_BCRYPT_ROUNDS под целевое время хеширования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=250.0,
+                            help='Допустимое время одного хеширования, мс (по умолчанию 250)')
+        parser.add_argument('--samples', type=int, default=3,
+                            help='Замеров на каждую стоимость (берётся медиана)')
+
+    def handle(self, *args, target_ms, samples, **options):
+        if target_ms <= 0 or samples <= 0:
+            raise CommandError('--target-ms и --samples должны быть положительными')
+
+        current = settings.AUTH_BCRYPT_ROUNDS
+        recommended = None
+        for rounds in range(MIN_ROUNDS, MAX_ROUNDS + 1):
+            elapsed = measure_hashpw(rounds, samples)
+            marker = ' (текущая)' if rounds == current else ''
+            self.stdout.write(f'rounds={rounds:2d}: {elapsed:9.1f} мс{marker}')
+            if elapsed > target_ms:
+                break
+            recommended = rounds
+
+        if recommended is None:
+            raise CommandError(f'Даже rounds={MIN_ROUNDS} дольше {target_ms:g} мс')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Рекомендуемая стоимость для {target_ms:g} мс: AUTH_BCRYPT_ROUNDS = {recommended}'
+        ))
+        if recommended != current:
+            self.stdout.write(
+                f'Сейчас AUTH_BCRYPT_ROUNDS = {current}; после смены хеши пользователей '
+                f'пересчитаются при их следующем входе'
+            )
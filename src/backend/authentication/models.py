@@ -1,7 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.utils import timezone
-import bcrypt
+
+from . import hashers
 
 
 # Create your models here.
@@ -66,22 +67,23 @@ class User(AbstractBaseUser, PermissionsMixin):
     def set_password(self, raw_password):
         """
         Переопределяем метод установки пароля
-        Используем bcrypt вместо стандартного Django hasher'а
+        Хешер выбирается настройкой AUTH_PASSWORD_HASHERS (по умолчанию bcrypt), а не стандартным Django
         """
-        salt = bcrypt.gensalt()
-        self.password = bcrypt.hashpw(
-            raw_password.encode('utf-8'),
-            salt
-        ).decode('utf-8')
+        self.password = hashers.make_password(raw_password)
 
     def check_password(self, raw_password):
         """
         Переопределяем метод проверки пароля
+        Алгоритм определяется по формату сохранённого хеша (bcrypt, scrypt, PBKDF2)
+        """
+        return hashers.check_password(raw_password, self.password)
+
+    def password_needs_rehash(self):
+        """
+        Хеш посчитан не основным хешером или с другими параметрами (например, AUTH_BCRYPT_ROUNDS)
+        Такой пароль перехешируется при следующем успешном входе
         """
-        return bcrypt.checkpw(
-            raw_password.encode('utf-8'),
-            self.password.encode('utf-8')
-        )
+        return hashers.needs_rehash(self.password)
 
     def soft_delete(self):
         """
@@ -0,0 +1,70 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+
+class PoolOverloaded(Exception):
+    """Все потоки заняты и очередь заполнена - запрос нужно отклонить (503), а не ждать"""
+
+
+class PasswordPool:
+    """
+    Ограниченный пул потоков для хеширования паролей (bcrypt.hashpw / checkpw)
+    bcrypt отпускает GIL, поэтому потоки пула считают хеши параллельно на разных ядрах,
+    а поток обработки запроса (event loop под ASGI) не блокируется.
+    Одновременно в пуле не больше workers + queue_size задач: сверх этого submit()
+    сразу бросает PoolOverloaded вместо очереди, время ожидания в которой растёт без предела
+    """
+
+    def __init__(self, workers=None, queue_size=None):
+        self._workers = workers  # None - AUTH_HASH_WORKERS
+        self._queue_size = queue_size  # None - AUTH_HASH_QUEUE_SIZE
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._slots = None
+
+    def _ensure(self):
+        """Пул создаётся при первом использовании и заново после fork воркера (потоки не наследуются)"""
+        with self._lock:
+            if self._pid != os.getpid():
+                workers = self._workers or settings.AUTH_HASH_WORKERS
+                queue_size = self._queue_size
+                if queue_size is None:
+                    queue_size = settings.AUTH_HASH_QUEUE_SIZE
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+                self._slots = threading.BoundedSemaphore(workers + queue_size)
+                self._pid = os.getpid()
+            return self._executor, self._slots
+
+    def submit(self, fn, *args):
+        """Задача в пул (concurrent.futures.Future) или PoolOverloaded, если мест нет"""
+        executor, slots = self._ensure()
+        if not slots.acquire(blocking=False):
+            raise PoolOverloaded()
+
+        def task():
+            # Место освобождается до того, как ждущий получит результат
+            try:
+                return fn(*args)
+            finally:
+                slots.release()
+
+        try:
+            future = executor.submit(task)
+        except BaseException:
+            slots.release()
+            raise
+        # Задача отменена, не начавшись (клиент отключился, пока она ждала в очереди)
+        future.add_done_callback(lambda f: f.cancelled() and slots.release())
+        return future
+
+    async def run(self, fn, *args):
+        """Выполнить fn(*args) в пуле, не блокируя event loop"""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+
+password_pool = PasswordPool()
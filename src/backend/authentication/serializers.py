@@ -42,15 +42,20 @@ class RegisterSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         """Создание пользователя"""
-        validated_data.pop('password_confirm')
-        password = validated_data.pop('password')
-
-        user = User(**validated_data)
+        user, password = self.new_user(validated_data)
         user.set_password(password)  # bcrypt
         user.save()
 
         return user
 
+    @staticmethod
+    def new_user(validated_data):
+        """Несохранённый пользователь (ещё без пароля) и пароль из проверенных данных"""
+        data = dict(validated_data)
+        data.pop('password_confirm')
+        password = data.pop('password')
+        return User(**data), password
+
 
 class LoginSerializer(serializers.Serializer):
     """
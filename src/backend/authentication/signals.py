@@ -0,0 +1,36 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+from .user_cache import invalidate_user
+
+# Поля, от которых зависит решение CachedJWTAuthentication (активность, права, email в claims)
+AUTH_FIELDS = frozenset({'email', 'is_active', 'is_staff', 'is_superuser', 'deleted_at'})
+
+
+def changes_auth_state(update_fields):
+    """Может ли сохранение с такими update_fields изменить результат аутентификации"""
+    if update_fields is None:
+        return True  # полное сохранение: что поменялось - неизвестно
+    fields = AUTH_FIELDS
+    if api_settings.CHECK_REVOKE_TOKEN:
+        fields = fields | {'password'}  # токен отзывается по хешу пароля
+    return not fields.isdisjoint(update_fields)
+
+
+@receiver(post_save, sender=User)
+def reset_cached_user(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Сохранение пользователя (профиль, soft_delete, смена пароля) сбрасывает его в кеше
+    Нового пользователя нет ни в одном кеше; сохранение, не меняющее аутентификацию
+    (например, перехеширование пароля при входе), сбрасывает только запись этого воркера
+    """
+    if created:
+        return
+    invalidate_user(instance.pk, shared=changes_auth_state(update_fields))
+
+
+@receiver(post_delete, sender=User)
+def reset_deleted_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
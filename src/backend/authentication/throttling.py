@@ -0,0 +1,175 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+# Шарды локального хранилища: запросы с разными ключами не ждут одну блокировку
+THROTTLE_SHARDS = 64
+# Сколько ключей помнить в процессе; сверх этого забываются давно не использованные
+MAX_THROTTLE_KEYS = 100_000
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+@lru_cache
+def parse_rate(rate):
+    """'10/min' -> (10, 60) - тот же формат, что у лимитов DRF"""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+class LocalBuckets:
+    """
+    Token bucket в памяти процесса: на ключ limit токенов, восполняются со скоростью limit / period
+    Ключи разложены по шардам со своей блокировкой, в каждом шарде - LRU ограниченного размера,
+    поэтому перебор случайных email не раздувает память
+    """
+
+    def __init__(self, shards=THROTTLE_SHARDS, max_keys=MAX_THROTTLE_KEYS):
+        self._shards = [(threading.Lock(), OrderedDict()) for _ in range(shards)]
+        self._max_per_shard = max(1, max_keys // shards)
+
+    def take(self, key, limit, period):
+        """Взять токен: 0 - разрешено, иначе через сколько секунд появится следующий"""
+        lock, buckets = self._shards[hash(key) % len(self._shards)]
+        rate = limit / period
+        now = time.monotonic()
+        with lock:
+            tokens, updated = buckets.pop(key, (limit, now))
+            tokens = min(limit, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / rate
+            buckets[key] = (tokens, now)
+            if len(buckets) > self._max_per_shard:
+                buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        for lock, buckets in self._shards:
+            with lock:
+                buckets.clear()
+
+
+class CacheBuckets:
+    """
+    Скользящее окно в общем кеше Django (AUTH_THROTTLE_CACHE - Redis/Memcached): лимит общий для воркеров
+    Счётчик текущего окна увеличивается атомарным incr, предыдущее окно учитывается с весом
+    оставшейся доли - без списка отметок времени на ключ
+    """
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def _key(self, key, window):
+        # Email может содержать символы, недопустимые в ключах Memcached
+        return 'throttle:' + hashlib.blake2b(f'{key}:{window}'.encode(), digest_size=16).hexdigest()
+
+    def take(self, key, limit, period):
+        now = time.time()
+        window = int(now // period)
+        current_key = self._key(key, window)
+        self.cache.add(current_key, 0, timeout=period * 2)
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:  # ключ истёк между add и incr
+            self.cache.set(current_key, 1, timeout=period * 2)
+            current = 1
+        previous = self.cache.get(self._key(key, window - 1), 0)
+
+        elapsed = now / period - window  # прошедшая доля текущего окна
+        if previous * (1 - elapsed) + current <= limit:
+            return 0
+        if current > limit or not previous:
+            return (window + 1) * period - now
+        # Ждём, пока вклад предыдущего окна не опустится до свободного места
+        return max(period * (1 - (limit - current) / previous - elapsed), 0.001)
+
+    def clear(self):
+        pass  # ключи истекают сами
+
+
+_buckets = None
+_buckets_lock = threading.Lock()
+
+
+def get_buckets():
+    """Хранилище счётчиков по AUTH_THROTTLE_CACHE (создаётся при первом использовании)"""
+    global _buckets
+    if _buckets is None:
+        with _buckets_lock:
+            if _buckets is None:
+                alias = settings.AUTH_THROTTLE_CACHE
+                _buckets = CacheBuckets(alias) if alias else LocalBuckets()
+    return _buckets
+
+
+def reset_throttles():
+    """Забыть все счётчики и заново прочитать настройки (для тестов)"""
+    global _buckets
+    with _buckets_lock:
+        if _buckets is not None:
+            _buckets.clear()
+        _buckets = None
+
+
+@receiver(setting_changed)
+def reset_buckets(*, setting, **kwargs):
+    if setting == 'AUTH_THROTTLE_CACHE':
+        reset_throttles()
+
+
+def client_ip(request):
+    """IP клиента; за AUTH_THROTTLE_NUM_PROXIES прокси - из X-Forwarded-For"""
+    num_proxies = settings.AUTH_THROTTLE_NUM_PROXIES
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if num_proxies and forwarded:
+        addresses = [address.strip() for address in forwarded.split(',')]
+        return addresses[-min(num_proxies, len(addresses))]
+    return request.META.get('REMOTE_ADDR')
+
+
+def retry_after(request, action, email=None):
+    """
+    Проверка лимитов действия (login, register) - до проверки данных и хеширования пароля
+    Ключи: IP клиента (лимит <action>_ip) и email без учёта регистра (<action>_email)
+    Возвращает 0 - можно продолжать, иначе сколько секунд подождать (ответ 429)
+    """
+    checks = [(f'{action}_ip', client_ip(request))]
+    if isinstance(email, str) and email.strip():
+        checks.append((f'{action}_email', email.strip().lower()))
+
+    for scope, ident in checks:
+        rate = settings.AUTH_THROTTLE_RATES.get(scope)
+        if not rate or not ident:
+            continue
+        limit, period = parse_rate(rate)
+        wait = get_buckets().take(f'{scope}:{ident}', limit, period)
+        if wait:
+            return wait
+    return 0
+
+
+async def aretry_after(request, action, email=None):
+    """retry_after для async-представлений"""
+    if settings.AUTH_THROTTLE_CACHE:
+        # Запрос к общему кешу - в отдельном потоке, не в event loop
+        return await sync_to_async(retry_after, thread_sensitive=False)(request, action, email)
+    # Локальные счётчики - микросекунды без ввода-вывода, прямо в event loop
+    return retry_after(request, action, email)
+
+
+def throttled_response_args(wait):
+    """Тело и заголовки ответа 429"""
+    seconds = math.ceil(wait)
+    return {'error': f'Слишком много попыток, повторите через {seconds} с'}, {'Retry-After': str(seconds)}
@@ -0,0 +1,139 @@
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from authorization.access_matrix import get_access_matrix
+
+from .models import User
+from .user_cache import user_cache
+
+
+def add_user_claims(token, user):
+    """
+    Claims для ClaimsJWTAuthentication: email, is_active и роли пользователя
+    вместе с версией матрицы прав, по которой они посчитаны (access-токен наследует их от refresh)
+    """
+    matrix = get_access_matrix()
+    token['email'] = user.email
+    token['is_active'] = user.is_active
+    token['roles'] = sorted(matrix.role_ids_for(user))
+    token['roles_version'] = matrix.version
+
+
+class ClaimsUser(TokenUser):
+    """
+    Пользователь из claims access-токена - без запроса в БД
+    id, email, is_active и роли берутся из токена; при обращении к остальным полям
+    (first_name, updated_at, ...) модель User загружается один раз и запоминается на время запроса
+    """
+
+    @cached_property
+    def id(self):
+        # simplejwt кладёт id строкой; владельцы mock-объектов и ForeignKey сравниваются с int
+        return User._meta.pk.to_python(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def email(self):
+        return self.token.get('email', '')
+
+    @cached_property
+    def is_active(self):
+        # Токены, выданные до появления claim, выдавались только активным пользователям
+        return self.token.get('is_active', True)
+
+    @cached_property
+    def is_staff(self):
+        return self.instance.is_staff
+
+    @cached_property
+    def is_superuser(self):
+        return self.instance.is_superuser
+
+    @cached_property
+    def token_roles(self):
+        """(версия матрицы прав, роли) на момент выдачи токена; None - ролей в токене нет"""
+        roles = self.token.get('roles')
+        version = self.token.get('roles_version')
+        if roles is None or version is None:
+            return None
+        return version, frozenset(roles)
+
+    @cached_property
+    def instance(self):
+        """Модель User (ленивая загрузка)"""
+        try:
+            return User.objects.get(pk=self.pk)
+        except User.DoesNotExist:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+    def __getattr__(self, attr):
+        # Сюда попадают только атрибуты, которых нет у класса: сначала claims, затем поля модели
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        if attr in self.token:
+            return self.token[attr]
+        return getattr(self.instance, attr)
+
+    def __eq__(self, other):
+        if isinstance(other, (TokenUser, User)):
+            return self.pk == other.pk
+        return NotImplemented
+
+    __hash__ = TokenUser.__hash__
+
+
+def full_user(user):
+    """Модель User для request.user (ClaimsUser загружает её из БД): для сохранения и ForeignKey"""
+    return user.instance if isinstance(user, ClaimsUser) else user
+
+
+class ClaimsJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    JWT-аутентификация без запроса пользователя в БД: request.user - ClaimsUser из claims токена
+    Цена: деактивация аккаунта вступает в силу, когда истечёт уже выданный access-токен
+    (ACCESS_TOKEN_LIFETIME); refresh деактивированному пользователю не выдаётся
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        user = ClaimsUser(validated_token)
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT-аутентификация с моделью User из кеша процесса (authentication.user_cache) - альтернатива
+    ClaimsJWTAuthentication: request.user - настоящая модель, деактивация видна не позже
+    AUTH_USER_CACHE_CHECK_INTERVAL (при общем CACHES) или AUTH_USER_CACHE_TTL
+    """
+
+    def get_user(self, validated_token):
+        try:
+            pk = User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        user = user_cache.get(pk)
+        if user is None:
+            # Запрос в БД и проверки simplejwt (is_active, отзыв по смене пароля)
+            user = super().get_user(validated_token)
+            user_cache.put(user)
+            return user
+
+        # Те же проверки, что simplejwt делает после запроса
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and (
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+        ):
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
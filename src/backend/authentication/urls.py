@@ -1,10 +1,14 @@
+from django.conf import settings
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView
-from . import views
+from . import async_views, views
+
+# Под ASGI (config/asgi.py) login/register - async-версии: bcrypt в ограниченном пуле потоков
+auth_views = async_views if settings.AUTH_ASYNC_VIEWS else views
 
 urlpatterns = [
-    path('register/', views.register, name='register'),
-    path('login/', views.login, name='login'),
+    path('register/', auth_views.register, name='register'),
+    path('login/', auth_views.login, name='login'),
     path('logout/', views.logout, name='logout'),
     path('profile/', views.profile, name='profile'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
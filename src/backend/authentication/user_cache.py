@@ -0,0 +1,126 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Ключ счётчика версий в общем кеше: его увеличение сбрасывает кеш пользователей во всех воркерах
+VERSION_CACHE_KEY = 'authentication:user_cache:version'
+
+
+def _shared_version():
+    """Текущая версия из общего кеша; при отсутствии ключа заводим новую"""
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(VERSION_CACHE_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_CACHE_KEY)
+    return version
+
+
+class UserCache:
+    """
+    Кеш пользователей в памяти процесса для CachedJWTAuthentication: LRU на AUTH_USER_CACHE_SIZE записей,
+    каждая живёт не дольше AUTH_USER_CACHE_TTL секунд
+
+    Сохранение пользователя сбрасывает его запись сразу; если оно может изменить аутентификацию
+    (authentication.signals.changes_auth_state), после коммита увеличивается и общая версия.
+    Версия сверяется не чаще, чем раз в AUTH_USER_CACHE_CHECK_INTERVAL секунд, и при расхождении
+    кеш очищается целиком - так деактивация в одном воркере видна остальным с этой задержкой.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = OrderedDict()  # {pk: (user, expires_at)}
+        self._version = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self, now):
+        if now - self._checked_at < settings.AUTH_USER_CACHE_CHECK_INTERVAL:
+            return
+        version = _shared_version()
+        with self._lock:
+            if version != self._version:
+                self._users.clear()
+                self._version = version
+            self._checked_at = now
+
+    def get(self, pk):
+        """
+        Копия закешированного пользователя (None - нет или устарел)
+        Копия - чтобы параллельные запросы не меняли один и тот же объект
+        """
+        now = time.monotonic()
+        self._check_version(now)
+        with self._lock:
+            entry = self._users.get(pk)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._users[pk]
+                self.misses += 1
+                return None
+            self._users.move_to_end(pk)
+            self.hits += 1
+        return copy.copy(entry[0])
+
+    def put(self, user):
+        user = copy.copy(user)
+        expires_at = time.monotonic() + settings.AUTH_USER_CACHE_TTL
+        with self._lock:
+            self._users[user.pk] = (user, expires_at)
+            self._users.move_to_end(user.pk)
+            while len(self._users) > settings.AUTH_USER_CACHE_SIZE:
+                self._users.popitem(last=False)
+
+    def discard(self, pk):
+        with self._lock:
+            self._users.pop(pk, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self._version = None
+            self._checked_at = 0.0
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """Счётчики попаданий и промахов"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._users),
+            }
+
+
+user_cache = UserCache()
+
+
+def _bump_version(pk):
+    """Увеличиваем общий счётчик, чтобы остальные воркеры сбросили свои копии"""
+    try:
+        cache.incr(VERSION_CACHE_KEY)
+    except ValueError:
+        cache.set(VERSION_CACHE_KEY, time.time_ns(), None)
+    # Запись могла снова попасть в кеш до коммита - со старыми данными
+    user_cache.discard(pk)
+
+
+def invalidate_user(pk, shared=True):
+    """
+    Сбросить пользователя в кеше
+    Локальная запись сбрасывается сразу, общий счётчик увеличивается после коммита
+    shared=False - только запись этого воркера (и ещё раз после коммита), без общего счётчика:
+    остальные воркеры обновят свою копию по AUTH_USER_CACHE_TTL
+    """
+    user_cache.discard(pk)
+    if shared:
+        transaction.on_commit(lambda: _bump_version(pk))
+    else:
+        transaction.on_commit(lambda: user_cache.discard(pk))
@@ -1,11 +1,17 @@
+from functools import wraps
+
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.contrib.auth import authenticate
+from django.views.decorators.http import etag
 
+from . import throttling
 from .models import User
+from .tokens import add_user_claims
 from .serializers import (
     RegisterSerializer,
     UserProfileSerializer,
@@ -21,8 +27,8 @@ def get_tokens_for_user(user):
     """
     refresh = RefreshToken.for_user(user)
 
-    # Можно добавить дополнительные данные в токен
-    refresh['email'] = user.email
+    # email, is_active и роли - для аутентификации без запроса пользователя (ClaimsJWTAuthentication)
+    add_user_claims(refresh, user)
 
     return {
         'access': str(refresh.access_token),
@@ -30,6 +36,24 @@ def get_tokens_for_user(user):
     }
 
 
+def get_email(data):
+    """email из тела запроса (до валидации - для лимитов)"""
+    return data.get('email') if isinstance(data, dict) else None
+
+
+def throttled(wait):
+    body, headers = throttling.throttled_response_args(wait)
+    return Response(body, status=status.HTTP_429_TOO_MANY_REQUESTS, headers=headers)
+
+
+def auth_payload(user):
+    """Тело успешного ответа register/login: профиль и токены (роли для токена читаются из БД)"""
+    return {
+        'user': UserProfileSerializer(user).data,
+        'tokens': get_tokens_for_user(user)
+    }
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])  # Разрешаем всем
 def register(request):
@@ -37,16 +61,16 @@ def register(request):
     Регистрация нового пользователя
     POST /api/auth/register/
     """
+    # Лимит попыток - до проверки email в БД и хеширования пароля
+    wait = throttling.retry_after(request, 'register', get_email(request.data))
+    if wait:
+        return throttled(wait)
+
     serializer = RegisterSerializer(data=request.data)
 
     if serializer.is_valid():
         user = serializer.save()
-        tokens = get_tokens_for_user(user)
-
-        return Response({
-            'user': UserProfileSerializer(user).data,
-            'tokens': tokens
-        }, status=status.HTTP_201_CREATED)
+        return Response(auth_payload(user), status=status.HTTP_201_CREATED)
 
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -58,6 +82,11 @@ def login(request):
     Вход пользователя
     POST /api/auth/login/
     """
+    # Лимит попыток по IP и по аккаунту - до поиска пользователя и bcrypt
+    wait = throttling.retry_after(request, 'login', get_email(request.data))
+    if wait:
+        return throttled(wait)
+
     serializer = LoginSerializer(data=request.data)
 
     if serializer.is_valid():
@@ -82,13 +111,13 @@ def login(request):
                     status=status.HTTP_401_UNAUTHORIZED
                 )
 
-            # Всё ОК - генерируем токены
-            tokens = get_tokens_for_user(user)
+            # Хеш устаревшим алгоритмом или с устаревшими параметрами - пересчитываем, пока знаем пароль
+            if user.password_needs_rehash():
+                user.set_password(password)
+                user.save(update_fields=['password'])
 
-            return Response({
-                'user': UserProfileSerializer(user).data,
-                'tokens': tokens
-            })
+            # Всё ОК - генерируем токены
+            return Response(auth_payload(user))
 
         except User.DoesNotExist:
             return Response(
@@ -120,11 +149,41 @@ def logout(request):
     return Response({'message': 'Успешный выход из системы'})
 
 
+def profile_etag(request):
+    """
+    Слабый ETag профиля: updated_at меняется при каждом сохранении пользователя
+    Считается по уже загруженному request.user, без сериализации профиля
+    """
+    user = request.user
+    return f'W/"{user.pk}-{int(user.updated_at.timestamp() * 1_000_000)}"'
+
+
+def etag_on_read(etag_func):
+    """
+    Как django.views.decorators.http.etag, но только для GET/HEAD
+    Слабый ETag не проходит строгое сравнение If-Match, поэтому PUT/DELETE условные заголовки не проверяют
+    """
+    def decorator(view):
+        conditional = etag(etag_func)(view)
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if request.method in ('GET', 'HEAD'):
+                return conditional(request, *args, **kwargs)
+            return view(request, *args, **kwargs)
+        return inner
+    return decorator
+
+
 @api_view(['GET', 'PUT', 'DELETE'])
+# Состояние аккаунта - всегда по БД, какой бы DEFAULT_AUTHENTICATION_CLASSES ни был выбран:
+# деактивированный пользователь не должен видеть и менять профиль по ещё живому токену
+@authentication_classes([JWTAuthentication])
+@etag_on_read(profile_etag)  # внутри api_view: request.user уже аутентифицирован DRF
 def profile(request):
     """
     Управление профилем пользователя
-    GET - получить профиль
+    GET - получить профиль (ETag; If-None-Match -> 304 Not Modified)
     PUT - обновить профиль
     DELETE - мягко удалить аккаунт (деактивировать)
     """
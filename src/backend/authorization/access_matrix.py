@@ -0,0 +1,164 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import AccessMatrixVersion, Role, AccessRule, UserRole
+
+# Биты прав в маске ресурса
+CREATE = 1 << 0
+READ = 1 << 1
+READ_ALL = 1 << 2
+UPDATE = 1 << 3
+UPDATE_ALL = 1 << 4
+DELETE = 1 << 5
+DELETE_ALL = 1 << 6
+
+# Соответствие полей AccessRule битам маски
+RULE_FLAGS = (
+    ('can_create', CREATE),
+    ('can_read', READ),
+    ('can_read_all', READ_ALL),
+    ('can_update', UPDATE),
+    ('can_update_all', UPDATE_ALL),
+    ('can_delete', DELETE),
+    ('can_delete_all', DELETE_ALL),
+)
+
+# action -> (бит "свои", бит "все")
+ACTION_BITS = {
+    'create': (CREATE, CREATE),
+    'read': (READ, READ_ALL),
+    'update': (UPDATE, UPDATE_ALL),
+    'delete': (DELETE, DELETE_ALL),
+}
+
+
+class AccessMatrix:
+    """
+    Скомпилированная матрица прав: роль -> ресурс -> битовая маска действий
+
+    Строится одним проходом по AccessRule, роли пользователей подгружаются лениво
+    и запоминаются до следующей инвалидации (не больше ACCESS_MATRIX_MAX_USERS пользователей).
+    """
+
+    def __init__(self, version, rules, role_ids_by_name):
+        self.version = version
+        self.rules = rules  # {resource_name: {role_id: mask}}
+        self.role_ids_by_name = role_ids_by_name  # {role_name: role_id}
+        self._user_roles = OrderedDict()  # {user_id: frozenset(role_id)}, LRU
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, version):
+        """Сборка матрицы из БД"""
+        rules = {}
+        fields = [name for name, _ in RULE_FLAGS]
+        for row in AccessRule.objects.values_list('role_id', 'resource__name', *fields):
+            role_id, resource_name, flags = row[0], row[1], row[2:]
+            mask = 0
+            for (_, bit), value in zip(RULE_FLAGS, flags):
+                if value:
+                    mask |= bit
+            rules.setdefault(resource_name, {})[role_id] = mask
+
+        role_ids_by_name = dict(Role.objects.values_list('name', 'id'))
+        return cls(version, rules, role_ids_by_name)
+
+    def role_ids_for(self, user):
+        """Роли пользователя (с кешированием на время жизни матрицы)"""
+        # Роли из claims токена (ClaimsUser) верны, если с их выдачи матрица не менялась:
+        # любое изменение ролей увеличивает версию
+        token_roles = getattr(user, 'token_roles', None)
+        if token_roles is not None and token_roles[0] == self.version:
+            return token_roles[1]
+
+        with self._lock:
+            role_ids = self._user_roles.get(user.pk)
+            if role_ids is not None:
+                self._user_roles.move_to_end(user.pk)
+                return role_ids
+
+        role_ids = frozenset(
+            UserRole.objects.filter(user_id=user.pk).values_list('role_id', flat=True)
+        )
+        with self._lock:
+            self._user_roles[user.pk] = role_ids
+            if len(self._user_roles) > settings.ACCESS_MATRIX_MAX_USERS:
+                self._user_roles.popitem(last=False)
+        return role_ids
+
+    def mask_for(self, role_ids, resource_name):
+        """
+        Итоговая маска для набора ролей по ресурсу
+        None - ни у одной роли нет правила на этот ресурс
+        """
+        resource_rules = self.rules.get(resource_name)
+        if not resource_rules:
+            return None
+
+        mask = None
+        for role_id in role_ids:
+            role_mask = resource_rules.get(role_id)
+            if role_mask is not None:
+                mask = (mask or 0) | role_mask
+        return mask
+
+    def has_role(self, role_ids, role_names):
+        """Есть ли среди ролей хотя бы одна из перечисленных по имени"""
+        return any(self.role_ids_by_name.get(name) in role_ids for name in role_names)
+
+
+class _MatrixState:
+    """Локальная (в рамках процесса) копия матрицы"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.matrix = None
+        self.checked_at = 0.0
+
+
+_state = _MatrixState()
+
+
+def get_access_matrix():
+    """
+    Получить актуальную матрицу прав
+
+    Версия в БД (AccessMatrixVersion) сверяется не чаще, чем раз в ACCESS_MATRIX_CHECK_INTERVAL секунд,
+    так что чужие воркеры увидят изменения прав с этой задержкой.
+    """
+    interval = getattr(settings, 'ACCESS_MATRIX_CHECK_INTERVAL', 1.0)
+    matrix = _state.matrix
+    now = time.monotonic()
+    if matrix is not None and now - _state.checked_at < interval:
+        return matrix
+
+    with _state.lock:
+        version = AccessMatrixVersion.current()
+        matrix = _state.matrix
+        if matrix is None or matrix.version != version:
+            matrix = AccessMatrix.build(version)
+            _state.matrix = matrix
+        _state.checked_at = now
+    return matrix
+
+
+def drop_local_access_matrix():
+    """Сбросить только локальную копию матрицы (без изменения общей версии)"""
+    _state.matrix = None
+
+
+def invalidate_access_matrix():
+    """
+    Сбросить матрицу прав
+
+    Версия в БД увеличивается в той же транзакции, что и изменение: другие воркеры увидят её
+    вместе с закоммиченными данными. Локальная копия сбрасывается сразу и ещё раз после коммита -
+    её могли собрать параллельные запросы этого процесса по старым данным.
+    """
+    drop_local_access_matrix()
+    AccessMatrixVersion.bump()
+    transaction.on_commit(drop_local_access_matrix)
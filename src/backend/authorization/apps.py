@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class AuthorizationConfig(AppConfig):
     name = 'authorization'
+
+    def ready(self):
+        # Подключаем сигналы инвалидации матрицы прав
+        from . import signals  # noqa: F401
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authorization', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessMatrixVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0, verbose_name='Версия')),
+            ],
+            options={
+                'verbose_name': 'Версия матрицы прав',
+                'verbose_name_plural': 'Версия матрицы прав',
+                'db_table': 'access_matrix_version',
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -103,3 +104,32 @@ class UserRole(models.Model):
 
     def __str__(self):
         return f"{self.user.email} - {self.role.name}"
+
+
+class AccessMatrixVersion(models.Model):
+    """
+    Версия матрицы прав (одна строка): увеличивается в транзакции каждого изменения ролей,
+    ресурсов и правил, общая для всех воркеров - по ней они пересобирают свои копии матрицы
+    """
+    version = models.BigIntegerField(default=0, verbose_name='Версия')
+
+    class Meta:
+        db_table = 'access_matrix_version'
+        verbose_name = 'Версия матрицы прав'
+        verbose_name_plural = 'Версия матрицы прав'
+
+    @classmethod
+    def bump(cls):
+        """Увеличить версию (строка создаётся при первом изменении)"""
+        counter = cls.objects.filter(pk=1)
+        if counter.update(version=F('version') + 1):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(pk=1, version=1)
+        except IntegrityError:
+            counter.update(version=F('version') + 1)  # строку успел создать другой воркер
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(pk=1).values_list('version', flat=True).first() or 0
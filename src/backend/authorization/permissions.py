@@ -1,5 +1,34 @@
+from django.db.models import QuerySet
 from rest_framework import permissions
-from .models import UserRole, AccessRule
+from .access_matrix import get_access_matrix, ACTION_BITS, CREATE
+
+
+class PermissionContext:
+    """
+    Права пользователя в рамках одного запроса
+    Роли и маски по ресурсам вычисляются один раз и переиспользуются всеми проверками запроса
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.matrix = get_access_matrix()
+        self.role_ids = self.matrix.role_ids_for(user)
+        self._masks = {}  # {resource_name: mask}
+
+    def mask_for(self, resource_name):
+        """Маска прав на ресурс (None - правил нет)"""
+        if resource_name not in self._masks:
+            self._masks[resource_name] = self.matrix.mask_for(self.role_ids, resource_name)
+        return self._masks[resource_name]
+
+
+def get_permission_context(request):
+    """Контекст прав, привязанный к запросу (создаётся при первой проверке)"""
+    context = getattr(request, '_permission_context', None)
+    if context is None or context.user is not request.user:
+        context = PermissionContext(request.user)
+        request._permission_context = context
+    return context
 
 
 class HasRolePermission(permissions.BasePermission):
@@ -15,12 +44,9 @@ class HasRolePermission(permissions.BasePermission):
         if not request.user or not request.user.is_authenticated:
             return False
 
-        # Получаем все роли пользователя
-        user_roles = UserRole.objects.filter(
-            user=request.user,
-            role__name__in=self.required_roles
-        )
-        return user_roles.exists()
+        # Роли пользователя и их имена берём из скомпилированной матрицы прав
+        context = get_permission_context(request)
+        return context.matrix.has_role(context.role_ids, self.required_roles)
 
     def has_object_permission(self, request, view, obj):
         return self.has_permission(request, view)
@@ -45,86 +71,91 @@ class ResourceAccessPermission(permissions.BasePermission):
 
         # Для действия create проверяем отдельно
         if self.action == 'create':
-            return self._check_create_permission(request.user)
+            return self._check_create_permission(request)
 
         # Для list (read всех) - проверим позже в has_object_permission
         # Но базовое read permission должно быть
-        return self._check_read_permission(request.user)
+        return self._check_read_permission(request)
 
     def has_object_permission(self, request, view, obj):
         """Проверка на уровне конкретного объекта (для retrieve/update/delete)"""
         if not request.user or not request.user.is_authenticated:
             return False
 
-        # print(f"\n=== DEBUG Object Permission ===")
-        # print(f"User: {request.user.email}")
-        # print(f"Action: {self.action}")
-        # print(f"Resource: {self.resource_name}")
-
-        # Получаем все роли пользователя
-        user_roles = UserRole.objects.filter(user=request.user).values_list('role_id', flat=True)
-        # print(f"User roles: {list(user_roles)}")
-
-        # Получаем правила доступа для этих ролей и нашего ресурса
-        access_rules = AccessRule.objects.filter(
-            role_id__in=user_roles,
-            resource__name=self.resource_name
-        )
-        # print(f"Access rules found: {access_rules.count()}")
-
-        # Проверяем права в зависимости от действия
-        if self.action == 'read':
-            # Может читать все?
-            if any(rule.can_read_all for rule in access_rules):
-                # print("can_read_all = True")
-                return True
-            # Может читать свои?
-            if any(rule.can_read for rule in access_rules):
-                # print("Checking ownership for read...")
-                is_owner = self._is_owner(request.user, obj)
-                # print(f"Is owner: {is_owner}")
-                return is_owner
-
-        elif self.action == 'update':
-            if any(rule.can_update_all for rule in access_rules):
-                # print("can_update_all = True")
-                return True
-            if any(rule.can_update for rule in access_rules):
-                # print("Checking ownership for update...")
-                is_owner = self._is_owner(request.user, obj)
-                # print(f"Is owner: {is_owner}")
-                return is_owner
-
-        elif self.action == 'delete':
-            if any(rule.can_delete_all for rule in access_rules):
-                # print("can_delete_all = True")
-                return True
-            if any(rule.can_delete for rule in access_rules):
-                # print("Checking ownership for delete...")
-                is_owner = self._is_owner(request.user, obj)
-                # print(f"Is owner: {is_owner}")
-                return is_owner
-
-        # print("No permission")
+        if self.action not in ('read', 'update', 'delete'):
+            return False
+
+        # Итоговая маска прав ролей пользователя на наш ресурс
+        mask = self._get_mask(request)
+        if not mask:
+            return False
+
+        own_bit, all_bit = ACTION_BITS[self.action]
+        # Может все?
+        if mask & all_bit:
+            return True
+        # Может свои?
+        if mask & own_bit:
+            return self._is_owner(request.user, obj)
+
         return False
 
-    def _check_create_permission(self, user):
+    def filter_visible(self, request, items):
+        """
+        Отбор доступных объектов коллекции (для list)
+        Решение принимается один раз: либо видно всё (*_all), либо только свои.
+        items - QuerySet (фильтр уходит в SQL), коллекция с индексом по владельцу (owned_by)
+        или любой iterable объектов с владельцем
+        """
+        if not request.user or not request.user.is_authenticated:
+            return self._empty(items)
+
+        if self.action not in ('read', 'update', 'delete'):
+            return self._empty(items)
+
+        mask = self._get_mask(request)
+        if not mask:
+            return self._empty(items)
+
+        own_bit, all_bit = ACTION_BITS[self.action]
+        if mask & all_bit:
+            return items
+        if mask & own_bit:
+            if isinstance(items, QuerySet):
+                return items.filter(owner_id=request.user.pk)
+            if hasattr(items, 'owned_by'):
+                # Хранилище с индексом по владельцу
+                return items.owned_by(request.user.pk)
+            return [obj for obj in items if self._is_owner(request.user, obj)]
+
+        return self._empty(items)
+
+    def has_full_access(self, request):
+        """Разрешено ли действие над всеми объектами ресурса, а не только своими (*_all)"""
+        if not request.user or not request.user.is_authenticated:
+            return False
+        if self.action not in ACTION_BITS:
+            return False
+        mask = self._get_mask(request)
+        return bool(mask and mask & ACTION_BITS[self.action][1])
+
+    @staticmethod
+    def _empty(items):
+        return items.none() if isinstance(items, QuerySet) else []
+
+    def _get_mask(self, request):
+        """Маска прав пользователя на ресурс из контекста запроса (None - правил нет)"""
+        return get_permission_context(request).mask_for(self.resource_name)
+
+    def _check_create_permission(self, request):
         """Проверка права на создание"""
-        user_roles = UserRole.objects.filter(user=user).values_list('role_id', flat=True)
-        return AccessRule.objects.filter(
-            role_id__in=user_roles,
-            resource__name=self.resource_name,
-            can_create=True
-        ).exists()
-
-    def _check_read_permission(self, user):
+        mask = self._get_mask(request)
+        return bool(mask and mask & CREATE)
+
+    def _check_read_permission(self, request):
         """Базовая проверка права на чтение"""
-        user_roles = UserRole.objects.filter(user=user).values_list('role_id', flat=True)
-        return AccessRule.objects.filter(
-            role_id__in=user_roles,
-            resource__name=self.resource_name,
-            can_read__in=[True, False]  # Любое read permission
-        ).exists()
+        # Любое правило на ресурс (как и раньше, флаги read здесь не важны)
+        return self._get_mask(request) is not None
 
     def _is_owner(self, user, obj):
         """Проверка, является ли пользователь владельцем объекта"""
@@ -132,6 +163,10 @@ class ResourceAccessPermission(permissions.BasePermission):
         # print(f"User: {user.email}")
         # print(f"Object type: {type(obj)}")
 
+        # Быстрый путь: у объекта есть id владельца (mock-объекты, ForeignKey в моделях)
+        if hasattr(obj, 'owner_id'):
+            return obj.owner_id == user.pk
+
         # Проверяем разные возможные поля для владельца
         if hasattr(obj, 'owner'):
             owner = obj.owner
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Role, BusinessResource, AccessRule, UserRole
+from .access_matrix import invalidate_access_matrix
+
+
+@receiver([post_save, post_delete], sender=Role)
+@receiver([post_save, post_delete], sender=BusinessResource)
+@receiver([post_save, post_delete], sender=AccessRule)
+@receiver([post_save, post_delete], sender=UserRole)
+def reset_access_matrix(sender, **kwargs):
+    """Любое изменение ролей, ресурсов или правил сбрасывает матрицу прав"""
+    invalidate_access_matrix()
@@ -14,6 +14,7 @@ from .serializers import (
     UserRoleSerializer
 )
 from django.contrib.auth import get_user_model
+from authentication.tokens import full_user
 
 User = get_user_model()
 
@@ -125,7 +126,8 @@ class UserRoleViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, IsAdminPermission]
 
     def perform_create(self, serializer):
-        serializer.save(assigned_by=self.request.user)
+        # ForeignKey принимает только модель User (не ClaimsUser)
+        serializer.save(assigned_by=full_user(self.request.user))
 
     @action(detail=False, methods=['get'])
     def user_roles(self, request):
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# login/register - async-версии (bcrypt в пуле потоков, не в event loop), см. AUTH_ASYNC_VIEWS
+os.environ.setdefault('AUTH_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -130,7 +130,12 @@ AUTH_USER_MODEL = 'authentication.User'
 # DRF settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
+        # Пользователь читается из БД на каждый запрос: деактивация действует сразу
         'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # По желанию, без запроса пользователя на каждый запрос (профиль всё равно проверяет БД):
+        # 'authentication.tokens.ClaimsJWTAuthentication' - пользователь и роли из claims токена,
+        #     деактивация вступает в силу по истечении access-токена (ACCESS_TOKEN_LIFETIME);
+        # 'authentication.tokens.CachedJWTAuthentication' - модель User из кеша процесса (AUTH_USER_CACHE_*)
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',  # По умолчанию требуем авторизацию
@@ -155,3 +160,78 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
 }
+
+# Хеширование паролей (authentication.hashers)
+# Первый хешер в AUTH_PASSWORD_HASHERS хеширует новые пароли, остальные проверяют старые хеши
+# (алгоритм определяется по формату хеша). Хеши другим алгоритмом или с другими параметрами
+# пересчитываются основным хешером при успешном входе. Сравнить хешеры: benchmarks/bench_hashers.py
+AUTH_PASSWORD_HASHERS = [
+    'authentication.hashers.BcryptHasher',
+    'authentication.hashers.ScryptHasher',
+    'authentication.hashers.PBKDF2Hasher',
+]
+# Стоимость bcrypt (подобрать под железо: python manage.py calibrate_bcrypt)
+AUTH_BCRYPT_ROUNDS = 12
+# scrypt: n - стоимость по CPU и памяти, r - размер блока, p - параллелизм; память = 128 * n * r байт (16 МБ)
+AUTH_SCRYPT_N = 2 ** 14
+AUTH_SCRYPT_R = 8
+AUTH_SCRYPT_P = 1
+# PBKDF2-HMAC-SHA256: число итераций
+AUTH_PBKDF2_ITERATIONS = 600_000
+
+# AUTH_ASYNC_VIEWS - async-версии login/register (включается в config/asgi.py): хеши паролей считаются
+# в пуле из AUTH_HASH_WORKERS потоков, ещё AUTH_HASH_QUEUE_SIZE запросов могут ждать свободный поток,
+# остальные сразу получают 503 вместо очереди, которая занимает весь сервер
+AUTH_ASYNC_VIEWS = os.environ.get('AUTH_ASYNC_VIEWS') == '1'
+AUTH_HASH_WORKERS = min(4, os.cpu_count() or 1)
+AUTH_HASH_QUEUE_SIZE = 16
+
+# Лимиты login/register (authentication.throttling) - проверяются до поиска пользователя и хеширования пароля
+# Формат '<число>/<s|min|hour|day>'; scope без лимита не проверяется. Превышение - 429 с Retry-After
+AUTH_THROTTLE_RATES = {
+    'login_ip': '30/min',  # попыток входа с одного IP
+    'login_email': '10/min',  # попыток входа в один аккаунт (с любых IP)
+    'register_ip': '10/hour',
+}
+# None - счётчики в памяти процесса (у каждого воркера свои);
+# алиас из CACHES (Redis/Memcached) - общие для всех воркеров
+AUTH_THROTTLE_CACHE = None
+# Сколько прокси стоит перед приложением: IP клиента берётся из X-Forwarded-For
+AUTH_THROTTLE_NUM_PROXIES = 0
+
+# Кеш пользователей для CachedJWTAuthentication (authentication.user_cache): LRU на AUTH_USER_CACHE_SIZE
+# записей, каждая живёт AUTH_USER_CACHE_TTL сек. Сохранение, меняющее is_active/email/права, увеличивает
+# версию в общем кеше, воркеры сверяют её раз в AUTH_USER_CACHE_CHECK_INTERVAL сек - за это время
+# деактивация доходит до всех
+# (нужен общий CACHES backend; с локальным кешем чужие воркеры ждут истечения TTL)
+AUTH_USER_CACHE_SIZE = 10_000
+AUTH_USER_CACHE_TTL = 60
+AUTH_USER_CACHE_CHECK_INTERVAL = 1.0
+
+# Матрица прав (authorization.access_matrix)
+# Как часто (сек) сверять версию матрицы с версией в БД (AccessMatrixVersion, общая для всех воркеров)
+ACCESS_MATRIX_CHECK_INTERVAL = 1.0
+# Сколько пользователей помнить в кеше ролей матрицы; сверх этого забываются давно не использованные
+ACCESS_MATRIX_MAX_USERS = 10_000
+
+# Хранилище mock_business:
+# 'memory' - в памяти процесса (по умолчанию): инкрементальные агрегаты заказов и индекс поиска по названию
+# 'sqlite' - общий файл SQLite в режиме WAL, видимый всем воркерам на узле
+# 'orm' - модели Product/Order в основной БД; /orders/stats/ здесь - GROUP BY по заказам,
+#         а ?q= - LIKE '%...%' без индекса: оба запроса растут с объёмом таблицы
+MOCK_STORE_BACKEND = 'memory'
+MOCK_STORE_SQLITE_PATH = BASE_DIR / 'mock_store.sqlite3'
+
+# Сохранение in-memory хранилища на диск: снимок + журнал операций в этой папке (None - не сохранять)
+MOCK_STORE_PERSIST_DIR = None
+MOCK_STORE_SNAPSHOT_EVERY = 100_000  # операций в журнале до записи нового снимка
+MOCK_STORE_FSYNC = False  # fsync после каждой операции (надёжнее, но медленнее)
+
+# Заказы удалённого товара: 'cancel' - отменить незавершённые, 'delete' - удалить
+MOCK_ORDERS_ON_PRODUCT_DELETE = 'cancel'
+
+# Номер воркера в ID mock-объектов (0-1023); None - свободный номер на узле: каждый процесс держит
+# файловую блокировку worker-<номер>.lock в MOCK_ID_LOCK_DIR (None - подкаталог во временной папке).
+# При нескольких узлах с общим хранилищем задайте каждому воркеру свой номер, иначе ID могут совпасть
+MOCK_ID_WORKER_ID = None
+MOCK_ID_LOCK_DIR = None
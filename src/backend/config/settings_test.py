@@ -0,0 +1,11 @@
+"""
+Настройки для тестов: как основные, mock-объекты явно в памяти процесса,
+а хеши паролей - с минимальной стоимостью (тестам нужна скорость, а не стойкость хешей)
+"""
+
+from .settings import *  # noqa: F401,F403
+
+MOCK_STORE_BACKEND = 'memory'
+AUTH_BCRYPT_ROUNDS = 4
+AUTH_SCRYPT_N = 2 ** 10
+AUTH_PBKDF2_ITERATIONS = 1000
@@ -1,3 +1,49 @@
 from django.contrib import admin
+from .models import Product, Order, StoreVersion, release_product_orders
+
+
+class StoreVersionAdmin(admin.ModelAdmin):
+    """Правки через админку идут мимо хранилища - счётчик записей (ETag списков) увеличиваем сами"""
+
+    def _bump(self):
+        StoreVersion.bump(self.model._meta.db_table)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self._bump()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self._bump()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        self._bump()
+
 
 # Register your models here.
+@admin.register(Product)
+class ProductAdmin(StoreVersionAdmin):
+    list_display = ('id', 'name', 'price', 'owner', 'created_at')
+    search_fields = ('name', 'owner__email')
+    list_select_related = ('owner',)
+
+    # Заказы удалённого товара - как при DELETE через API (FK без ограничения, каскада в БД нет)
+    def delete_model(self, request, obj):
+        product_id = obj.pk  # после delete() pk объекта - None
+        super().delete_model(request, obj)
+        release_product_orders(product_id)
+
+    def delete_queryset(self, request, queryset):
+        product_ids = list(queryset.values_list('pk', flat=True))
+        super().delete_queryset(request, queryset)
+        for product_id in product_ids:
+            release_product_orders(product_id)
+
+
+@admin.register(Order)
+class OrderAdmin(StoreVersionAdmin):
+    list_display = ('id', 'product_id', 'quantity', 'status', 'owner', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('id', 'product_id', 'owner__email')
+    list_select_related = ('owner',)
@@ -0,0 +1,65 @@
+import threading
+
+
+class GroupAggregates:
+    """
+    Агрегаты по группам, которые поддерживаются при каждой записи в хранилище
+    (без пересчёта по всем объектам)
+
+    Для каждого поля из group_fields (например, product_id, owner_id) и значения этого поля
+    хранится число объектов и сумма sum_field (quantity) в разбивке по split_field (status).
+    Изменение объекта = вычитание старой версии + добавление новой,
+    поэтому смена статуса переносит заказ из одной корзины в другую за O(число групп).
+    """
+
+    def __init__(self, group_fields, split_field='status', sum_field='quantity'):
+        self.group_fields = tuple(group_fields)
+        self.split_field = split_field
+        self.sum_field = sum_field
+        self._groups = {field: {} for field in self.group_fields}  # {поле: {значение: {статус: [count, sum]}}}
+        self.lock = threading.Lock()
+
+    def add(self, item):
+        self._apply(item, 1)
+
+    def remove(self, item):
+        self._apply(item, -1)
+
+    def clear(self):
+        with self.lock:
+            for groups in self._groups.values():
+                groups.clear()
+
+    def _apply(self, item, sign):
+        split = getattr(item, self.split_field)
+        amount = getattr(item, self.sum_field)
+        with self.lock:
+            for field in self.group_fields:
+                groups = self._groups[field]
+                value = getattr(item, field)
+                buckets = groups.setdefault(value, {})
+                bucket = buckets.setdefault(split, [0, 0])
+                bucket[0] += sign
+                bucket[1] += sign * amount
+                if bucket[0] == 0:
+                    del buckets[split]
+                    if not buckets:
+                        del groups[value]
+
+    def get(self, field, value):
+        """Агрегаты одной группы: O(число статусов)"""
+        if field not in self._groups:
+            raise ValueError(f"Нет агрегатов по полю: {field}")
+        with self.lock:
+            buckets = self._groups[field].get(value, {})
+            rows = [(split, count, total) for split, (count, total) in buckets.items()]
+        return self.summary(rows)
+
+    def summary(self, rows):
+        """[(статус, count, sum)] -> ответ API: итог и разбивка по статусам"""
+        by_split = {split: {'count': count, self.sum_field: total} for split, count, total in rows}
+        return {
+            'count': sum(bucket['count'] for bucket in by_split.values()),
+            self.sum_field: sum(bucket[self.sum_field] for bucket in by_split.values()),
+            f'by_{self.split_field}': by_split,
+        }
@@ -0,0 +1,149 @@
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Раскладка 64-битного ID (как у Snowflake): | 41 бит - мс от EPOCH_MS | 10 бит - воркер | 12 бит - счётчик |
+EPOCH_MS = 1_704_067_200_000  # 2024-01-01 UTC
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+# Base32 Крокфорда: порядок символов совпадает с порядком значений
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+ID_LENGTH = 13  # 64 бита = 13 символов по 5 бит
+
+
+def encode_id(value):
+    """Число -> строка фиксированной длины (строки сортируются так же, как числа)"""
+    chars = []
+    for _ in range(ID_LENGTH):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def decode_id(text):
+    value = 0
+    for char in text:
+        value = value * 32 + ALPHABET.index(char)
+    return value
+
+
+def id_timestamp_ms(item_id):
+    """Время выдачи ID (мс от epoch, UTC)"""
+    return (decode_id(item_id) >> (WORKER_BITS + SEQUENCE_BITS)) + EPOCH_MS
+
+
+def check_worker_id(worker_id):
+    """Явно заданный номер воркера должен помещаться в WORKER_BITS - обрезка по маске дала бы совпадения"""
+    if not isinstance(worker_id, int) or not 0 <= worker_id <= MAX_WORKER_ID:
+        raise ImproperlyConfigured(
+            f'MOCK_ID_WORKER_ID должен быть целым от 0 до {MAX_WORKER_ID}, получено {worker_id!r}'
+        )
+    return worker_id
+
+
+def _try_lock(file):
+    """Неблокирующая эксклюзивная блокировка файла (OSError - занят другим процессом)"""
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+
+
+def claim_worker_slot(directory):
+    """
+    Свободный номер воркера на узле: файл <directory>/worker-<номер>.lock под блокировкой
+    Блокировку держит открытый файл, ОС снимает её при завершении процесса (в том числе аварийном),
+    поэтому номер не нужно освобождать и два живых процесса не получат один номер.
+    Возвращает (номер, файл) - файл нужно держать открытым
+    """
+    os.makedirs(directory, exist_ok=True)
+    slots = MAX_WORKER_ID + 1
+    start = os.getpid() % slots  # разные стартовые точки - меньше попыток на занятых файлах
+    for i in range(slots):
+        slot = (start + i) % slots
+        file = open(os.path.join(directory, f'worker-{slot}.lock'), 'a+b')
+        try:
+            _try_lock(file)
+        except OSError:
+            file.close()
+            continue
+        return slot, file
+    raise ImproperlyConfigured(f'Все {slots} номеров воркеров в {directory} заняты')
+
+
+class IdAllocator:
+    """
+    Генератор коротких уникальных ID, упорядоченных по времени выдачи
+    - в пределах процесса ID строго возрастают (при переводе часов назад время "держится"
+      на последнем значении, при исчерпании счётчика берётся следующая миллисекунда)
+    - разные воркеры различаются номером: MOCK_ID_WORKER_ID или свободный номер узла,
+      занятый файловой блокировкой в MOCK_ID_LOCK_DIR (на нескольких узлах номера нужно задать явно)
+    """
+
+    def __init__(self, worker_id=None):
+        self._worker_id = None if worker_id is None else check_worker_id(worker_id)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._worker = 0
+        self._slot_file = None
+        self._last_ms = 0
+        self._sequence = 0
+
+    def _current_worker(self):
+        if self._worker_id is not None:
+            return self._worker_id
+        worker_id = getattr(settings, 'MOCK_ID_WORKER_ID', None)
+        if worker_id is not None:
+            return check_worker_id(worker_id)
+        if self._slot_file is not None:
+            # Файл унаследован от родителя при fork: его номер остаётся за родителем
+            self._slot_file.close()
+        directory = getattr(settings, 'MOCK_ID_LOCK_DIR', None) or os.path.join(
+            tempfile.gettempdir(), 'mock-id-workers'
+        )
+        worker_id, self._slot_file = claim_worker_slot(directory)
+        return worker_id
+
+    def next_value(self):
+        with self._lock:
+            # После fork у воркера другой pid (и номер), а счётчик начинается заново
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._worker = self._current_worker()
+                self._sequence = 0
+
+            now_ms = max(time.time_ns() // 1_000_000 - EPOCH_MS, self._last_ms)
+            if now_ms == self._last_ms:
+                self._sequence += 1
+                if self._sequence > MAX_SEQUENCE:
+                    now_ms += 1  # счётчик миллисекунды исчерпан - занимаем следующую
+                    self._sequence = 0
+            else:
+                self._sequence = 0
+            self._last_ms = now_ms
+
+            return (now_ms << (WORKER_BITS + SEQUENCE_BITS)) | (self._worker << SEQUENCE_BITS) | self._sequence
+
+    def next_id(self):
+        return encode_id(self.next_value())
+
+
+_allocator = IdAllocator()
+
+
+def new_id():
+    """Новый ID mock-объекта"""
+    return _allocator.next_id()
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:32
+
+import django.db.models.deletion
+import django.utils.timezone
+import mock_business.ids
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.CharField(default=mock_business.ids.new_id, editable=False, max_length=13, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Создан')),
+                ('version', models.PositiveIntegerField(default=1, verbose_name='Версия')),
+                ('name', models.CharField(max_length=255, verbose_name='Название')),
+                ('price', models.FloatField(verbose_name='Цена')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(class)ss', to=settings.AUTH_USER_MODEL, verbose_name='Владелец')),
+            ],
+            options={
+                'verbose_name': 'Товар',
+                'verbose_name_plural': 'Товары',
+                'db_table': 'products',
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.CharField(default=mock_business.ids.new_id, editable=False, max_length=13, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Создан')),
+                ('version', models.PositiveIntegerField(default=1, verbose_name='Версия')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('completed', 'Выполнен'), ('cancelled', 'Отменён')], default='pending', max_length=20, verbose_name='Статус')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='%(class)ss', to=settings.AUTH_USER_MODEL, verbose_name='Владелец')),
+                ('product', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='orders', to='mock_business.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Заказ',
+                'verbose_name_plural': 'Заказы',
+                'db_table': 'orders',
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['created_at', 'id'], name='product_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['owner', 'created_at', 'id'], name='product_owner_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at', 'id'], name='order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['owner', 'created_at', 'id'], name='order_owner_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['product', 'created_at', 'id'], name='order_product_created_idx'),
+        ),
+    ]
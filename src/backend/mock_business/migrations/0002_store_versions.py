@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mock_business', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoreVersion',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Таблица')),
+                ('version', models.BigIntegerField(default=0, verbose_name='Версия')),
+            ],
+            options={
+                'verbose_name': 'Версия хранилища',
+                'verbose_name_plural': 'Версии хранилищ',
+                'db_table': 'mock_store_versions',
+            },
+        ),
+    ]
@@ -1,18 +1,75 @@
-import uuid
-from datetime import datetime
+import sys
+from collections import namedtuple
 
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
 
-class MockProduct:
+from .aggregates import GroupAggregates
+from .ids import new_id
+from .orm_store import MockQuerySet
+from .serialization import encode_json
+from .store import MockStore, VersionConflict, datetime_to_ts, now_ts, ts_to_datetime, ts_to_isoformat
+
+# Лёгкая ссылка на владельца вместо целого объекта User
+MockOwner = namedtuple('MockOwner', ['pk', 'email'])
+
+
+class OwnedMixin:
+    """
+    Общие поля mock-объектов: владелец хранится как id + email, время создания - как int
+    (без __dict__, ссылки на User и объекта datetime на каждый экземпляр)
+
+    Готовый JSON объекта кешируется в _json (не входит в __slots__ класса, поэтому не попадает
+    в снимки/журнал). Объекты в хранилище не меняются на месте: update() кладёт копию,
+    а копия создаётся без кеша - так кеш сбрасывается ровно при изменении объекта.
+    """
+    __slots__ = ('_json',)
+
+    def to_json(self):
+        """JSON объекта (bytes), сериализуется один раз до следующего изменения"""
+        try:
+            return self._json
+        except AttributeError:
+            self._json = encode_json(self.to_dict())
+            return self._json
+
+    def __copy__(self):
+        clone = type(self).__new__(type(self))
+        for name in type(self).__slots__:
+            if hasattr(self, name):
+                setattr(clone, name, getattr(self, name))
+        return clone
+
+    @property
+    def owner(self):
+        return MockOwner(self.owner_id, self.owner_email)
+
+    @owner.setter
+    def owner(self, user):
+        self.owner_id = user.pk
+        self.owner_email = sys.intern(user.email)  # один объект строки на владельца
+
+    @property
+    def created_at(self):
+        return ts_to_datetime(self.created_ts)
+
+
+class MockProduct(OwnedMixin):
     """
     Мок-модель товара
     """
+    __slots__ = ('id', 'name', 'price', 'owner_id', 'owner_email', 'created_ts', 'version')
 
     def __init__(self, name, price, owner):
-        self.id = str(uuid.uuid4())[:8]  # Короткий ID для удобства
+        self.id = new_id()  # Короткий ID, упорядоченный по времени создания
         self.name = name
         self.price = float(price)
-        self.owner = owner  # Объект User
-        self.created_at = datetime.now()
+        self.owner = owner  # Объект User (сохраняем только id и email)
+        self.created_ts = now_ts()
+        self.version = 1  # Растёт при каждом изменении (для If-Match)
 
     def to_dict(self):
         """Преобразование в словарь для JSON ответа"""
@@ -20,26 +77,28 @@ class MockProduct:
             'id': self.id,
             'name': self.name,
             'price': self.price,
-            'owner': self.owner.email,
-            'created_at': self.created_at.isoformat()
+            'owner': self.owner_email,
+            'created_at': ts_to_isoformat(self.created_ts)
         }
 
     def __str__(self):
-        return f"{self.name} (owner: {self.owner.email})"  # Для отладки
+        return f"{self.name} (owner: {self.owner_email})"  # Для отладки
 
 
-class MockOrder:
+class MockOrder(OwnedMixin):
     """
     Мок-модель заказа
     """
+    __slots__ = ('id', 'product_id', 'quantity', 'owner_id', 'owner_email', 'status', 'created_ts', 'version')
 
     def __init__(self, product_id, quantity, owner):
-        self.id = str(uuid.uuid4())[:8]
+        self.id = new_id()
         self.product_id = product_id
         self.quantity = quantity
         self.owner = owner
         self.status = 'pending'  # pending, completed, cancelled
-        self.created_at = datetime.now()
+        self.created_ts = now_ts()
+        self.version = 1
 
     def to_dict(self):
         return {
@@ -47,11 +106,222 @@ class MockOrder:
             'product_id': self.product_id,
             'quantity': self.quantity,
             'status': self.status,
-            'owner': self.owner.email,
-            'created_at': self.created_at.isoformat()
+            'owner': self.owner_email,
+            'created_at': ts_to_isoformat(self.created_ts)
         }
 
 
-# Хранилище
-products_db = {}  # {product_id: MockProduct}
-orders_db = {}  # {order_id: MockOrder}
+class OwnedModel(models.Model):
+    """
+    Общие поля ORM-моделей mock-объектов (MOCK_STORE_BACKEND = 'orm')
+    Тот же интерфейс, что у MockProduct/MockOrder: id, owner_id, owner_email, created_ts, version, to_dict()
+    """
+    id = models.CharField(primary_key=True, max_length=13, default=new_id, editable=False, verbose_name='ID')
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='%(class)ss', verbose_name='Владелец'
+    )
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='Создан')
+    version = models.PositiveIntegerField(default=1, verbose_name='Версия')  # для If-Match
+
+    objects = MockQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+        indexes = [
+            # Keyset-пагинация по (created_at, id): все объекты и "только свои"
+            models.Index(fields=['created_at', 'id'], name='%(class)s_created_idx'),
+            models.Index(fields=['owner', 'created_at', 'id'], name='%(class)s_owner_created_idx'),
+        ]
+
+    @property
+    def owner_email(self):
+        return self.owner.email
+
+    @property
+    def created_ts(self):
+        return datetime_to_ts(self.created_at)
+
+    def to_json(self):
+        # Строки модели читаются из БД заново на каждый запрос - кешировать нечего
+        return encode_json(self.to_dict())
+
+
+class Product(OwnedModel):
+    """
+    Товар в БД
+    """
+    name = models.CharField(max_length=255, verbose_name='Название')
+    price = models.FloatField(verbose_name='Цена')
+
+    class Meta(OwnedModel.Meta):
+        db_table = 'products'
+        verbose_name = 'Товар'
+        verbose_name_plural = 'Товары'
+        indexes = OwnedModel.Meta.indexes + [
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+        ]
+
+    to_dict = MockProduct.to_dict
+
+    def __str__(self):
+        return self.name
+
+
+class Order(OwnedModel):
+    """
+    Заказ в БД
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает'),
+        ('completed', 'Выполнен'),
+        ('cancelled', 'Отменён'),
+    ]
+
+    # Заказы удалённого товара обрабатывает release_product_orders (отмена или удаление),
+    # у отменённых product_id остаётся для истории - поэтому без ограничения FK в БД
+    product = models.ForeignKey(
+        Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name='orders', verbose_name='Товар'
+    )
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='Статус')
+
+    class Meta(OwnedModel.Meta):
+        db_table = 'orders'
+        verbose_name = 'Заказ'
+        verbose_name_plural = 'Заказы'
+        indexes = OwnedModel.Meta.indexes + [
+            models.Index(fields=['product', 'created_at', 'id'], name='order_product_created_idx'),
+        ]
+
+    to_dict = MockOrder.to_dict
+
+    def __str__(self):
+        return f"{self.id}: {self.product_id} x {self.quantity}"
+
+
+class StoreVersion(models.Model):
+    """
+    Счётчик записей ORM-хранилища (по таблице модели): меняется в транзакции каждой записи,
+    общий для всех воркеров. По нему считаются ETag списков без выборки самих объектов
+    """
+    name = models.CharField(primary_key=True, max_length=64, verbose_name='Таблица')
+    version = models.BigIntegerField(default=0, verbose_name='Версия')
+
+    class Meta:
+        db_table = 'mock_store_versions'
+        verbose_name = 'Версия хранилища'
+        verbose_name_plural = 'Версии хранилищ'
+
+    @classmethod
+    def bump(cls, name):
+        """Увеличить счётчик (строка создаётся при первой записи)"""
+        counter = cls.objects.filter(name=name)
+        if counter.update(version=F('version') + 1):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(name=name, version=1)
+        except IntegrityError:
+            counter.update(version=F('version') + 1)  # строку успел создать другой воркер
+
+    @classmethod
+    def current(cls, name):
+        return cls.objects.filter(name=name).values_list('version', flat=True).first() or 0
+
+
+def create_store(table, item_class, model=None, orderings=(), search_fields=(), lookups=(), aggregates=None):
+    """
+    Хранилище по настройке MOCK_STORE_BACKEND
+    'memory' - в памяти процесса (по умолчанию; с MOCK_STORE_PERSIST_DIR - со снимком и журналом на диске),
+    'sqlite' - общий для воркеров файл SQLite (WAL)
+    'orm' - модели Django (Product, Order) в основной БД: индексы и фильтр по правам - в SQL,
+            но агрегаты считаются GROUP BY, а поиск - LIKE без индекса
+    orderings - поля с отсортированным индексом для диапазонных запросов и сортировки
+    search_fields - текстовые поля с поиском по префиксу/подстроке (?q=)
+    lookups - поля с индексом значение -> объекты (filter_by)
+    aggregates - GroupAggregates: счётчики по группам, обновляемые при каждой записи
+    """
+    backend = getattr(settings, 'MOCK_STORE_BACKEND', 'memory')
+    if backend == 'memory':
+        store = MockStore(
+            orderings=orderings, search_fields=search_fields, lookups=lookups, aggregates=aggregates
+        )
+        persist_dir = getattr(settings, 'MOCK_STORE_PERSIST_DIR', None)
+        if persist_dir:
+            # Снимок + журнал операций: состояние переживает перезапуск процесса
+            from .persistence import StoreJournal
+            journal = StoreJournal(
+                persist_dir, table, item_class,
+                snapshot_every=getattr(settings, 'MOCK_STORE_SNAPSHOT_EVERY', 100_000),
+                fsync=getattr(settings, 'MOCK_STORE_FSYNC', False)
+            )
+            journal.attach(store)
+        return store
+    if backend == 'sqlite':
+        from .sqlite_store import SQLiteStore
+        return SQLiteStore(
+            settings.MOCK_STORE_SQLITE_PATH, table, item_class,
+            orderings=orderings, search_fields=search_fields, lookups=lookups, aggregates=aggregates
+        )
+    if backend == 'orm':
+        # Индексы заданы в Meta модели, orderings/search_fields/lookups - поля этой модели
+        from .orm_store import ORMStore
+        return ORMStore(model, StoreVersion, aggregates=aggregates)
+    raise ImproperlyConfigured(f"Неизвестный MOCK_STORE_BACKEND: {backend}")
+
+
+# Хранилище (словарный интерфейс + индексы по владельцу, времени создания, цене и названию товара)
+products_db = create_store(
+    'mock_products', MockProduct, model=Product, orderings=('price',), search_fields=('name',)
+)  # {product_id: MockProduct}
+orders_db = create_store(
+    'mock_orders', MockOrder, model=Order,
+    lookups=('product_id',),
+    aggregates=GroupAggregates(('product_id', 'owner_id'), split_field='status', sum_field='quantity')
+)  # {order_id: MockOrder}
+
+
+def release_product_orders(product_id):
+    """
+    Заказы удалённого товара (через индекс product_id, без перебора orders_db)
+    MOCK_ORDERS_ON_PRODUCT_DELETE: 'cancel' - незавершённые заказы отменяются (по умолчанию),
+    'delete' - заказы удаляются
+    Возвращает число затронутых заказов
+    """
+    mode = getattr(settings, 'MOCK_ORDERS_ON_PRODUCT_DELETE', 'cancel')
+    if mode not in ('cancel', 'delete'):
+        raise ImproperlyConfigured(f"Неизвестный MOCK_ORDERS_ON_PRODUCT_DELETE: {mode}")
+
+    affected = 0
+    for order in list(orders_db.filter_by('product_id', product_id)):
+        try:
+            if mode == 'delete':
+                orders_db.delete(order.id)
+            elif order.status == 'pending':
+                orders_db.update(order.id, expected_version=order.version, status='cancelled')
+            else:
+                continue
+        except (KeyError, VersionConflict):
+            continue  # заказ уже удалён или изменён параллельным запросом
+        affected += 1
+    return affected
+
+
+def add_orders(orders):
+    """
+    Добавить заказы, не разминувшись с удалением их товаров
+    Заказы пишутся до повторной проверки товара, а удаление товара ищет его заказы уже после
+    удаления (release_product_orders): при любом порядке заказ на удалённый товар либо найдёт
+    release_product_orders, либо здесь будет видно, что товара нет - тогда заказы убираются
+    Возвращает (добавленные заказы, id пропавших товаров); если товар пропал, не добавлено ничего
+    """
+    orders = orders_db.add_many(orders)
+    missing = {order.product_id for order in orders if order.product_id not in products_db}
+    if not missing:
+        return orders, missing
+    for order in orders:
+        try:
+            orders_db.delete(order.id)
+        except KeyError:
+            pass  # уже удалён release_product_orders
+    return [], missing
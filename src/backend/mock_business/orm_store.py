@@ -0,0 +1,244 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models, transaction
+from django.db.models import Count, F, Q, Sum
+
+from .search import NGRAM_SIZE, normalize
+from .store import DEFAULT_ORDERING, VersionConflict, ts_to_datetime
+
+
+class MockQuerySet(models.QuerySet):
+    """
+    QuerySet моделей Product/Order с интерфейсом StoreView (page, ordered_by, owned_by, search, filter_by)
+    Все сужения - условия в SQL: ResourceAccessPermission.filter_visible добавляет filter(owner=...),
+    страница выбирается keyset-условием по индексу (поле сортировки, id)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ordering = DEFAULT_ORDERING  # 'created' или имя поля модели (например, price)
+
+    def _clone(self):
+        clone = super()._clone()
+        clone.ordering = self.ordering
+        return clone
+
+    def _check_field(self, name):
+        try:
+            self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise ValueError(f"Нет поля {name} у {self.model.__name__}")
+
+    @property
+    def _column(self):
+        return 'created_at' if self.ordering == DEFAULT_ORDERING else self.ordering
+
+    def _db_value(self, value):
+        """Значение ключа сортировки (как в курсоре) -> значение колонки"""
+        return ts_to_datetime(value) if self.ordering == DEFAULT_ORDERING else value
+
+    def _key(self, item):
+        if self.ordering == DEFAULT_ORDERING:
+            return (item.created_ts, item.id)
+        return (getattr(item, self.ordering), item.id)
+
+    def owned_by(self, owner_id):
+        """Сужение до объектов одного владельца (индекс owner, created_at, id)"""
+        return self.filter(owner_id=owner_id)
+
+    def ordered_by(self, ordering, lo=None, hi=None):
+        """Порядок по полю ordering с диапазоном значений [lo, hi]"""
+        if ordering != DEFAULT_ORDERING:
+            self._check_field(ordering)
+        qs = self._chain()
+        qs.ordering = ordering
+        if lo is not None:
+            qs = qs.filter(**{f'{qs._column}__gte': qs._db_value(lo)})
+        if hi is not None:
+            qs = qs.filter(**{f'{qs._column}__lte': qs._db_value(hi)})
+        return qs
+
+    def filter_by(self, field, value):
+        """Сужение до объектов с field == value"""
+        self._check_field(field.removesuffix('_id'))
+        return self.filter(**{field: value})
+
+    def search(self, field, query):
+        """Поиск по полю с семантикой TextIndex: короткое слово - префикс слова, длинное - подстрока"""
+        self._check_field(field)
+        words = normalize(query).split()
+        if not words:
+            return self.none()
+        qs = self
+        for word in words:
+            if len(word) < NGRAM_SIZE:
+                condition = Q(**{f'{field}__istartswith': word}) | Q(**{f'{field}__icontains': ' ' + word})
+            else:
+                condition = Q(**{f'{field}__icontains': word})
+            qs = qs.filter(condition)
+        return qs
+
+    def page(self, after=None, limit=100):
+        """Страница объектов после ключа after (см. StoreView.page)"""
+        column = self._column
+        qs = self.select_related('owner').order_by(column, 'id')
+        if after is not None:
+            value, item_id = after
+            value = self._db_value(value)
+            qs = qs.filter(Q(**{f'{column}__gt': value}) | Q(**{column: value, 'id__gt': item_id}))
+        rows = list(qs[:limit + 1])
+        items = rows[:limit]
+        next_key = self._key(items[-1]) if len(rows) > limit else None
+        return items, next_key
+
+
+class ORMStore:
+    """
+    Хранилище mock-объектов в основной БД через модели Django (Product, Order)
+    Интерфейс тот же, что у MockStore; values() - MockQuerySet, поэтому права и выборки уходят в SQL.
+    На запись принимает MockProduct/MockOrder (как и остальные хранилища) и переводит их в строки модели;
+    compare-and-swap по версии - одним UPDATE ... WHERE version = ?
+    Счётчик записей (version, для ETag списков) ведёт модель versions (StoreVersion) в той же транзакции
+    """
+
+    def __init__(self, model, versions, aggregates=None):
+        self.model = model
+        self.versions = versions
+        self.aggregates = aggregates  # GroupAggregates - только описание групп, считает SQL
+
+    @property
+    def version(self):
+        """Счётчик записей: меняется при любом изменении таблицы через хранилище"""
+        return self.versions.current(self.model._meta.db_table)
+
+    def _bump(self):
+        self.versions.bump(self.model._meta.db_table)
+
+    def _queryset(self):
+        return self.model.objects.select_related('owner')
+
+    def _to_model(self, item):
+        fields = {
+            field.attname: getattr(item, field.attname)
+            for field in self.model._meta.concrete_fields
+            if field.attname != 'created_at'
+        }
+        return self.model(created_at=item.created_at, **fields)
+
+    # Словарный интерфейс
+    def __getitem__(self, item_id):
+        item = self.get(item_id)
+        if item is None:
+            raise KeyError(item_id)
+        return item
+
+    def __setitem__(self, item_id, item):
+        with transaction.atomic():
+            self._to_model(item).save()
+            self._bump()
+
+    def __delitem__(self, item_id):
+        self.delete(item_id)
+
+    def __contains__(self, item_id):
+        return self.model.objects.filter(pk=item_id).exists()
+
+    def __len__(self):
+        return self.model.objects.count()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, item_id, default=None):
+        item = self._queryset().filter(pk=item_id).first()
+        return default if item is None else item
+
+    def pop(self, item_id, default=None):
+        try:
+            return self.delete(item_id)
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self.model.objects.values_list('pk', flat=True))
+
+    def values(self):
+        """Все объекты (MockQuerySet: сужения и страницы - запросами к БД)"""
+        return self._queryset()
+
+    def items(self):
+        return [(item.id, item) for item in self._queryset()]
+
+    def clear(self):
+        with transaction.atomic():
+            self.model.objects.all().delete()
+            self._bump()
+
+    # Операции
+    def add(self, item):
+        """Добавить объект"""
+        with transaction.atomic():
+            self._to_model(item).save(force_insert=True)
+            self._bump()
+        return item
+
+    def add_many(self, items):
+        """Добавить пачку объектов одним INSERT в транзакции"""
+        items = list(items)
+        with transaction.atomic():
+            self.model.objects.bulk_create([self._to_model(item) for item in items])
+            self._bump()
+        return items
+
+    def update(self, item_id, expected_version=None, **fields):
+        """Изменить поля объекта (compare-and-swap по версии, как в MockStore.update)"""
+        with transaction.atomic():
+            qs = self.model.objects.filter(pk=item_id)
+            if expected_version is not None:
+                qs = qs.filter(version=expected_version)
+            if not qs.update(version=F('version') + 1, **fields):
+                self._raise_missing(item_id, expected_version)
+            self._bump()
+        return self[item_id]
+
+    def delete(self, item_id, expected_version=None):
+        """Удалить объект (с проверкой версии, если она передана)"""
+        item = self[item_id]
+        qs = self.model.objects.filter(pk=item_id)
+        if expected_version is not None:
+            qs = qs.filter(version=expected_version)
+        with transaction.atomic():
+            deleted, _ = qs.delete()
+            if not deleted:
+                self._raise_missing(item_id, expected_version)
+            self._bump()
+        return item
+
+    def _raise_missing(self, item_id, expected_version):
+        current = self.model.objects.filter(pk=item_id).values_list('version', flat=True).first()
+        if current is None:
+            raise KeyError(item_id)
+        raise VersionConflict(item_id, expected_version, current)
+
+    def owned_by(self, owner_id):
+        return self.values().owned_by(owner_id)
+
+    def filter_by(self, field, value):
+        return self.values().filter_by(field, value)
+
+    def search(self, field, query):
+        return self.values().search(field, query)
+
+    def aggregate(self, field, value):
+        """Агрегаты группы field=value - GROUP BY по индексированному полю"""
+        spec = self.aggregates
+        if spec is None:
+            raise ValueError("Агрегаты для хранилища не настроены")
+        if field not in spec.group_fields:
+            raise ValueError(f"Нет агрегатов по полю: {field}")
+        rows = (
+            self.model.objects.filter(**{field: value})
+            .values(spec.split_field)
+            .annotate(count=Count('pk'), total=Sum(spec.sum_field))
+            .order_by()
+        )
+        return spec.summary([(row[spec.split_field], row['count'], row['total']) for row in rows])
@@ -0,0 +1,94 @@
+import base64
+import json
+
+from django.db.models import QuerySet
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.urls import replace_query_param
+
+from .store import DEFAULT_ORDERING, created_key
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def encode_cursor(key, ordering=DEFAULT_ORDERING):
+    """Ключ (значение, id) в порядке ordering -> непрозрачная строка для клиента"""
+    value = [ordering, *key] if ordering != DEFAULT_ORDERING else list(key)
+    raw = json.dumps(value, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, ordering=DEFAULT_ORDERING):
+    """
+    Непрозрачная строка -> ключ (значение, id)
+    Курсор от другой сортировки (например, ?ordering= сменили между страницами) не принимается
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value = json.loads(raw)
+        if not isinstance(value, list):
+            raise ValueError()
+        cursor_ordering = value.pop(0) if len(value) == 3 else DEFAULT_ORDERING
+        key, item_id = value
+        if cursor_ordering != ordering or not isinstance(item_id, str):
+            raise ValueError()
+        if isinstance(key, bool) or not isinstance(key, int if ordering == DEFAULT_ORDERING else (int, float)):
+            raise ValueError()
+    except (ValueError, TypeError):
+        raise ParseError("Некорректный cursor")
+    return key, item_id
+
+
+def get_limit(request):
+    """Размер страницы из ?limit= (по умолчанию DEFAULT_LIMIT, не больше MAX_LIMIT)"""
+    limit = request.query_params.get('limit')
+    if limit is None:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(limit)
+        if limit <= 0:
+            raise ValueError()
+    except ValueError:
+        raise ParseError("limit должен быть положительным числом")
+    return min(limit, MAX_LIMIT)
+
+
+def total_count(collection):
+    """Размер коллекции: для QuerySet - SELECT COUNT(*), без загрузки объектов"""
+    if isinstance(collection, QuerySet):
+        return collection.count()
+    return len(collection)
+
+
+def paginate(request, collection):
+    """
+    Keyset-пагинация по (created_at, id) или по (значение, id) индекса, выбранного в ordered_by()
+    collection - представление хранилища (StoreView) с методом page() или обычная последовательность
+    Возвращает (объекты страницы, ссылка на следующую страницу или None)
+    """
+    limit = get_limit(request)
+    ordering = getattr(collection, 'ordering', DEFAULT_ORDERING)
+    cursor = request.query_params.get('cursor')
+    after = decode_cursor(cursor, ordering) if cursor else None
+
+    if hasattr(collection, 'page'):
+        items, next_key = collection.page(after=after, limit=limit)
+    else:
+        items, next_key = _page_sequence(collection, after, limit)
+
+    next_url = None
+    if next_key is not None:
+        next_url = replace_query_param(
+            request.build_absolute_uri(), 'cursor', encode_cursor(next_key, ordering)
+        )
+    return items, next_url
+
+
+def _page_sequence(items, after, limit):
+    """Пагинация обычной последовательности (без индекса - сортируем на месте)"""
+    keyed = sorted((created_key(item), item) for item in items)
+    if after is not None:
+        keyed = [pair for pair in keyed if pair[0] > after]
+    chunk = keyed[:limit + 1]
+    next_key = chunk[limit - 1][0] if len(chunk) > limit else None
+    return [item for _, item in chunk[:limit]], next_key
@@ -0,0 +1,209 @@
+import io
+import mmap
+import os
+import pickle
+import struct
+import threading
+from pathlib import Path
+
+# Заголовок записи журнала: длина тела
+_FRAME = struct.Struct('<I')
+
+SNAPSHOT_FORMAT = 1
+
+
+class _DataUnpickler(pickle.Unpickler):
+    """Снимок и журнал содержат только примитивы - любые классы при загрузке запрещены"""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"Недопустимый объект в данных хранилища: {module}.{name}")
+
+
+def _loads(data):
+    return _DataUnpickler(io.BytesIO(data)).load()
+
+
+class StoreJournal:
+    """
+    Персистентность MockStore: компактный снимок + журнал операций (append-only)
+
+    - каждая запись в хранилище дописывает в журнал операцию put (полное состояние объекта)
+      или del; операции идемпотентны, повтор уже учтённых в снимке безопасен
+    - после snapshot_every операций журнал ротируется и в фоне пишется новый снимок
+    - при старте снимок читается через mmap, затем проигрывается только хвост журнала
+
+    Состояние объекта пишется кортежем значений в порядке полей (__slots__ класса),
+    имена полей лежат в заголовке снимка/журнала.
+    """
+
+    def __init__(self, directory, name, item_class, snapshot_every=100_000, fsync=False):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.snapshot_path = self.directory / f'{name}.snapshot'
+        self.log_path = self.directory / f'{name}.log'
+        self.old_log_path = self.directory / f'{name}.log.old'  # журнал на время компактизации
+
+        self.item_class = item_class
+        self.fields = tuple(item_class.__slots__)
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+
+        self.lock = threading.Lock()
+        self.store = None
+        self._log = None
+        self._records = 0
+        self._compacting = False
+
+    # Восстановление
+    def attach(self, store):
+        """Загрузить состояние в хранилище и начать журналировать его изменения"""
+        # Пока журнал не подключён, операции восстановления в него не пишутся
+        store.load_items(self._read_snapshot())
+        for path in (self.old_log_path, self.log_path):
+            self._replay(path, store)
+
+        self.store = store
+        self._log = self._open_log()
+        store.journal = self
+
+        # Прошлая компактизация не завершилась - доводим её сразу
+        if self.old_log_path.exists():
+            self.compact()
+        return store
+
+    def _read_snapshot(self):
+        if not self.snapshot_path.exists() or self.snapshot_path.stat().st_size == 0:
+            return []
+        with open(self.snapshot_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            reader = _DataUnpickler(mm)
+            header = reader.load()
+            if header.get('format') != SNAPSHOT_FORMAT:
+                raise ValueError(f"Неизвестный формат снимка: {header.get('format')}")
+            rows = reader.load()
+        return [self._from_row(header['fields'], row) for row in rows]
+
+    def _replay(self, path, store):
+        """Проигрывание журнала; оборванная последняя запись (сбой при записи) отрезается"""
+        if not path.exists():
+            return
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        fields, pos = self.fields, 0
+        while pos + _FRAME.size <= len(data):
+            (size,) = _FRAME.unpack_from(data, pos)
+            end = pos + _FRAME.size + size
+            if end > len(data):
+                break
+            try:
+                op, payload = _loads(data[pos + _FRAME.size:end])
+            except pickle.UnpicklingError:
+                break
+            if op == 'fields':
+                fields = payload
+            elif op == 'put':
+                item = self._from_row(fields, payload)
+                store[item.id] = item
+            elif op == 'put_many':
+                # Пачка могла уже попасть в снимок (незавершённая компактизация) - проигрываем как замену
+                for row in payload:
+                    item = self._from_row(fields, row)
+                    store[item.id] = item
+            elif op == 'del':
+                store.pop(payload, None)
+            elif op == 'clear':
+                store.clear()
+            pos = end
+
+        if pos < len(data):
+            with open(path, 'r+b') as f:
+                f.truncate(pos)
+
+    def _from_row(self, fields, row):
+        item = self.item_class.__new__(self.item_class)
+        for name, value in zip(fields, row):
+            setattr(item, name, value)
+        return item
+
+    def _row(self, item):
+        return tuple(getattr(item, name) for name in self.fields)
+
+    # Запись
+    def _open_log(self):
+        is_new = not self.log_path.exists() or self.log_path.stat().st_size == 0
+        log = open(self.log_path, 'ab')
+        if is_new:
+            self._append(log, ('fields', self.fields))
+        return log
+
+    def _append(self, log, record):
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        log.write(_FRAME.pack(len(payload)) + payload)
+        log.flush()
+        if self.fsync:
+            os.fsync(log.fileno())
+
+    def _record(self, record):
+        with self.lock:
+            self._append(self._log, record)
+            self._records += 1
+            start_compaction = self._records >= self.snapshot_every and not self._compacting
+            if start_compaction:
+                self._compacting = True
+        if start_compaction:
+            threading.Thread(target=self.compact, name='mock-store-compaction', daemon=True).start()
+
+    def record_put(self, item):
+        self._record(('put', self._row(item)))
+
+    def record_put_many(self, items):
+        # Одна запись на пачку: при обрыве записи пачка теряется целиком, а не частично
+        self._record(('put_many', [self._row(item) for item in items]))
+
+    def record_delete(self, item_id):
+        self._record(('del', item_id))
+
+    def record_clear(self):
+        self._record(('clear', None))
+
+    # Компактизация
+    def compact(self):
+        """
+        Новый снимок вместо накопленного журнала
+        Под блокировкой только фиксируем набор объектов и ротируем журнал, снимок пишется без неё
+        """
+        with self.lock:
+            self._compacting = True
+            items = list(self.store._items.values())  # объекты неизменяемы (copy-on-write)
+            self._log.close()
+            if self.old_log_path.exists():
+                # Прошлая компактизация не дописала снимок: дописываем текущий журнал к старому,
+                # чтобы при сбое до нового снимка не потерять ни одну операцию
+                with open(self.old_log_path, 'ab') as old_log, open(self.log_path, 'rb') as log:
+                    old_log.write(log.read())
+                self.log_path.unlink()
+            else:
+                os.replace(self.log_path, self.old_log_path)
+            self._log = self._open_log()
+            self._records = 0
+
+        try:
+            self._write_snapshot(items)
+            self.old_log_path.unlink()
+        finally:
+            self._compacting = False
+
+    def _write_snapshot(self, items):
+        tmp_path = self.snapshot_path.with_suffix('.snapshot.tmp')
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'format': SNAPSHOT_FORMAT, 'fields': self.fields}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump([self._row(item) for item in items], f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def close(self):
+        with self.lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
@@ -0,0 +1,149 @@
+import threading
+
+# Длина n-граммы для поиска по подстроке (запросы короче ищутся по префиксу слова)
+NGRAM_SIZE = 3
+
+
+def normalize(text):
+    """Текст для поиска: без учёта регистра, пробелы схлопнуты"""
+    return ' '.join(str(text).casefold().split())
+
+
+def ngrams(text, size=NGRAM_SIZE):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def matches(text, query, size=NGRAM_SIZE):
+    """Проверка одного текста без индекса (та же семантика, что у TextIndex.search)"""
+    text = normalize(text)
+    words = normalize(query).split()
+    padded = ' ' + text
+    return bool(words) and all(
+        (' ' + word in padded) if len(word) < size else (word in text) for word in words
+    )
+
+
+class _TrieNode:
+    __slots__ = ('children', 'ids')
+
+    def __init__(self):
+        self.children = {}
+        self.ids = set()  # объекты, у которых слово заканчивается в этом узле
+
+
+class TextIndex:
+    """
+    Поисковый индекс по текстовому полю (например, MockProduct.name)
+    Поддерживается инкрементально при каждой записи в хранилище:
+    - префиксное дерево слов: слово запроса короче NGRAM_SIZE ищется как префикс слова
+    - инвертированный индекс n-грамм: более длинное слово - как подстрока
+      (пересечение списков n-грамм, кандидаты перепроверяются по тексту)
+    Все слова запроса должны совпасть (AND)
+    """
+
+    def __init__(self, ngram_size=NGRAM_SIZE):
+        self.ngram_size = ngram_size
+        self._texts = {}  # {id: нормализованный текст}
+        self._root = _TrieNode()
+        self._grams = {}  # {n-грамма: {id}}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._texts)
+
+    def add(self, item_id, text):
+        text = normalize(text)
+        with self.lock:
+            if self._texts.get(item_id) == text:
+                return
+            self._remove(item_id)
+            self._texts[item_id] = text
+            for word in set(text.split()):
+                node = self._root
+                for char in word:
+                    node = node.children.setdefault(char, _TrieNode())
+                node.ids.add(item_id)
+            for gram in ngrams(text, self.ngram_size):
+                self._grams.setdefault(gram, set()).add(item_id)
+
+    def remove(self, item_id):
+        with self.lock:
+            self._remove(item_id)
+
+    def clear(self):
+        with self.lock:
+            self._texts.clear()
+            self._root = _TrieNode()
+            self._grams.clear()
+
+    def _remove(self, item_id):
+        text = self._texts.pop(item_id, None)
+        if text is None:
+            return
+        for word in set(text.split()):
+            self._remove_word(word, item_id)
+        for gram in ngrams(text, self.ngram_size):
+            ids = self._grams.get(gram)
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del self._grams[gram]
+
+    def _remove_word(self, word, item_id):
+        """Удаление слова с очисткой опустевших узлов дерева"""
+        path = [self._root]
+        for char in word:
+            node = path[-1].children.get(char)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].ids.discard(item_id)
+        for depth in range(len(word) - 1, -1, -1):
+            node = path[depth + 1]
+            if node.ids or node.children:
+                break
+            del path[depth].children[word[depth]]
+
+    def search(self, query):
+        """id объектов, подходящих под все слова запроса"""
+        words = normalize(query).split()
+        if not words:
+            return set()
+        with self.lock:
+            # Сначала самые избирательные (длинные) слова - меньше промежуточные множества
+            result = None
+            for word in sorted(words, key=len, reverse=True):
+                ids = self._match(word, result)
+                result = ids if result is None else result & ids
+                if not result:
+                    return set()
+            return result
+
+    def _match(self, word, candidates):
+        if len(word) < self.ngram_size:
+            return self._prefix(word)
+
+        postings = sorted((self._grams.get(gram, ()) for gram in ngrams(word, self.ngram_size)), key=len)
+        found = set(postings[0])
+        if candidates is not None:
+            found &= candidates
+        for ids in postings[1:]:
+            if not found:
+                break
+            found &= ids
+        # Все n-граммы на месте ещё не значит, что они идут подряд - проверяем подстроку
+        texts = self._texts
+        return {item_id for item_id in found if word in texts[item_id]}
+
+    def _prefix(self, prefix):
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        found, stack = set(), [node]
+        while stack:
+            node = stack.pop()
+            found |= node.ids
+            stack.extend(node.children.values())
+        return found
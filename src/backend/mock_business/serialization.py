@@ -0,0 +1,59 @@
+import json
+from collections.abc import Sequence
+
+from rest_framework.renderers import JSONRenderer
+
+
+def encode_json(data):
+    """
+    JSON в bytes в том же виде, что отдаёт JSONRenderer (компактно, без экранирования юникода)
+    NaN и бесконечности - ValueError, как у JSONRenderer (strict): в JSON их нет
+    """
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), allow_nan=False).encode('utf-8')
+
+
+class EncodedItems(Sequence):
+    """
+    Список объектов для ответа API
+    FragmentJSONRenderer вставляет в ответ их готовый JSON (to_json(), кешируется в объекте),
+    без сборки словарей; при чтении как последовательности (response.data) элементы декодируются
+    """
+
+    def __init__(self, items):
+        self.items = list(items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [json.loads(item.to_json()) for item in self.items[index]]
+        return json.loads(self.items[index].to_json())
+
+    def fragments(self):
+        return [item.to_json() for item in self.items]
+
+
+class FragmentJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer, который склеивает ответ из готовых фрагментов EncodedItems
+    Остальные значения (total, next, ...) сериализуются как обычно
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, dict) or not any(isinstance(value, EncodedItems) for value in data.values()):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            # Форматированный вывод (?indent / браузер) - через обычную сериализацию
+            data = {key: list(value) if isinstance(value, EncodedItems) else value for key, value in data.items()}
+            return super().render(data, accepted_media_type, renderer_context)
+
+        parts = []
+        for key, value in data.items():
+            if isinstance(value, EncodedItems):
+                encoded = b'[' + b','.join(value.fragments()) + b']'
+            else:
+                encoded = super().render(value, accepted_media_type, renderer_context) or b'null'
+            parts.append(encode_json(key) + b':' + encoded)
+        return b'{' + b','.join(parts) + b'}'
@@ -0,0 +1,402 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from copy import copy
+
+from .search import NGRAM_SIZE, normalize
+from .store import DEFAULT_ORDERING, VersionConflict, dump_item, is_unchanged, load_item
+
+
+def _like_escape(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class SQLiteStore:
+    """
+    Хранилище mock-объектов в SQLite (режим WAL)
+    Файл БД общий для всех воркеров узла: объект, созданный одним процессом, сразу виден остальным.
+    Интерфейс тот же, что у MockStore (словарь + add/update/delete/owned_by/values().page()),
+    поэтому представления не зависят от выбранного хранилища.
+
+    Служебные поля owner_id/created_ts/version и поля из orderings (например, price)
+    и lookups (например, product_id) вынесены в колонки с индексами, остальное состояние объекта хранится в JSON.
+    Для полей из search_fields хранится нормализованный текст (колонка <поле>_search),
+    поиск по нему - LIKE с той же семантикой, что у TextIndex.
+    Агрегаты (GroupAggregates - берётся только описание групп) лежат в таблице <table>_agg
+    и правятся в той же транзакции, что и сам объект.
+    Счётчик записей (version, для ETag списков) - строка таблицы <table>_version, общая для воркеров.
+    """
+
+    def __init__(self, path, table, item_class, orderings=(), search_fields=(), lookups=(), aggregates=None):
+        self.path = str(path)
+        self.table = table
+        self.item_class = item_class
+        self.orderings = tuple(orderings)
+        self.search_fields = tuple(search_fields)
+        self.lookups = tuple(lookups)
+        self.aggregates = aggregates
+        self._local = threading.local()  # соединение на поток (и на процесс - см. _connection)
+        self._create_table()
+
+    def _connection(self):
+        """Соединение текущего потока; после fork воркера открывается заново"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _write(self):
+        """Транзакция записи: BEGIN IMMEDIATE сразу берёт блокировку записи на файл"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _create_table(self):
+        conn = self._connection()
+        conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.table} ('
+            'id TEXT PRIMARY KEY, owner_id INTEGER NOT NULL, created_ts INTEGER NOT NULL, '
+            'version INTEGER NOT NULL, data TEXT NOT NULL)'
+        )
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_created ON {self.table} (created_ts, id)')
+        conn.execute(
+            f'CREATE INDEX IF NOT EXISTS {self.table}_owner ON {self.table} (owner_id, created_ts, id)'
+        )
+
+        # Колонки под индексы orderings; в существующей таблице добавляем и заполняем из JSON
+        columns = {row[1] for row in conn.execute(f'PRAGMA table_info({self.table})')}
+        for name in self.orderings + self.lookups:
+            if name not in columns:
+                conn.execute(f'ALTER TABLE {self.table} ADD COLUMN {name}')
+                conn.execute(f"UPDATE {self.table} SET {name} = json_extract(data, '$.{name}')")
+        for name in self.orderings:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_{name} ON {self.table} ({name}, id)')
+        for name in self.lookups:
+            conn.execute(
+                f'CREATE INDEX IF NOT EXISTS {self.table}_{name} ON {self.table} ({name}, created_ts, id)'
+            )
+
+        for name in self.search_fields:
+            if f'{name}_search' not in columns:
+                conn.execute(f'ALTER TABLE {self.table} ADD COLUMN {name}_search TEXT')
+                rows = conn.execute(f"SELECT id, json_extract(data, '$.{name}') FROM {self.table}").fetchall()
+                conn.executemany(
+                    f'UPDATE {self.table} SET {name}_search = ? WHERE id = ?',
+                    [(self._search_text(value), item_id) for item_id, value in rows]
+                )
+
+        conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.table}_version '
+            '(id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL)'
+        )
+        conn.execute(f'INSERT OR IGNORE INTO {self.table}_version (id, version) VALUES (0, 0)')
+
+        if self.aggregates is not None:
+            self._create_aggregates_table()
+
+    def _create_aggregates_table(self):
+        # Проверка и создание в одной транзакции записи: второй воркер не пересчитает агрегаты повторно
+        with self._write() as conn:
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (f'{self.table}_agg',)
+            ).fetchone()
+            if exists:
+                return
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table}_agg ('
+                'field TEXT NOT NULL, value, split, count INTEGER NOT NULL, total NOT NULL, '
+                'PRIMARY KEY (field, value, split))'
+            )
+            # Таблица объектов уже была - считаем агрегаты один раз по всем объектам
+            for (data,) in conn.execute(f'SELECT data FROM {self.table}').fetchall():
+                self._aggregate(conn, self._load(data), 1)
+
+    def _aggregate(self, conn, item, sign):
+        spec = self.aggregates
+        split = getattr(item, spec.split_field)
+        amount = sign * getattr(item, spec.sum_field)
+        conn.executemany(
+            f'INSERT INTO {self.table}_agg (field, value, split, count, total) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (field, value, split) DO UPDATE SET '
+            'count = count + excluded.count, total = total + excluded.total',
+            [(field, getattr(item, field), split, sign, amount) for field in spec.group_fields]
+        )
+
+    def _bump(self, conn):
+        """Увеличить счётчик записей (в транзакции самой записи)"""
+        conn.execute(f'UPDATE {self.table}_version SET version = version + 1')
+
+    @property
+    def version(self):
+        """Счётчик записей: меняется при любом изменении таблицы через хранилище"""
+        return self._connection().execute(f'SELECT version FROM {self.table}_version').fetchone()[0]
+
+    @staticmethod
+    def _search_text(value):
+        # Пробел в начале: префикс слова ищется как '% префикс%'
+        return ' ' + normalize(value)
+
+    def _load(self, data):
+        return load_item(self.item_class, json.loads(data))
+
+    def _fetch(self, conn, item_id):
+        row = conn.execute(f'SELECT data FROM {self.table} WHERE id = ?', (item_id,)).fetchone()
+        if row is None:
+            raise KeyError(item_id)
+        return self._load(row[0])
+
+    def _save(self, conn, item, replace=True):
+        """
+        Записать объект; replace=False - только новый: совпадение id (например, у двух воркеров
+        с одним номером в генераторе ID) - sqlite3.IntegrityError, а не молчаливая перезапись
+        """
+        if self.aggregates is not None:
+            row = None
+            if replace:
+                row = conn.execute(f'SELECT data FROM {self.table} WHERE id = ?', (item.id,)).fetchone()
+            if row is not None:
+                self._aggregate(conn, self._load(row[0]), -1)
+            self._aggregate(conn, item, 1)
+        columns = ('id', 'owner_id', 'created_ts', 'version', 'data') + self.orderings + self.lookups
+        columns += tuple(f'{name}_search' for name in self.search_fields)
+        values = (item.id, item.owner_id, item.created_ts, item.version,
+                  json.dumps(dump_item(item), ensure_ascii=False))
+        values += tuple(getattr(item, name) for name in self.orderings + self.lookups)
+        values += tuple(self._search_text(getattr(item, name)) for name in self.search_fields)
+        conn.execute(
+            f'INSERT {"OR REPLACE " if replace else ""}INTO {self.table} ({", ".join(columns)}) '
+            f'VALUES ({", ".join("?" * len(columns))})',
+            values
+        )
+
+    # Словарный интерфейс
+    def __getitem__(self, item_id):
+        return self._fetch(self._connection(), item_id)
+
+    def __setitem__(self, item_id, item):
+        with self._write() as conn:
+            self._save(conn, item)
+            self._bump(conn)
+
+    def __delitem__(self, item_id):
+        self.delete(item_id)
+
+    def __contains__(self, item_id):
+        row = self._connection().execute(f'SELECT 1 FROM {self.table} WHERE id = ?', (item_id,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        return self._connection().execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, item_id, default=None):
+        try:
+            return self[item_id]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [row[0] for row in self._connection().execute(f'SELECT id FROM {self.table}')]
+
+    def values(self):
+        """Все объекты хранилища (представление с поддержкой owned_by)"""
+        return SQLiteView(self)
+
+    def items(self):
+        return [(item.id, item) for item in self.values()]
+
+    def clear(self):
+        with self._write() as conn:
+            conn.execute(f'DELETE FROM {self.table}')
+            if self.aggregates is not None:
+                conn.execute(f'DELETE FROM {self.table}_agg')
+            self._bump(conn)
+
+    # Операции
+    def add(self, item):
+        """Добавить объект"""
+        with self._write() as conn:
+            self._save(conn, item, replace=False)
+            self._bump(conn)
+        return item
+
+    def add_many(self, items):
+        """Добавить пачку объектов одной транзакцией"""
+        items = list(items)
+        with self._write() as conn:
+            for item in items:
+                self._save(conn, item, replace=False)
+            self._bump(conn)
+        return items
+
+    def update(self, item_id, expected_version=None, **fields):
+        """Изменить поля объекта (compare-and-swap по версии, как в MockStore.update)"""
+        with self._write() as conn:
+            current = self._fetch(conn, item_id)
+            if expected_version is not None and current.version != expected_version:
+                raise VersionConflict(item_id, expected_version, current.version)
+            if is_unchanged(current, fields):
+                return current
+
+            item = copy(current)
+            for name, value in fields.items():
+                setattr(item, name, value)
+            item.version = current.version + 1
+            self._save(conn, item)
+            self._bump(conn)
+        return item
+
+    def delete(self, item_id, expected_version=None):
+        """Удалить объект (с проверкой версии, если она передана)"""
+        with self._write() as conn:
+            item = self._fetch(conn, item_id)
+            if expected_version is not None and item.version != expected_version:
+                raise VersionConflict(item_id, expected_version, item.version)
+            conn.execute(f'DELETE FROM {self.table} WHERE id = ?', (item_id,))
+            if self.aggregates is not None:
+                self._aggregate(conn, item, -1)
+            self._bump(conn)
+        return item
+
+    def owned_by(self, owner_id):
+        """Объекты одного владельца (через индекс owner_id, created_ts, id)"""
+        return SQLiteView(self, owner_id)
+
+    def search(self, field, query):
+        """Объекты, у которых поле field подходит под запрос (см. TextIndex)"""
+        return self.values().search(field, query)
+
+    def filter_by(self, field, value):
+        """Объекты с field == value (через индекс колонки из lookups)"""
+        return self.values().filter_by(field, value)
+
+    def aggregate(self, field, value):
+        """Агрегаты группы field=value - чтение строк по первичному ключу таблицы агрегатов"""
+        if self.aggregates is None:
+            raise ValueError("Агрегаты для хранилища не настроены")
+        if field not in self.aggregates.group_fields:
+            raise ValueError(f"Нет агрегатов по полю: {field}")
+        rows = self._connection().execute(
+            f'SELECT split, count, total FROM {self.table}_agg WHERE field = ? AND value = ? AND count > 0',
+            (field, value)
+        ).fetchall()
+        return self.aggregates.summary(rows)
+
+
+class SQLiteView:
+    """
+    Представление SQLite-хранилища: все объекты или объекты одного владельца,
+    в порядке ordering, с диапазоном [lo, hi] по нему, условиями поиска и равенства полей (см. StoreView)
+    """
+
+    def __init__(self, store, owner_id=None, ordering=DEFAULT_ORDERING, lo=None, hi=None, terms=(), filters=()):
+        self.store = store
+        self.owner_id = owner_id
+        self.ordering = ordering
+        self.lo = lo
+        self.hi = hi
+        self.terms = terms  # ((поле, слово запроса), ...)
+        self.filters = filters  # ((поле, значение), ...)
+
+    def _copy(self, **changes):
+        params = dict(
+            owner_id=self.owner_id, ordering=self.ordering, lo=self.lo, hi=self.hi,
+            terms=self.terms, filters=self.filters
+        )
+        params.update(changes)
+        return SQLiteView(self.store, **params)
+
+    @property
+    def _column(self):
+        return 'created_ts' if self.ordering == DEFAULT_ORDERING else self.ordering
+
+    def _where(self, after=None):
+        clauses, params = [], []
+        if self.owner_id is not None:
+            clauses.append('owner_id = ?')
+            params.append(self.owner_id)
+        if self.lo is not None:
+            clauses.append(f'{self._column} >= ?')
+            params.append(self.lo)
+        if self.hi is not None:
+            clauses.append(f'{self._column} <= ?')
+            params.append(self.hi)
+        for field, value in self.filters:
+            clauses.append(f'{field} = ?')
+            params.append(value)
+        for field, word in self.terms:
+            # Короткое слово - префикс слова, длинное - подстрока (как в TextIndex)
+            pattern = _like_escape(word) + '%'
+            pattern = ('% ' if len(word) < NGRAM_SIZE else '%') + pattern
+            clauses.append(f"{field}_search LIKE ? ESCAPE '\\'")
+            params.append(pattern)
+        if after is not None:
+            clauses.append(f'({self._column}, id) > (?, ?)')
+            params.extend(after)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def __iter__(self):
+        after = None
+        while True:
+            items, after = self.page(after=after, limit=1000)
+            yield from items
+            if after is None:
+                return
+
+    def __len__(self):
+        where, params = self._where()
+        sql = f'SELECT COUNT(*) FROM {self.store.table}{where}'
+        return self.store._connection().execute(sql, params).fetchone()[0]
+
+    def owned_by(self, owner_id):
+        """Сужение до объектов одного владельца"""
+        if self.owner_id is not None and self.owner_id != owner_id:
+            return []  # пустое пересечение
+        return self._copy(owner_id=owner_id)
+
+    def ordered_by(self, ordering, lo=None, hi=None):
+        """Тот же набор объектов в порядке другого индекса, с диапазоном значений [lo, hi]"""
+        if ordering != DEFAULT_ORDERING and ordering not in self.store.orderings:
+            raise ValueError(f"Нет индекса для сортировки: {ordering}")
+        return self._copy(ordering=ordering, lo=lo, hi=hi)
+
+    def search(self, field, query):
+        """Сужение до объектов, у которых поле field подходит под запрос"""
+        if field not in self.store.search_fields:
+            raise ValueError(f"Нет поискового индекса для поля: {field}")
+        words = normalize(query).split()
+        if not words:
+            return []
+        return self._copy(terms=self.terms + tuple((field, word) for word in words))
+
+    def filter_by(self, field, value):
+        """Сужение до объектов с field == value"""
+        if field not in self.store.lookups:
+            raise ValueError(f"Нет индекса для поля: {field}")
+        return self._copy(filters=self.filters + ((field, value),))
+
+    def page(self, after=None, limit=100):
+        """Страница объектов после ключа after, см. StoreView.page"""
+        where, params = self._where(after)
+        sql = f'SELECT data FROM {self.store.table}{where} ORDER BY {self._column}, id LIMIT ?'
+        rows = self.store._connection().execute(sql, params + [limit + 1]).fetchall()
+        items = [self.store._load(row[0]) for row in rows[:limit]]
+        next_key = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_key = (getattr(last, 'created_ts' if self.ordering == DEFAULT_ORDERING else self.ordering), last.id)
+        return items, next_key
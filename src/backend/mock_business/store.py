@@ -0,0 +1,536 @@
+import math
+import sqlite3
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from contextlib import ExitStack
+from copy import copy
+from datetime import datetime, timedelta, timezone
+
+from .search import TextIndex
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def now_ts():
+    """Текущее время в микросекундах от epoch (UTC)"""
+    return time.time_ns() // 1000
+
+
+def ts_to_datetime(ts):
+    """Микросекунды от epoch -> datetime (UTC)"""
+    return _EPOCH + timedelta(microseconds=ts)
+
+
+def ts_to_isoformat(ts):
+    """
+    Микросекунды от epoch -> created_at в ответе API
+    Формат прежний, как у datetime.now().isoformat(): локальное время без часового пояса
+    """
+    seconds, micros = divmod(ts, 1_000_000)
+    return datetime.fromtimestamp(seconds).replace(microsecond=micros).isoformat()
+
+
+def datetime_to_ts(value):
+    """datetime -> микросекунды от epoch"""
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+# Число полос блокировок: объект блокируется полосой hash(id) % LOCK_STRIPES
+LOCK_STRIPES = 64
+
+
+def created_key(item):
+    """Ключ сортировки по времени создания: (микросекунды от epoch, id)"""
+    return (item.created_ts, item.id)
+
+
+def attribute_key(item, name):
+    """Ключ сортировки по полю объекта: (значение, id)"""
+    return (getattr(item, name), item.id)
+
+
+# Сортировка по умолчанию (индекс по времени создания есть у любого хранилища)
+DEFAULT_ORDERING = 'created'
+
+
+def dump_item(item):
+    """Состояние объекта (по его __slots__) в виде словаря - для внешних хранилищ"""
+    return {name: getattr(item, name) for name in type(item).__slots__}
+
+
+def load_item(item_class, state):
+    """Восстановление объекта из состояния dump_item() без вызова __init__"""
+    item = item_class.__new__(item_class)
+    for name, value in state.items():
+        setattr(item, name, value)
+    return item
+
+
+class VersionConflict(Exception):
+    """Объект изменён другим запросом: ожидаемая версия не совпала с текущей"""
+
+    def __init__(self, item_id, expected, current):
+        super().__init__(f"{item_id}: ожидалась версия {expected}, текущая {current}")
+        self.item_id = item_id
+        self.expected = expected
+        self.current = current
+
+
+class MockStore:
+    """
+    Хранилище mock-объектов
+    Снаружи ведёт себя как словарь {id: объект}, внутри поддерживает вторичные индексы:
+    - отсортированный список ключей (created_at, id) для постраничного вывода
+    - owner_id -> отсортированные ключи для выборки "только свои" за O(своих объектов)
+    - по одному отсортированному списку (значение, id) на каждое поле из orderings
+      (например, price) - для диапазонных запросов за O(log n + k)
+    - поисковый индекс (TextIndex) на каждое поле из search_fields (например, name)
+    - значение -> множество id для каждого поля из lookups (например, product_id у заказов)
+    - агрегаты по группам (GroupAggregates), если переданы - например, заказы по товару/владельцу
+    - счётчик записей version: меняется при любом изменении хранилища (для ETag списков)
+
+    Потокобезопасность:
+    - операции над одним объектом сериализуются полосой блокировок по hash(id),
+      запись в разные объекты не ждёт одну общую блокировку
+    - изменение идёт через copy-on-write: читатели без блокировок видят объект целиком
+      в старой или в новой версии
+    - каждый общий индекс правится под своей короткой блокировкой (created/owner, каждое поле
+      orderings, lookups; TextIndex и GroupAggregates - под своими), так что записи разных объектов
+      не ждут одну блокировку на всё обновление индексов, а расходятся по ним конвейером
+    - читатель без блокировки может на мгновение увидеть объект уже в одном индексе и ещё не
+      в другом; StoreView берёт сами объекты из словаря, поэтому видит их целиком
+    """
+
+    def __init__(self, stripes=LOCK_STRIPES, orderings=(), search_fields=(), lookups=(), aggregates=None):
+        self.orderings = tuple(orderings)  # поля с отдельным отсортированным индексом
+        self.search_fields = tuple(search_fields)  # поля с поиском по префиксу/подстроке
+        self.lookups = tuple(lookups)  # поля с индексом значение -> id
+
+        self._items = {}  # {id: объект}
+        self._keys = {}  # {id: (ключ created, owner_id, ключи orderings)} - с чем объект попал в индексы
+        self._by_created = []  # [(created_at, id)] по возрастанию
+        self._by_owner = {}  # {owner_id: [(created_at, id)]}
+        self._sorted = {name: [] for name in self.orderings}  # {поле: [(значение, id)]}
+        self._text = {name: TextIndex() for name in self.search_fields}
+        self._lookup = {name: {} for name in self.lookups}  # {поле: {значение: {id}}}
+        self.aggregates = aggregates
+        # Начинается с текущего времени: после перезапуска не повторяет значения, выданные раньше
+        self.version = time.time_ns()
+
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        self._created_lock = threading.Lock()  # _by_created и _by_owner (общий ключ)
+        self._sorted_locks = {name: threading.Lock() for name in self.orderings}
+        self._lookup_lock = threading.Lock()
+        self._version_lock = threading.Lock()
+
+        self.journal = None  # StoreJournal, если включено сохранение на диск
+
+    def _lock_for(self, item_id):
+        return self._stripes[hash(item_id) % len(self._stripes)]
+
+    def _lock_all(self, stack):
+        """
+        Все полосы и блокировки индексов (всегда в одном порядке) - для clear/load_items
+        TextIndex и GroupAggregates блокируются сами: писателей нет, пока взяты все полосы
+        """
+        for lock in (*self._stripes, self._created_lock, *self._sorted_locks.values(), self._lookup_lock):
+            stack.enter_context(lock)
+
+    # Словарный интерфейс (для совместимости со старым кодом products_db/orders_db)
+    def __getitem__(self, item_id):
+        return self._items[item_id]
+
+    def __setitem__(self, item_id, item):
+        with self._lock_for(item_id):
+            if self._items.get(item_id) is item:
+                # Индексы снимаются по старой версии объекта - изменённый на месте объект её потерял
+                raise ValueError(f"{item_id}: объект хранилища изменён на месте, используйте update() или копию")
+            self._put(item_id, item)
+
+    def __delitem__(self, item_id):
+        self.delete(item_id)
+
+    def __contains__(self, item_id):
+        return item_id in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+    def get(self, item_id, default=None):
+        return self._items.get(item_id, default)
+
+    def pop(self, item_id, default=None):
+        try:
+            return self.delete(item_id)
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self._items)
+
+    def values(self):
+        """Все объекты хранилища (представление с поддержкой owned_by)"""
+        return StoreView(self)
+
+    def items(self):
+        return list(self._items.items())
+
+    def clear(self):
+        with ExitStack() as stack:
+            self._lock_all(stack)
+            self._items.clear()
+            self._keys.clear()
+            self._by_created.clear()
+            self._by_owner.clear()
+            for keys in self._sorted.values():
+                keys.clear()
+            for index in self._text.values():
+                index.clear()
+            for values in self._lookup.values():
+                values.clear()
+            if self.aggregates is not None:
+                self.aggregates.clear()
+            self._bump_version()
+            if self.journal is not None:
+                self.journal.record_clear()
+
+    # Операции с поддержкой индексов
+    def add(self, item):
+        """Добавить объект; объект с таким id уже есть - sqlite3.IntegrityError, как у SQLiteStore"""
+        with self._lock_for(item.id):
+            self._check_new([item])
+            self._put(item.id, item)
+        return item
+
+    def add_many(self, items):
+        """
+        Добавить пачку объектов: журнал видит либо всю пачку, либо ничего
+        Полосы блокировок берутся в порядке номеров (без взаимоблокировок с другими пачками),
+        каждый индекс правится за одно взятие своей блокировки на всю пачку
+        id, который уже есть в хранилище или повторяется в пачке, - sqlite3.IntegrityError, пачка не добавляется
+        """
+        items = list(items)
+        stripes = sorted({hash(item.id) % len(self._stripes) for item in items})
+        with ExitStack() as stack:
+            for pos in stripes:
+                stack.enter_context(self._stripes[pos])
+            self._check_new(items)
+            for item in items:
+                self._items[item.id] = item
+            self._reindex([(None, item) for item in items])
+            if self.journal is not None:
+                self.journal.record_put_many(items)
+        return items
+
+    def _check_new(self, items):
+        """Совпавший ID (например, два воркера с одним номером в генераторе ID) - ошибка, а не перезапись"""
+        seen = set()
+        for item in items:
+            if item.id in self._items or item.id in seen:
+                raise sqlite3.IntegrityError(f"Объект с id {item.id} уже есть")
+            seen.add(item.id)
+
+    def update(self, item_id, expected_version=None, **fields):
+        """
+        Изменить поля объекта (compare-and-swap по версии)
+        expected_version - версия, которую видел клиент (If-Match); None - без проверки
+        Объект не меняется на месте: в хранилище кладётся изменённая копия с version + 1
+        Если значения полей не меняются, объект и версии (его и хранилища) остаются прежними
+        """
+        with self._lock_for(item_id):
+            current = self._items[item_id]
+            _check_version(current, expected_version)
+            if is_unchanged(current, fields):
+                return current
+
+            item = copy(current)
+            for name, value in fields.items():
+                setattr(item, name, value)
+            item.version = current.version + 1
+
+            self._put(item_id, item)
+        return item
+
+    def delete(self, item_id, expected_version=None):
+        """Удалить объект (с проверкой версии, если она передана)"""
+        with self._lock_for(item_id):
+            item = self._items[item_id]
+            _check_version(item, expected_version)
+            del self._items[item_id]
+            self._reindex([(item, None)])
+            if self.journal is not None:
+                self.journal.record_delete(item_id)
+        return item
+
+    def owned_by(self, owner_id):
+        """Объекты одного владельца (через индекс)"""
+        return StoreView(self, owner_id)
+
+    def search(self, field, query):
+        """Объекты, у которых поле field подходит под запрос (см. TextIndex)"""
+        return self.values().search(field, query)
+
+    def filter_by(self, field, value):
+        """Объекты с field == value (через индекс lookups)"""
+        return self.values().filter_by(field, value)
+
+    def _lookup_ids(self, field, value):
+        if field not in self._lookup:
+            raise ValueError(f"Нет индекса для поля: {field}")
+        with self._lookup_lock:
+            return frozenset(self._lookup[field].get(value, ()))
+
+    def aggregate(self, field, value):
+        """Агрегаты группы field=value (см. GroupAggregates.get)"""
+        if self.aggregates is None:
+            raise ValueError("Агрегаты для хранилища не настроены")
+        return self.aggregates.get(field, value)
+
+    def _search_ids(self, field, query):
+        if field not in self._text:
+            raise ValueError(f"Нет поискового индекса для поля: {field}")
+        return self._text[field].search(query)
+
+    def load_items(self, items):
+        """
+        Массовая загрузка (восстановление со снимка)
+        Индексы строятся одной сортировкой вместо вставки по одному ключу
+        """
+        with ExitStack() as stack:
+            self._lock_all(stack)
+            for item in items:
+                self._items[item.id] = item
+                self._keys[item.id] = self._index_keys(item)
+
+            ordered = sorted(self._keys.values())
+            self._by_created = [key for key, _, _ in ordered]
+            self._by_owner = {}
+            for key, owner_id, _ in ordered:
+                self._by_owner.setdefault(owner_id, []).append(key)
+            for pos, name in enumerate(self.orderings):
+                self._sorted[name] = sorted(extra[pos] for _, _, extra in ordered)
+            for name, index in self._text.items():
+                for item in self._items.values():
+                    index.add(item.id, getattr(item, name))
+            for name, values in self._lookup.items():
+                values.clear()
+                for item in self._items.values():
+                    values.setdefault(getattr(item, name), set()).add(item.id)
+            if self.aggregates is not None:
+                self.aggregates.clear()
+                for item in self._items.values():
+                    self.aggregates.add(item)
+            self._bump_version()
+
+    def _put(self, item_id, item):
+        """Вставка/замена объекта вместе с индексами (под блокировкой полосы)"""
+        old = self._items.get(item_id)
+        self._items[item_id] = item
+        self._reindex([(old, item)])
+        # Запись в журнал под блокировкой полосы сохраняет порядок операций над объектом
+        if self.journal is not None:
+            self.journal.record_put(item)
+
+    # Индексы
+    def _index_keys(self, item):
+        extra = tuple(attribute_key(item, name) for name in self.orderings)
+        return created_key(item), item.owner_id, extra
+
+    def _bump_version(self):
+        with self._version_lock:
+            self.version += 1
+
+    def _reindex(self, changes):
+        """
+        Перенос объектов в индексах: changes - [(старая версия или None, новая или None)]
+        Объекты уже под блокировками своих полос; каждый индекс берёт свою блокировку один раз
+        """
+        removed = []  # [(старая версия, ключи, с которыми она попала в индексы)]
+        added = []  # [(новая версия, её ключи)]
+        for old, new in changes:
+            if old is not None:
+                indexed = self._keys.pop(old.id, None)
+                if indexed is not None:
+                    removed.append((old, indexed))
+            if new is not None:
+                added.append((new, self._index_keys(new)))
+                self._keys[new.id] = added[-1][1]
+
+        with self._created_lock:
+            for _, (key, owner_id, _) in removed:
+                _remove_key(self._by_created, key)
+                keys = self._by_owner.get(owner_id)
+                if keys is not None:
+                    _remove_key(keys, key)
+                    if not keys:
+                        del self._by_owner[owner_id]
+            for _, (key, owner_id, _) in added:
+                insort(self._by_created, key)
+                insort(self._by_owner.setdefault(owner_id, []), key)
+
+        for pos, name in enumerate(self.orderings):
+            with self._sorted_locks[name]:
+                for _, (_, _, extra) in removed:
+                    _remove_key(self._sorted[name], extra[pos])
+                for _, (_, _, extra) in added:
+                    insort(self._sorted[name], extra[pos])
+
+        if self._lookup:
+            with self._lookup_lock:
+                for name, values in self._lookup.items():
+                    for item, _ in removed:
+                        value = getattr(item, name)
+                        ids = values.get(value)
+                        if ids is not None:
+                            ids.discard(item.id)
+                            if not ids:
+                                del values[value]
+                    for item, _ in added:
+                        values.setdefault(getattr(item, name), set()).add(item.id)
+
+        replaced = {item.id for item, _ in added}
+        for name, index in self._text.items():
+            for item, _ in removed:
+                if item.id not in replaced:  # при замене TextIndex.add сам обновит текст (и пропустит неизменный)
+                    index.remove(item.id)
+            for item, _ in added:
+                index.add(item.id, getattr(item, name))
+
+        if self.aggregates is not None:
+            for item, _ in removed:
+                self.aggregates.remove(item)
+            for item, _ in added:
+                self.aggregates.add(item)
+
+        self._bump_version()
+
+
+def is_unchanged(item, fields):
+    """update() не меняет ни одного поля объекта"""
+    return all(getattr(item, name) == value for name, value in fields.items())
+
+
+def _check_version(item, expected_version):
+    if expected_version is not None and item.version != expected_version:
+        raise VersionConflict(item.id, expected_version, item.version)
+
+
+def _remove_key(keys, key):
+    """Удаление ключа из отсортированного списка"""
+    pos = bisect_left(keys, key)
+    if pos < len(keys) and keys[pos] == key:
+        del keys[pos]
+
+
+# Владелец, которого нет в индексе (пустое представление)
+_NOBODY = object()
+
+
+class StoreView:
+    """
+    Представление хранилища: все объекты или объекты одного владельца
+    в порядке индекса ordering, с необязательным диапазоном [lo, hi] по значению этого индекса
+    и необязательным набором отобранных id (поиск - search(), равенство поля - filter_by()).
+    Используется ResourceAccessPermission.filter_visible вместо перебора всех объектов
+    """
+
+    def __init__(self, store, owner_id=None, ordering=DEFAULT_ORDERING, lo=None, hi=None, ids=None):
+        self.store = store
+        self.owner_id = owner_id
+        self.ordering = ordering
+        self.lo = lo
+        self.hi = hi
+        self.ids = ids
+
+    def _copy(self, **changes):
+        params = dict(owner_id=self.owner_id, ordering=self.ordering, lo=self.lo, hi=self.hi, ids=self.ids)
+        params.update(changes)
+        return StoreView(self.store, **params)
+
+    def _key(self, item):
+        if self.ordering == DEFAULT_ORDERING:
+            return created_key(item)
+        return attribute_key(item, self.ordering)
+
+    def _sorted_keys(self):
+        if self.ids is not None:
+            # Найденные объекты (с учётом владельца) сортируем сами: O(k log k)
+            items = self.store._items
+            found = (items.get(item_id) for item_id in self.ids)
+            return sorted(
+                self._key(item) for item in found
+                if item is not None and (self.owner_id is None or item.owner_id == self.owner_id)
+            )
+
+        if self.ordering == DEFAULT_ORDERING:
+            if self.owner_id is None:
+                return self.store._by_created
+            return self.store._by_owner.get(self.owner_id, [])
+
+        if self.owner_id is None:
+            return self.store._sorted[self.ordering]
+        # Свои объекты пересортировываем по полю: O(своих объектов)
+        own = self._resolve(list(self.store._by_owner.get(self.owner_id, [])))
+        return sorted(self._key(item) for item in own)
+
+    def _bounds(self):
+        """Отсортированные ключи и границы диапазона [lo, hi] в них"""
+        keys = self._sorted_keys()
+        start = bisect_left(keys, (self.lo,)) if self.lo is not None else 0
+        end = bisect_left(keys, (math.nextafter(self.hi, math.inf),)) if self.hi is not None else len(keys)
+        return keys, start, max(start, end)
+
+    def _resolve(self, keys):
+        items = self.store._items
+        for _, item_id in keys:
+            item = items.get(item_id)
+            if item is not None:
+                yield item
+
+    def __iter__(self):
+        keys, start, end = self._bounds()
+        return self._resolve(keys[start:end])
+
+    def __len__(self):
+        _, start, end = self._bounds()
+        return end - start
+
+    def owned_by(self, owner_id):
+        """Сужение до объектов одного владельца"""
+        if self.owner_id is not None and self.owner_id != owner_id:
+            owner_id = _NOBODY  # пустое пересечение
+        return self._copy(owner_id=owner_id)
+
+    def ordered_by(self, ordering, lo=None, hi=None):
+        """Тот же набор объектов в порядке другого индекса, с диапазоном значений [lo, hi]"""
+        if ordering != DEFAULT_ORDERING and ordering not in self.store.orderings:
+            raise ValueError(f"Нет индекса для сортировки: {ordering}")
+        return self._copy(ordering=ordering, lo=lo, hi=hi)
+
+    def search(self, field, query):
+        """Сужение до объектов, у которых поле field подходит под запрос (префикс/подстрока)"""
+        return self._restrict(self.store._search_ids(field, query))
+
+    def filter_by(self, field, value):
+        """Сужение до объектов с field == value (индекс lookups)"""
+        return self._restrict(self.store._lookup_ids(field, value))
+
+    def _restrict(self, ids):
+        if self.ids is not None:
+            ids = ids & self.ids
+        return self._copy(ids=frozenset(ids))
+
+    def page(self, after=None, limit=100):
+        """
+        Страница объектов после ключа after (keyset-пагинация)
+        Возвращает (объекты, ключ для следующей страницы или None)
+        """
+        keys, start, end = self._bounds()
+        begin = bisect_right(keys, after, start, end) if after is not None else start
+        chunk = keys[begin:min(begin + limit + 1, end)]
+        next_key = chunk[limit - 1] if len(chunk) > limit else None
+        return list(self._resolve(chunk[:limit])), next_key
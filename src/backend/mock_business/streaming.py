@@ -0,0 +1,67 @@
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+from .serialization import encode_json
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+# Сколько объектов выбирать из индекса за один шаг потока
+STREAM_CHUNK_SIZE = 1000
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Рендерер для Accept: application/x-ndjson
+    Сам поток отдаёт stream_response, здесь рендерятся только обычные ответы (например, ошибки)
+    """
+    media_type = NDJSON_MEDIA_TYPE
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return _encode(data)
+
+
+def wants_stream(request):
+    """Клиент просит потоковый ответ: ?stream=1 или Accept: application/x-ndjson"""
+    if request.query_params.get('stream') in ('1', 'true'):
+        return True
+    renderer = getattr(request, 'accepted_renderer', None)
+    return renderer is not None and renderer.format == NDJSONRenderer.format
+
+
+def stream_response(collection, etag=None):
+    """
+    Потоковый NDJSON-ответ: по одному объекту (закешированный to_json()) на строку
+    Объекты читаются из индекса порциями, весь список в памяти не собирается
+    """
+    response = StreamingHttpResponse(_iter_records(collection), content_type=NDJSON_MEDIA_TYPE)
+    response['X-Accel-Buffering'] = 'no'  # не буферизовать поток на прокси
+    if etag is not None:
+        response['ETag'] = etag
+    return response
+
+
+def _iter_records(collection):
+    for item in _iter_items(collection):
+        yield item.to_json() + b'\n'
+
+
+def _iter_items(collection):
+    """Обход коллекции порциями по keyset-индексу (если он есть)"""
+    if not hasattr(collection, 'page'):
+        yield from collection
+        return
+
+    after = None
+    while True:
+        items, after = collection.page(after=after, limit=STREAM_CHUNK_SIZE)
+        yield from items
+        if after is None:
+            return
+
+
+def _encode(data):
+    return encode_json(data) + b'\n'
@@ -4,7 +4,11 @@ from . import views
 urlpatterns = [
     # Товары
     path('products/', views.ProductListView.as_view(), name='product-list'),
+    path('products/batch/', views.ProductBatchView.as_view(), name='product-batch'),
     path('products/<str:product_id>/', views.ProductDetailView.as_view(), name='product-detail'),
+    path('products/<str:product_id>/orders/', views.ProductOrdersView.as_view(), name='product-orders'),
     # Заказы
     path('orders/', views.OrderListView.as_view(), name='order-list'),
+    path('orders/batch/', views.OrderBatchView.as_view(), name='order-batch'),
+    path('orders/stats/', views.OrderStatsView.as_view(), name='order-stats'),
 ]
\ No newline at end of file
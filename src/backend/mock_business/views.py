@@ -1,19 +1,207 @@
+import hashlib
+import math
+
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.views.decorators.gzip import gzip_page
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.exceptions import PermissionDenied, NotFound
+from rest_framework.exceptions import PermissionDenied, NotFound, ParseError
+
+from .models import MockProduct, add_orders, products_db, release_product_orders
+from .store import VersionConflict
+from .pagination import paginate, total_count
+from .search import matches
+from .serialization import EncodedItems, FragmentJSONRenderer
+from .streaming import NDJSONRenderer, wants_stream, stream_response
+from authorization.permissions import ResourceAccessPermission, get_permission_context
+
+
+def item_etag(item):
+    """ETag объекта - его версия в хранилище"""
+    return f'"{item.version}"'
+
+
+def list_etag(request, resource_name, *stores):
+    """
+    Слабый ETag списка: счётчики записей хранилищ + всё, от чего зависит ответ этому клиенту
+    (пользователь, его права на ресурс, query-параметры, формат ответа)
+    Считается без выборки объектов - любая запись в хранилище меняет ETag
+    """
+    key = (
+        tuple(store.version for store in stores),
+        request.user.pk,
+        get_permission_context(request).mask_for(resource_name),
+        request.get_full_path(),
+        request.accepted_renderer.format,
+    )
+    return 'W/"%s"' % hashlib.blake2b(repr(key).encode(), digest_size=12).hexdigest()
+
+
+def not_modified(request, etag):
+    """304 Not Modified, если If-None-Match совпал с etag (None - нужен полный ответ)"""
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response['ETag'] = etag
+    return response
+
+
+def get_expected_version(request):
+    """
+    Версия объекта из заголовка If-Match
+    None - заголовка нет или '*'; нераспознанное значение даёт 0, которое не совпадёт ни с одной версией
+    """
+    header = request.headers.get('If-Match', '').strip()
+    if not header or header == '*':
+        return None
+    try:
+        return int(header.strip('"'))
+    except ValueError:
+        return 0
+
+
+def get_price_param(request, name):
+    """Граница цены из query-параметра (None, если не задана)"""
+    value = request.query_params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        value = float(value)
+    except ValueError:
+        raise ParseError(f"{name} должен быть числом")
+    if value != value or value in (float('inf'), float('-inf')):
+        raise ParseError(f"{name} должен быть числом")
+    return value
+
+
+# Максимальный размер пачки в batch-эндпоинтах
+MAX_BATCH_SIZE = 1000
+
+
+def validate_price(price):
+    """
+    Цена товара: конечное положительное число
+    NaN и бесконечность не пропускаем - они ломают сортированный индекс цен в хранилище
+    """
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        raise ValueError('Цена должна быть положительным числом')
+    if not math.isfinite(price) or price <= 0:
+        raise ValueError('Цена должна быть положительным числом')
+    return price
 
-from .models import MockProduct, products_db
-from authorization.permissions import ResourceAccessPermission
+
+def validate_product(data):
+    """
+    Проверка данных товара: возвращает (name, price)
+    Ошибка валидации - ValueError с текстом для клиента
+    """
+    name = data.get('name')
+    price = data.get('price')
+    if not name or not price:
+        raise ValueError('Поля name и price обязательны')
+    return name, validate_price(price)
+
+
+def validate_order(data):
+    """
+    Проверка данных заказа: возвращает (product_id, quantity), существование товара не проверяется
+    Ошибка валидации - ValueError с текстом для клиента
+    """
+    product_id = data.get('product_id')
+    quantity = data.get('quantity', 1)
+    if not product_id:
+        raise ValueError('product_id обязателен')
+    try:
+        quantity = int(quantity)
+        if quantity <= 0:
+            raise ValueError()
+    except (TypeError, ValueError):
+        raise ValueError('Количество должно быть положительным числом')
+    return product_id, quantity
+
+
+def get_batch(request):
+    """Тело batch-запроса: непустой JSON-массив объектов не длиннее MAX_BATCH_SIZE"""
+    items = request.data
+    if not isinstance(items, list) or not items:
+        raise ParseError("Ожидается непустой массив объектов")
+    if len(items) > MAX_BATCH_SIZE:
+        raise ParseError(f"Не больше {MAX_BATCH_SIZE} объектов за запрос")
+    return items
+
+
+def validate_batch(items, validate):
+    """
+    Проверка всех элементов пачки
+    Возвращает (проверенные данные, ошибки [{'index': номер, 'error': текст}])
+    """
+    valid, errors = [], []
+    for index, data in enumerate(items):
+        try:
+            if not isinstance(data, dict):
+                raise ValueError('Элемент должен быть объектом')
+            valid.append(validate(data))
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+    return valid, errors
+
+
+def precondition_failed():
+    return Response(
+        {'error': 'Объект был изменён другим запросом, получите актуальную версию'},
+        status=status.HTTP_412_PRECONDITION_FAILED
+    )
 
 
+@method_decorator(gzip_page, name='dispatch')
 class ProductListView(APIView):
     """
-    GET /api/mock/products/ список товаров
+    GET /api/mock/products/ список товаров (?limit=&cursor=, поток NDJSON: ?stream=1)
+        ?min_price=&max_price=&ordering=price - диапазон цен и сортировка по цене (индекс цены)
+        ?q= - поиск по названию (префикс слова / подстрока, поисковый индекс)
     POST /api/mock/products/ создание нового товара
+    Список отдаётся со слабым ETag (If-None-Match -> 304 без выборки), большие ответы сжимаются gzip
     """
     permission_classes = [IsAuthenticated]
+    renderer_classes = [FragmentJSONRenderer, NDJSONRenderer]
+    orderings = ('created', 'price')
+
+    def apply_search(self, request, products):
+        """?q= -> только товары, название которых подходит под запрос"""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return products
+        if hasattr(products, 'search'):
+            return products.search('name', query)
+        # Обычный список (например, пустой результат filter_visible) - проверяем по одному
+        return [p for p in products if matches(p.name, query)]
+
+    def apply_price_filter(self, request, products):
+        """?min_price=&max_price=&ordering= -> представление в порядке индекса цены с диапазоном"""
+        ordering = request.query_params.get('ordering')
+        if ordering is not None and ordering not in self.orderings:
+            raise ParseError(f"ordering должен быть одним из: {', '.join(self.orderings)}")
+
+        min_price = get_price_param(request, 'min_price')
+        max_price = get_price_param(request, 'max_price')
+        if min_price is None and max_price is None:
+            if ordering in (None, 'created'):
+                return products
+        elif ordering == 'created':
+            raise ParseError("Фильтр по цене поддерживается только с ordering=price")
+
+        # Диапазон цен выбирается по индексу цены, поэтому и сортировка - по цене
+        if hasattr(products, 'ordered_by'):
+            return products.ordered_by('price', min_price, max_price)
+        # Обычный список (например, пустой результат filter_visible) - фильтруем на месте
+        return [
+            p for p in products
+            if (min_price is None or p.price >= min_price) and (max_price is None or p.price <= max_price)
+        ]
 
     def get(self, request):
         # Проверяем право на чтение товаров
@@ -21,20 +209,31 @@ class ProductListView(APIView):
         if not perm.has_permission(request, self):
             raise PermissionDenied("Нет прав на просмотр товаров")
 
-        # Получаем все товары
-        all_products = list(products_db.values())
+        # Ничего не изменилось с прошлого запроса клиента - не выбираем и не сериализуем
+        etag = list_etag(request, 'products', products_db)
+        cached = not_modified(request, etag)
+        if cached is not None:
+            return cached
 
-        # Фильтруем в зависимости от прав
-        filtered_products = []
-        for product in all_products:
-            # Проверяем право на просмотр КОНКРЕТНОГО товара
-            if perm.has_object_permission(request, self, product):
-                filtered_products.append(product)
+        # Фильтруем в зависимости от прав: одно решение на весь список
+        # (для "только свои" - выборка по индексу владельца, без перебора всех товаров)
+        visible_products = perm.filter_visible(request, products_db.values())
+        # Поиск пересекается с уже отфильтрованными по правам товарами
+        visible_products = self.apply_search(request, visible_products)
+        visible_products = self.apply_price_filter(request, visible_products)
+
+        # Выгрузка целиком - потоком, без сборки списка в памяти
+        if wants_stream(request):
+            return stream_response(visible_products, etag)
+
+        # Отдаём одну страницу: ?limit=&cursor=
+        products, next_url = paginate(request, visible_products)
 
         return Response({
-            'total': len(filtered_products),
-            'products': [p.to_dict() for p in filtered_products]
-        })
+            'total': total_count(visible_products),
+            'products': EncodedItems(products),  # готовый JSON из кеша объектов
+            'next': next_url
+        }, headers={'ETag': etag})
 
     def post(self, request):
         # Проверяем право на создание товаров
@@ -42,41 +241,50 @@ class ProductListView(APIView):
         if not perm.has_permission(request, self):
             raise PermissionDenied("Нет прав на создание товаров")
 
-        # Получаем данные из запроса
-        name = request.data.get('name')
-        price = request.data.get('price')
-
-        if not name or not price:
-            return Response(
-                {'error': 'Поля name и price обязательны'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
+        # Проверяем данные из запроса
         try:
-            price = float(price)
-            if price <= 0:
-                raise ValueError()
-        except ValueError:
-            return Response(
-                {'error': 'Цена должна быть положительным числом'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            name, price = validate_product(request.data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         # Создаём товар
-        product = MockProduct(name, price, request.user)
-        products_db[product.id] = product
+        product = products_db.add(MockProduct(name, price, request.user))
 
         return Response(
             product.to_dict(),
-            status=status.HTTP_201_CREATED
+            status=status.HTTP_201_CREATED,
+            headers={'ETag': item_etag(product)}
         )
 
 
+class ProductBatchView(APIView):
+    """
+    POST /api/mock/products/batch/ создание пачки товаров: [{"name": ..., "price": ...}, ...]
+    Право на создание проверяется один раз, пачка создаётся целиком или не создаётся вовсе;
+    при ошибках - 400 и список ошибок по номерам элементов
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        perm = ResourceAccessPermission('products', 'create')
+        if not perm.has_permission(request, self):
+            raise PermissionDenied("Нет прав на создание товаров")
+
+        valid, errors = validate_batch(get_batch(request), validate_product)
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        products = products_db.add_many(MockProduct(name, price, request.user) for name, price in valid)
+
+        return Response({'created': [p.to_dict() for p in products]}, status=status.HTTP_201_CREATED)
+
+
 class ProductDetailView(APIView):
     """
-    GET /api/mock/products/{id}/ получить товар
-    PUT /api/mock/products/{id}/ обновить товар
-    DELETE /api/mock/products/{id}/ удалить товар
+    GET /api/mock/products/{id}/ получить товар (в ответе ETag с версией)
+    PUT /api/mock/products/{id}/ обновить товар (If-Match: версия -> 412 при конфликте)
+    DELETE /api/mock/products/{id}/ удалить товар (If-Match поддерживается так же),
+        его заказы отменяются или удаляются - см. MOCK_ORDERS_ON_PRODUCT_DELETE
     """
     permission_classes = [IsAuthenticated]
 
@@ -94,7 +302,7 @@ class ProductDetailView(APIView):
         if not perm.has_object_permission(request, self, product):
             raise PermissionDenied("Нет прав на просмотр этого товара")
 
-        return Response(product.to_dict())
+        return Response(product.to_dict(), headers={'ETag': item_etag(product)})
 
     def put(self, request, product_id):
         product = self.get_product(product_id)
@@ -114,18 +322,27 @@ class ProductDetailView(APIView):
         name = request.data.get('name')
         price = request.data.get('price')
 
+        changes = {}
         if name:
-            product.name = name
+            changes['name'] = name
         if price:
             try:
-                product.price = float(price)
-            except ValueError:
+                changes['price'] = validate_price(price)
+            except ValueError as e:
                 return Response(
-                    {'error': 'Цена должна быть числом'},
+                    {'error': str(e)},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-        return Response(product.to_dict())
+        # Изменяем через хранилище (обновятся индексы), с If-Match - только если версия не изменилась
+        try:
+            product = products_db.update(product_id, expected_version=get_expected_version(request), **changes)
+        except KeyError:
+            raise NotFound("Товар не найден")
+        except VersionConflict:
+            return precondition_failed()
+
+        return Response(product.to_dict(), headers={'ETag': item_etag(product)})
 
     def delete(self, request, product_id):
         product = self.get_product(product_id)
@@ -136,17 +353,73 @@ class ProductDetailView(APIView):
             raise PermissionDenied("Нет прав на удаление этого товара")
 
         # Удаляем товар
-        del products_db[product_id]
+        try:
+            products_db.delete(product_id, expected_version=get_expected_version(request))
+        except KeyError:
+            raise NotFound("Товар не найден")
+        except VersionConflict:
+            return precondition_failed()
+
+        # Заказы удалённого товара не остаются висеть на несуществующем product_id
+        orders_affected = release_product_orders(product_id)
 
-        return Response({'message': 'Товар удалён'}, status=status.HTTP_200_OK)
+        return Response(
+            {'message': 'Товар удалён', 'orders_affected': orders_affected},
+            status=status.HTTP_200_OK
+        )
 
 
+@method_decorator(gzip_page, name='dispatch')
+class ProductOrdersView(APIView):
+    """
+    GET /api/mock/products/{id}/orders/ заказы товара (?limit=&cursor=, поток NDJSON: ?stream=1)
+    Выборка по индексу product_id заказов, видны только заказы, доступные по правам на orders
+    ETag и gzip - как у списка товаров
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [FragmentJSONRenderer, NDJSONRenderer]
+
+    def get(self, request, product_id):
+        from .models import orders_db
+
+        product = products_db.get(product_id)
+        if not product:
+            raise NotFound("Товар не найден")
+        if not ResourceAccessPermission('products', 'read').has_object_permission(request, self, product):
+            raise PermissionDenied("Нет прав на просмотр этого товара")
+
+        perm = ResourceAccessPermission('orders', 'read')
+        if not perm.has_permission(request, self):
+            raise PermissionDenied("Нет прав на просмотр заказов")
+
+        etag = list_etag(request, 'orders', products_db, orders_db)
+        cached = not_modified(request, etag)
+        if cached is not None:
+            return cached
+
+        visible_orders = perm.filter_visible(request, orders_db.filter_by('product_id', product_id))
+
+        if wants_stream(request):
+            return stream_response(visible_orders, etag)
+
+        orders, next_url = paginate(request, visible_orders)
+
+        return Response({
+            'total': total_count(visible_orders),
+            'orders': EncodedItems(orders),
+            'next': next_url
+        }, headers={'ETag': etag})
+
+
+@method_decorator(gzip_page, name='dispatch')
 class OrderListView(APIView):
     """
-    GET /api/mock/orders/ список заказов
+    GET /api/mock/orders/ список заказов (?limit=&cursor=, поток NDJSON: ?stream=1)
     POST /api/mock/orders/ создание заказа
+    ETag и gzip - как у списка товаров
     """
     permission_classes = [IsAuthenticated]
+    renderer_classes = [FragmentJSONRenderer, NDJSONRenderer]
 
     def get(self, request):
         from .models import orders_db
@@ -157,35 +430,39 @@ class OrderListView(APIView):
         if not perm.has_permission(request, self):
             raise PermissionDenied("Нет прав на просмотр заказов")
 
-        all_orders = list(orders_db.values())
+        etag = list_etag(request, 'orders', orders_db)
+        cached = not_modified(request, etag)
+        if cached is not None:
+            return cached
 
         # Фильтруем
-        filtered_orders = []
-        for order in all_orders:
-            if perm.has_object_permission(request, self, order):
-                filtered_orders.append(order)
+        visible_orders = perm.filter_visible(request, orders_db.values())
+
+        # Выгрузка целиком - потоком, без сборки списка в памяти
+        if wants_stream(request):
+            return stream_response(visible_orders, etag)
+
+        # Отдаём одну страницу: ?limit=&cursor=
+        orders, next_url = paginate(request, visible_orders)
 
         return Response({
-            'total': len(filtered_orders),
-            'orders': [o.to_dict() for o in filtered_orders]
-        })
+            'total': total_count(visible_orders),
+            'orders': EncodedItems(orders),
+            'next': next_url
+        }, headers={'ETag': etag})
 
     def post(self, request):
-        from .models import MockOrder, orders_db, products_db
+        from .models import MockOrder, products_db
 
         # Проверяем право на создание заказов
         perm = ResourceAccessPermission('orders', 'create')
         if not perm.has_permission(request, self):
             raise PermissionDenied("Нет прав на создание заказов")
 
-        product_id = request.data.get('product_id')
-        quantity = request.data.get('quantity', 1)
-
-        if not product_id:
-            return Response(
-                {'error': 'product_id обязателен'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        try:
+            product_id, quantity = validate_order(request.data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         # Проверяем, что товар существует
         if product_id not in products_db:
@@ -194,18 +471,89 @@ class OrderListView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        try:
-            quantity = int(quantity)
-            if quantity <= 0:
-                raise ValueError()
-        except ValueError:
+        # Создаём заказ (товар проверяется ещё раз после записи - его могли удалить параллельно)
+        orders, missing = add_orders([MockOrder(product_id, quantity, request.user)])
+        if missing:
             return Response(
-                {'error': 'Количество должно быть положительным числом'},
-                status=status.HTTP_400_BAD_REQUEST
+                {'error': 'Товар не найден'},
+                status=status.HTTP_404_NOT_FOUND
             )
 
-        # Создаём заказ
-        order = MockOrder(product_id, quantity, request.user)
-        orders_db[order.id] = order
+        return Response(orders[0].to_dict(), status=status.HTTP_201_CREATED)
+
+
+class OrderBatchView(APIView):
+    """
+    POST /api/mock/orders/batch/ создание пачки заказов: [{"product_id": ..., "quantity": ...}, ...]
+    Право на создание проверяется один раз, пачка создаётся целиком или не создаётся вовсе;
+    при ошибках - 400 и список ошибок по номерам элементов
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        from .models import MockOrder
+
+        perm = ResourceAccessPermission('orders', 'create')
+        if not perm.has_permission(request, self):
+            raise PermissionDenied("Нет прав на создание заказов")
+
+        def validate(data):
+            product_id, quantity = validate_order(data)
+            if product_id not in products_db:
+                raise ValueError('Товар не найден')
+            return product_id, quantity
+
+        valid, errors = validate_batch(get_batch(request), validate)
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        orders, missing = add_orders(
+            MockOrder(product_id, quantity, request.user) for product_id, quantity in valid
+        )
+        if missing:
+            # Товар удалили, пока создавалась пачка
+            errors = [
+                {'index': index, 'error': 'Товар не найден'}
+                for index, (product_id, _) in enumerate(valid) if product_id in missing
+            ]
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'created': [o.to_dict() for o in orders]}, status=status.HTTP_201_CREATED)
+
+
+class OrderStatsView(APIView):
+    """
+    GET /api/mock/orders/stats/ агрегаты заказов: число заказов и сумма quantity, всего и по статусам
+        ?owner_id= - по владельцу (по умолчанию - текущий пользователь, чужой - только с правом read_all)
+        ?product_id= - по товару (только с правом read_all: в агрегат входят заказы всех пользователей)
+    Агрегаты ведутся хранилищем при каждой записи, чтение не перебирает заказы
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        from .models import orders_db
+
+        perm = ResourceAccessPermission('orders', 'read')
+        if not perm.has_permission(request, self):
+            raise PermissionDenied("Нет прав на просмотр заказов")
+        full_access = perm.has_full_access(request)
+
+        product_id = request.query_params.get('product_id')
+        owner_id = request.query_params.get('owner_id')
+        result = {}
+
+        if product_id:
+            if not full_access:
+                raise PermissionDenied("Нет прав на просмотр заказов других пользователей")
+            result['product'] = {'id': product_id, **orders_db.aggregate('product_id', product_id)}
+
+        if owner_id or not product_id:
+            try:
+                owner_id = int(owner_id) if owner_id else request.user.pk
+            except ValueError:
+                raise ParseError("owner_id должен быть числом")
+            if owner_id != request.user.pk and not full_access:
+                raise PermissionDenied("Нет прав на просмотр заказов других пользователей")
+            result['owner'] = {'id': owner_id, **orders_db.aggregate('owner_id', owner_id)}
 
-        return Response(order.to_dict(), status=status.HTTP_201_CREATED)
\ No newline at end of file
+        return Response(result)
@@ -0,0 +1,28 @@
+import pytest
+from authentication.throttling import reset_throttles
+from authentication.user_cache import user_cache
+from authorization.access_matrix import drop_local_access_matrix
+
+
+@pytest.fixture(autouse=True)
+def reset_access_matrix():
+    """Сбрасываем матрицу прав между тестами (откат транзакции не вызывает сигналы)"""
+    drop_local_access_matrix()
+    yield
+    drop_local_access_matrix()
+
+
+@pytest.fixture(autouse=True)
+def reset_login_throttles():
+    """Счётчики лимитов login/register живут в процессе - каждый тест начинает с чистых"""
+    reset_throttles()
+    yield
+    reset_throttles()
+
+
+@pytest.fixture(autouse=True)
+def reset_user_cache():
+    """Кеш пользователей живёт в процессе - каждый тест начинает с пустого"""
+    user_cache.clear()
+    yield
+    user_cache.clear()
@@ -1,8 +1,23 @@
+import json
+import threading
 import pytest
+from io import StringIO
+from asgiref.sync import async_to_sync
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory
 from rest_framework.test import APIClient
 from django.urls import reverse
 
+from authentication import async_views, hashers, views
+from authentication.tokens import CachedJWTAuthentication
+from authentication.throttling import CacheBuckets, LocalBuckets
+from authentication.password_pool import PasswordPool
+from authentication.user_cache import VERSION_CACHE_KEY, user_cache
+
 User = get_user_model()
 
 
@@ -147,6 +162,209 @@ class TestAuthentication:
         assert response.data['email'] == 'profile@example.ru'
         assert response.data['first_name'] == 'Профиль'
 
+    def test_login_rehashes_password_with_new_cost(self, settings):
+        """После смены AUTH_BCRYPT_ROUNDS хеш пересчитывается при входе, остальные поля не сохраняются"""
+        user = User.objects.create_user(email='rehash@example.ru', password='TestPass123')
+        assert user.password.startswith('$2b$04$')
+        updated_at = user.updated_at
+
+        settings.AUTH_BCRYPT_ROUNDS = 5
+        client = APIClient()
+        response = client.post(reverse('login'), {'email': 'rehash@example.ru', 'password': 'TestPass123'},
+                               format='json')
+        assert response.status_code == 200
+
+        user.refresh_from_db()
+        assert user.password.startswith('$2b$05$')
+        assert user.check_password('TestPass123')
+        assert user.updated_at == updated_at  # update_fields=['password']
+        assert not user.password_needs_rehash()
+
+    @pytest.mark.parametrize('hasher', [hashers.BcryptHasher(), hashers.ScryptHasher(), hashers.PBKDF2Hasher()])
+    def test_hashers(self, hasher):
+        encoded = hasher.encode('TestPass123')
+        assert hashers.identify_hasher(encoded).algorithm == hasher.algorithm
+        assert hashers.check_password('TestPass123', encoded)
+        assert not hashers.check_password('TestPass124', encoded)
+        assert not hasher.needs_rehash(encoded)
+        assert hasher.encode('TestPass123') != encoded  # своя соль у каждого хеша
+        # Повреждённый или неизвестный хеш не проходит проверку, а не роняет вход
+        assert not hashers.check_password('TestPass123', encoded[:-4])
+        assert not hashers.check_password('TestPass123', 'md5$abc$def')
+
+    def test_login_migrates_hash_to_primary_hasher(self, settings):
+        """Старые bcrypt-хеши проверяются по-прежнему и при входе переводятся на основной хешер"""
+        user = User.objects.create_user(email='migrate@example.ru', password='TestPass123')
+        assert user.password.startswith('$2b$')
+
+        settings.AUTH_PASSWORD_HASHERS = [
+            'authentication.hashers.ScryptHasher',
+            'authentication.hashers.BcryptHasher',
+        ]
+        user.refresh_from_db()
+        assert user.password_needs_rehash()
+
+        client = APIClient()
+        data = {'email': 'migrate@example.ru', 'password': 'TestPass123'}
+        assert client.post(reverse('login'), data, format='json').status_code == 200
+        user.refresh_from_db()
+        assert user.password.startswith('scrypt$1024$8$1$')
+        assert client.post(reverse('login'), data, format='json').status_code == 200
+
+        settings.AUTH_SCRYPT_N = 2 ** 11
+        assert user.password_needs_rehash()
+
+    def test_calibrate_bcrypt_command(self):
+        out = StringIO()
+        call_command('calibrate_bcrypt', target_ms=20, samples=1, stdout=out)
+        output = out.getvalue()
+        assert 'rounds= 4' in output
+        assert 'AUTH_BCRYPT_ROUNDS = ' in output
+
+    def test_login_throttled_per_account_and_ip(self, settings):
+        """Сверх лимита вход отклоняется с 429 до запроса к БД и проверки пароля"""
+        settings.AUTH_THROTTLE_RATES = {'login_ip': '5/min', 'login_email': '3/min'}
+        User.objects.create_user(email='victim@example.ru', password='TestPass123')
+        client = APIClient()
+        url = reverse('login')
+
+        for _ in range(3):
+            response = client.post(url, {'email': 'Victim@example.ru', 'password': 'Wrong123'}, format='json')
+            assert response.status_code == 401
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.post(url, {'email': 'victim@example.ru', 'password': 'TestPass123'}, format='json')
+        assert response.status_code == 429
+        assert int(response['Retry-After']) > 0
+        assert len(ctx.captured_queries) == 0
+
+        # Другой аккаунт - свой лимит, пока не исчерпан лимит IP (5-я попытка с этого адреса)
+        response = client.post(url, {'email': 'other@example.ru', 'password': 'Wrong123'}, format='json')
+        assert response.status_code == 401
+        response = client.post(url, {'email': 'third@example.ru', 'password': 'Wrong123'}, format='json')
+        assert response.status_code == 429
+        response = client.post(url, {'email': 'third@example.ru', 'password': 'Wrong123'}, format='json',
+                               REMOTE_ADDR='10.0.0.2')
+        assert response.status_code == 401
+
+    def test_register_throttled_per_ip(self, settings):
+        settings.AUTH_THROTTLE_RATES = {'register_ip': '1/hour'}
+        client = APIClient()
+        data = {'email': 'reg1@example.ru', 'password': 'TestPass123', 'password_confirm': 'TestPass123'}
+        assert client.post(reverse('register'), data, format='json').status_code == 201
+        data['email'] = 'reg2@example.ru'
+        assert client.post(reverse('register'), data, format='json').status_code == 429
+        assert not User.objects.filter(email='reg2@example.ru').exists()
+
+    def test_throttle_buckets(self, settings):
+        buckets = LocalBuckets(shards=2, max_keys=4)
+        assert [buckets.take('a', 2, 60) for _ in range(2)] == [0, 0]
+        assert 29 < buckets.take('a', 2, 60) <= 30  # токен восполняется за period / limit
+        for key in 'bcdef':
+            buckets.take(key, 2, 60)
+        assert sum(len(shard) for _, shard in buckets._shards) <= 4  # старые ключи вытеснены
+
+        settings.CACHES = {'throttle': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared = CacheBuckets('throttle')
+        assert [shared.take('login_email:a@b.ru', 2, 60) for _ in range(2)] == [0, 0]
+        assert 0 < shared.take('login_email:a@b.ru', 2, 60) <= 60
+
+    def test_profile_etag(self):
+        """Профиль с If-None-Match отдаёт 304, пока пользователь не изменился; PUT/DELETE ETag не проверяют"""
+        user = User.objects.create_user(email='etag@example.ru', password='TestPass123')
+
+        client = APIClient()
+        client.force_authenticate(user=user)
+        url = reverse('profile')
+
+        etag = client.get(url)['ETag']
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response.content == b''
+
+        # Условия только для чтения: клиент, вернувший полученный ETag в If-Match, не получает 412
+        response = client.put(url, {'first_name': 'Новое'}, format='json', HTTP_IF_MATCH=etag)
+        assert response.status_code == 200
+        assert 'ETag' not in response
+        user.refresh_from_db()
+        client.force_authenticate(user=user)
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response.data['first_name'] == 'Новое'
+        assert response['ETag'] != etag
+
+    def test_profile_with_token_checks_db(self):
+        """Профиль по JWT проверяет пользователя по БД: после DELETE тот же токен больше не работает"""
+        User.objects.create_user(email='token@example.ru', password='TestPass123', first_name='Токен')
+
+        client = APIClient()
+        response = client.post(reverse('login'), {'email': 'token@example.ru', 'password': 'TestPass123'},
+                               format='json')
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['tokens']['access']}")
+        url = reverse('profile')
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url)
+        assert response.data['first_name'] == 'Токен'
+        assert len([q for q in ctx.captured_queries if 'FROM "users"' in q['sql']]) == 1
+
+        response = client.put(url, {'first_name': 'Новое'}, format='json')
+        assert response.data['first_name'] == 'Новое'
+        assert User.objects.get(email='token@example.ru').first_name == 'Новое'
+
+        assert client.delete(url).status_code == 200
+        assert not User.objects.get(email='token@example.ru').is_active
+        assert client.get(url).status_code == 401
+
+    def test_cached_token_authentication(self, settings, monkeypatch):
+        """Кеш пользователей: повтор без запроса к БД, сохранение сбрасывает запись, версия - деактивацию"""
+        # DEFAULT_AUTHENTICATION_CLASSES читается при импорте представлений
+        monkeypatch.setattr(views.profile.cls, 'authentication_classes', [CachedJWTAuthentication])
+        user = User.objects.create_user(email='cached@example.ru', password='TestPass123')
+
+        client = APIClient()
+        response = client.post(reverse('login'), {'email': 'cached@example.ru', 'password': 'TestPass123'},
+                               format='json')
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['tokens']['access']}")
+        url = reverse('profile')
+
+        assert client.get(url).status_code == 200
+        with CaptureQueriesContext(connection) as ctx:
+            assert client.get(url).status_code == 200
+        assert ctx.captured_queries == []
+        assert (user_cache.hits, user_cache.misses) == (1, 1)
+
+        # PUT профиля сохраняет пользователя - следующий запрос читает его из БД
+        client.put(url, {'first_name': 'Новое'}, format='json')
+        assert client.get(url).data['first_name'] == 'Новое'
+        assert user_cache.stats()['misses'] == 2
+
+        # Деактивация в другом воркере: до сверки версии действует копия из кеша
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        assert client.get(url).status_code == 200
+        cache.incr(VERSION_CACHE_KEY)  # так другой воркер сообщает о сохранении после коммита
+        settings.AUTH_USER_CACHE_CHECK_INTERVAL = 0
+        assert client.get(url).status_code == 401
+
+    def test_user_cache_version_only_for_auth_changes(self, settings, django_capture_on_commit_callbacks):
+        """Регистрация и перехеширование при входе не сбрасывают кеш других воркеров, деактивация - сбрасывает"""
+        version = cache.get(VERSION_CACHE_KEY)
+        client = APIClient()
+        with django_capture_on_commit_callbacks(execute=True):
+            client.post(reverse('register'), {
+                'email': 'version@example.ru', 'password': 'TestPass123', 'password_confirm': 'TestPass123',
+                'first_name': 'Версия', 'last_name': 'Тест',
+            }, format='json')
+        settings.AUTH_BCRYPT_ROUNDS = 5
+        with django_capture_on_commit_callbacks(execute=True):
+            client.post(reverse('login'), {'email': 'version@example.ru', 'password': 'TestPass123'}, format='json')
+        user = User.objects.get(email='version@example.ru')
+        assert user.password.startswith('$2b$05$')
+        assert cache.get(VERSION_CACHE_KEY) == version
+
+        with django_capture_on_commit_callbacks(execute=True):
+            user.soft_delete()
+        assert cache.get(VERSION_CACHE_KEY) != version
+
     def test_profile_get_unauthenticated(self):
         """Ошибка при получении профиля без авторизации"""
         client = APIClient()
@@ -154,3 +372,64 @@ class TestAuthentication:
         response = client.get(url)
 
         assert response.status_code == 401
+
+
+@pytest.mark.django_db
+class TestAsyncAuthentication:
+    """Async-версии login/register (ASGI): bcrypt в ограниченном пуле потоков"""
+
+    def call(self, view, data):
+        request = RequestFactory().post('/', json.dumps(data), content_type='application/json')
+        response = async_to_sync(view)(request)
+        return response.status_code, json.loads(response.content)
+
+    def test_register_and_login(self):
+        code, body = self.call(async_views.register, {
+            'email': 'async@example.ru', 'first_name': 'Асинк',
+            'password': 'TestPass123', 'password_confirm': 'TestPass123'
+        })
+        assert code == 201
+        assert body['user']['first_name'] == 'Асинк'
+        assert User.objects.get(email='async@example.ru').check_password('TestPass123')
+
+        code, body = self.call(async_views.login, {'email': 'async@example.ru', 'password': 'TestPass123'})
+        assert code == 200
+        assert 'access' in body['tokens']
+
+        code, _ = self.call(async_views.login, {'email': 'async@example.ru', 'password': 'WrongPass123'})
+        assert code == 401
+        code, body = self.call(async_views.register, {
+            'email': 'async@example.ru', 'password': 'TestPass123', 'password_confirm': 'TestPass123'
+        })
+        assert code == 400 and 'email' in body
+
+    def test_throttled_before_hashing(self, settings, monkeypatch):
+        settings.AUTH_THROTTLE_RATES = {'login_email': '1/min'}
+        User.objects.create_user(email='limited@example.ru', password='TestPass123')
+        data = {'email': 'limited@example.ru', 'password': 'Wrong123'}
+        assert self.call(async_views.login, data)[0] == 401
+
+        def fail(*args):
+            raise AssertionError('пароль не должен проверяться')
+        monkeypatch.setattr(async_views.password_pool, 'submit', fail)
+        code, body = self.call(async_views.login, data)
+        assert code == 429 and 'error' in body
+
+    def test_overload_is_shed_with_503(self, monkeypatch):
+        """Пока единственный поток пула занят, а очереди нет, вход сразу получает 503"""
+        User.objects.create_user(email='busy@example.ru', password='TestPass123')
+        pool = PasswordPool(workers=1, queue_size=0)
+        monkeypatch.setattr(async_views, 'password_pool', pool)
+
+        release = threading.Event()
+        busy = pool.submit(release.wait)
+        try:
+            code, body = self.call(async_views.login, {'email': 'busy@example.ru', 'password': 'TestPass123'})
+            assert code == 503
+            assert 'error' in body
+        finally:
+            release.set()
+        busy.result()
+
+        code, _ = self.call(async_views.login, {'email': 'busy@example.ru', 'password': 'TestPass123'})
+        assert code == 200
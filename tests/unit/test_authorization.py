@@ -2,8 +2,10 @@ import pytest
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient
 from django.urls import reverse
-from authorization.models import Role, UserRole, AccessRule, BusinessResource
+from django.db.models import F
+from authorization.models import AccessMatrixVersion, Role, UserRole, AccessRule, BusinessResource
 from authorization.permissions import ResourceAccessPermission
+from authorization.access_matrix import get_access_matrix, CREATE, READ
 
 User = get_user_model()
 
@@ -135,4 +137,85 @@ class TestAuthorization:
 
         # Не должен иметь доступ на чтение всех
         rules = AccessRule.objects.filter(role=user_role, resource=products_resource)
-        assert not any(r.can_read_all for r in rules)
\ No newline at end of file
+        assert not any(r.can_read_all for r in rules)
+
+    def test_access_matrix_compiles_rules(self, regular_user, create_base_data):
+        """Матрица прав собирается из AccessRule в битовые маски"""
+        AccessRule.objects.create(
+            role=create_base_data['user_role'],
+            resource=create_base_data['products_resource'],
+            can_create=True,
+            can_read=True
+        )
+
+        matrix = get_access_matrix()
+        role_ids = matrix.role_ids_for(regular_user)
+
+        assert role_ids == {create_base_data['user_role'].id}
+        assert matrix.mask_for(role_ids, 'products') == CREATE | READ
+        assert matrix.mask_for(role_ids, 'orders') is None
+
+    def test_access_matrix_reused_and_invalidated(self, regular_user, create_base_data,
+                                                  django_assert_num_queries):
+        """Повторные проверки не ходят в БД, изменение правила сбрасывает матрицу"""
+        rule = AccessRule.objects.create(
+            role=create_base_data['user_role'],
+            resource=create_base_data['products_resource'],
+            can_create=True
+        )
+        perm = ResourceAccessPermission('products', 'create')
+        request = type('Request', (), {'user': regular_user})()
+        assert perm.has_permission(request, None)
+
+        with django_assert_num_queries(0):
+            assert perm.has_permission(request, None)
+
+        # post_save на AccessRule сбрасывает матрицу (новый запрос видит новые права)
+        rule.can_create = False
+        rule.save()
+        request = type('Request', (), {'user': regular_user})()
+        assert not perm.has_permission(request, None)
+
+    def test_access_matrix_version_shared_through_db(self, regular_user, admin_user, create_base_data, settings):
+        """Изменение в другом воркере видно по версии в БД; кеш ролей ограничен по размеру"""
+        settings.ACCESS_MATRIX_CHECK_INTERVAL = 0
+        settings.ACCESS_MATRIX_MAX_USERS = 1
+        matrix = get_access_matrix()
+        assert get_access_matrix() is matrix
+
+        # Другой воркер увеличил версию в своей транзакции - без сигналов в этом процессе
+        AccessMatrixVersion.objects.filter(pk=1).update(version=F('version') + 1)
+        rebuilt = get_access_matrix()
+        assert rebuilt is not matrix and rebuilt.version == matrix.version + 1
+
+        rebuilt.role_ids_for(regular_user)
+        rebuilt.role_ids_for(admin_user)
+        assert list(rebuilt._user_roles) == [admin_user.pk]
+
+    def test_filter_visible(self, admin_user, regular_user, create_base_data):
+        """filter_visible отдаёт всё при *_all и только свои объекты при праве на свои"""
+        AccessRule.objects.create(
+            role=create_base_data['user_role'],
+            resource=create_base_data['products_resource'],
+            can_read=True
+        )
+        AccessRule.objects.create(
+            role=create_base_data['admin_role'],
+            resource=create_base_data['products_resource'],
+            can_read=True,
+            can_read_all=True
+        )
+        Item = type('Item', (), {})
+        items = []
+        for owner in (admin_user, regular_user, admin_user):
+            item = Item()
+            item.owner = owner
+            items.append(item)
+
+        perm = ResourceAccessPermission('products', 'read')
+        admin_request = type('Request', (), {'user': admin_user})()
+        user_request = type('Request', (), {'user': regular_user})()
+
+        assert perm.filter_visible(admin_request, items) == items
+        assert perm.filter_visible(user_request, items) == [items[1]]
+        assert ResourceAccessPermission('orders', 'read').filter_visible(user_request, items) == []
@@ -1,9 +1,30 @@
+import gzip
+import json
+import re
+import sqlite3
+import threading
+import time
 import pytest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from django.contrib import admin
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
 from rest_framework.test import APIClient
 from django.urls import reverse
-from mock_business.models import MockProduct, products_db
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from mock_business import models as mock_models, views as mock_views
+from mock_business.admin import ProductAdmin
+from mock_business.models import MockProduct, MockOrder, Product, Order, StoreVersion, products_db, orders_db
+from mock_business.orm_store import ORMStore
+from mock_business.store import MockStore, VersionConflict, created_key, dump_item
+from mock_business.sqlite_store import SQLiteStore
+from mock_business.persistence import StoreJournal
+from mock_business.aggregates import GroupAggregates
+from mock_business.ids import IdAllocator, claim_worker_slot, id_timestamp_ms
 from authorization.models import Role, UserRole, AccessRule, BusinessResource
+from authentication.tokens import ClaimsJWTAuthentication
 
 User = get_user_model()
 
@@ -149,3 +170,812 @@ class TestMockBusiness:
         assert response.status_code == 201
         assert response.data['name'] == 'New Product'
         assert response.data['owner'] == regular_user.email
+
+    @pytest.mark.parametrize('price', ['nan', 'inf', '-inf', -5, 'abc'])
+    def test_product_price_must_be_finite_and_positive(self, regular_user, price):
+        """NaN, бесконечность и неположительная цена отклоняются и при создании, и при изменении"""
+        products_db.clear()
+        product = products_db.add(MockProduct("My Product", 500, regular_user))
+
+        client = APIClient()
+        client.force_authenticate(user=regular_user)
+
+        response = client.post(reverse('product-list'), {'name': 'Bad', 'price': price}, format='json')
+        assert response.status_code == 400
+        response = client.put(reverse('product-detail', args=[product.id]), {'price': price}, format='json')
+        assert response.status_code == 400
+        assert [p.price for p in products_db.values()] == [500]
+
+    def test_product_list_query_count_constant(self, regular_user, admin_user):
+        """Число запросов к БД при выводе списка не зависит от размера хранилища"""
+        products_db.clear()
+
+        client = APIClient()
+        client.force_authenticate(user=regular_user)
+        url = reverse('product-list')
+
+        def add_products(count):
+            for i in range(count):
+                for owner in (regular_user, admin_user):
+                    product = MockProduct(f"Product {i}", 100 + i, owner)
+                    products_db[product.id] = product
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                response = client.get(url)
+            assert response.status_code == 200
+            return len(ctx.captured_queries), response.data['total']
+
+        add_products(5)
+        client.get(url)  # прогрев матрицы прав
+        small_queries, small_total = count_queries()
+
+        add_products(50)
+        large_queries, large_total = count_queries()
+
+        assert (small_total, large_total) == (5, 55)
+        assert large_queries == small_queries
+
+    def test_product_list_cursor_pagination(self, regular_user, admin_user):
+        """Список отдаётся страницами, next-ссылки обходят все товары без повторов"""
+        products_db.clear()
+        for i in range(7):
+            products_db.add(MockProduct(f"Product {i}", 100 + i, regular_user))
+        products_db.add(MockProduct("Admin Product", 100, admin_user))
+
+        client = APIClient()
+        client.force_authenticate(user=regular_user)
+
+        seen = []
+        url = reverse('product-list') + '?limit=3'
+        while url:
+            response = client.get(url)
+            assert response.status_code == 200
+            assert response.data['total'] == 7
+            assert len(response.data['products']) <= 3
+            seen.extend(p['id'] for p in response.data['products'])
+            url = response.data['next']
+
+        expected = [p.id for p in sorted(products_db.owned_by(regular_user.pk), key=created_key)]
+        assert seen == expected
+
+        # Тело ответа, склеенное из закешированных фрагментов, - обычный JSON
+        body = json.loads(client.get(reverse('product-list') + '?limit=3').content)
+        assert body['total'] == 7
+        assert body['products'][0] == products_db[expected[0]].to_dict()
+        assert body['next'].startswith('http')
+
+        response = client.get(reverse('product-list') + '?cursor=broken')
+        assert response.status_code == 400
+
+    def test_product_batch_create(self, regular_user):
+        """Пачка товаров создаётся целиком, ошибка в любом элементе отклоняет всю пачку"""
+        products_db.clear()
+        client = APIClient()
+        client.force_authenticate(user=regular_user)
+        url = reverse('product-batch')
+
+        response = client.post(url, [
+            {'name': 'Ok', 'price': 10},
+            {'name': 'Free', 'price': 0},
+            {'price': 5},
+            'junk',
+        ], format='json')
+        assert response.status_code == 400
+        assert [e['index'] for e in response.data['errors']] == [1, 2, 3]
+        assert len(products_db) == 0
+
+        batch = [{'name': f'Product {i}', 'price': 10 + i} for i in range(50)]
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.post(url, batch, format='json')
+        assert response.status_code == 201
+        assert [p['name'] for p in response.data['created']] == [p['name'] for p in batch]
+        assert len(products_db.owned_by(regular_user.pk)) == 50
+        assert len(ctx.captured_queries) <= 3  # права проверяются один раз на всю пачку
+
+        assert client.post(url, {'name': 'Not a list'}, format='json').status_code == 400
+
+    @pytest.fixture
+    def orders_rules(self, create_roles_and_resources):
+        """Права на заказы: user - создание и свои, admin - все"""
+        orders_resource = BusinessResource.objects.create(name='orders')
+        AccessRule.objects.create(
+            role=create_roles_and_resources['user_role'], resource=orders_resource,
+            can_create=True, can_read=True
+        )
+        AccessRule.objects.create(
+            role=create_roles_and_resources['admin_role'], resource=orders_resource,
+            can_create=True, can_read=True, can_read_all=True
+        )
+
+    def test_order_batch_create(self, regular_user, orders_rules):
+        """Пачка заказов: несуществующий товар указывается по номеру элемента"""
+        products_db.clear()
+        orders_db.clear()
+        product = products_db.add(MockProduct("Product", 100, regular_user))
+
+        client = APIClient()
+        client.force_authenticate(user=regular_user)
+        url = reverse('order-batch')
+
+        response = client.post(url, [
+            {'product_id': product.id, 'quantity': 2},
+            {'product_id': 'missing'},
+        ], format='json')
+        assert response.status_code == 400
+        assert response.data['errors'] == [{'index': 1, 'error': 'Товар не найден'}]
+        assert len(orders_db) == 0
+
+        response = client.post(url, [{'product_id': product.id, 'quantity': q} for q in (1, 2, 3)], format='json')
+        assert response.status_code == 201
+        assert sorted(o['quantity'] for o in response.data['created']) == [1, 2, 3]
+        assert len(orders_db) == 3
+
+    def test_order_create_races_product_delete(self, regular_user, orders_rules, monkeypatch):
+        """Товар удалён между проверкой и записью заказа: заказ не остаётся на удалённом товаре"""
+        products_db.clear()
+        orders_db.clear()
+        product = products_db.add(MockProduct("Product", 100, regular_user))
+        add_many = orders_db.add_many
+
+        def delete_product_first(items):
+            products_db.delete(product.id)
+            return add_many(items)
+
+        monkeypatch.setattr(orders_db, 'add_many', delete_product_first)
+        client = APIClient()
+        client.force_authenticate(user=regular_user)
+
+        response = client.post(reverse('order-list'), {'product_id': product.id, 'quantity': 1}, format='json')
+        assert response.status_code == 404
+        assert len(orders_db) == 0
+
+        products_db.add(product)
+        response = client.post(reverse('order-batch'), [{'product_id': product.id, 'quantity': 2}], format='json')
+        assert response.status_code == 400
+        assert response.data['errors'] == [{'index': 0, 'error': 'Товар не найден'}]
+        assert len(orders_db) == 0
+
+    def test_order_stats(self, regular_user, admin_user, orders_rules):
+        """Агрегаты заказов по товару и владельцу следуют за созданием, сменой статуса и удалением"""
+        products_db.clear()
+        orders_db.clear()
+        product = products_db.add(MockProduct("Product", 100, admin_user))
+        orders = [orders_db.add(MockOrder(product.id, q, regular_user)) for q in (1, 2, 3)]
+        orders_db.add(MockOrder(product.id, 10, admin_user))
+        orders_db.update(orders[0].id, status='completed')
+        orders_db.delete(orders[1].id)
+
+        client = APIClient()
+        client.force_authenticate(user=regular_user)
+        url = reverse('order-stats')
+
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.data['owner'] == {
+            'id': regular_user.pk, 'count': 2, 'quantity': 4,
+            'by_status': {'completed': {'count': 1, 'quantity': 1}, 'pending': {'count': 1, 'quantity': 3}},
+        }
+        assert client.get(url + f'?product_id={product.id}').status_code == 403
+        assert client.get(url + f'?owner_id={admin_user.pk}').status_code == 403
+
+        client.force_authenticate(user=admin_user)
+        response = client.get(url + f'?product_id={product.id}')
+        assert response.status_code == 200
+        assert 'owner' not in response.data
+        assert (response.data['product']['count'], response.data['product']['quantity']) == (3, 14)
+        assert response.data['product']['by_status']['pending'] == {'count': 2, 'quantity': 13}
+
+    def test_product_orders_and_cascade(self, regular_user, admin_user, orders_rules):
+        """Заказы товара выбираются по индексу, при удалении товара незавершённые заказы отменяются"""
+        products_db.clear()
+        orders_db.clear()
+        product = products_db.add(MockProduct("Product", 100, regular_user))
+        other = products_db.add(MockProduct("Other", 100, regular_user))
+        own = [orders_db.add(MockOrder(product.id, q, regular_user)) for q in (1, 2)]
+        orders_db.add(MockOrder(product.id, 5, admin_user))
+        orders_db.add(MockOrder(other.id, 1, regular_user))
+        orders_db.update(own[1].id, status='completed')
+
+        client = APIClient()
+        client.force_authenticate(user=regular_user)
+
+        response = client.get(reverse('product-orders', args=[product.id]))
+        assert response.status_code == 200
+        assert response.data['total'] == 2  # заказ админа не виден
+        assert {o['id'] for o in response.data['orders']} == {o.id for o in own}
+
+        response = client.delete(reverse('product-detail', args=[product.id]))
+        assert response.status_code == 200
+        assert response.data['orders_affected'] == 2  # pending-заказы, включая чужой
+        statuses = sorted(o.status for o in orders_db.filter_by('product_id', product.id))
+        assert statuses == ['cancelled', 'cancelled', 'completed']
+        assert [o.status for o in orders_db.filter_by('product_id', other.id)] == ['pending']
+
+        assert client.get(reverse('product-orders', args=[product.id])).status_code == 404
+
+    def test_product_list_price_range(self, regular_user, admin_user):
+        """?min_price=&max_price= отдаёт видимые товары из диапазона по возрастанию цены"""
+        products_db.clear()
+        for price in (50, 300, 100, 250, 100, 400):
+            products_db.add(MockProduct(f"Product {price}", price, regular_user))
+        products_db.add(MockProduct("Admin Product", 200, admin_user))
+
+        client = APIClient()
+        client.force_authenticate(user=regular_user)
+
+        prices = []
+        url = reverse('product-list') + '?min_price=100&max_price=300&limit=2'
+        while url:
+            response = client.get(url)
+            assert response.status_code == 200
+            assert response.data['total'] == 4
+            prices.extend(p['price'] for p in response.data['products'])
+            url = response.data['next']
+        assert prices == [100.0, 100.0, 250.0, 300.0]
+
+        response = client.get(reverse('product-list') + '?ordering=price')
+        assert [p['price'] for p in response.data['products']] == [50.0, 100.0, 100.0, 250.0, 300.0, 400.0]
+
+        for query in ('?min_price=abc', '?ordering=name', '?ordering=created&min_price=1'):
+            assert client.get(reverse('product-list') + query).status_code == 400
+
+    def test_product_list_search(self, regular_user, admin_user):
+        """?q= ищет по префиксу слова и подстроке названия только среди видимых товаров"""
+        products_db.clear()
+        for name in ("Red Apple", "Green apple juice", "Pineapple", "Банан", "Apricot"):
+            products_db.add(MockProduct(name, 100, regular_user))
+        products_db.add(MockProduct("Admin Apple", 100, admin_user))
+
+        client = APIClient()
+        client.force_authenticate(user=regular_user)
+
+        def names(query):
+            response = client.get(reverse('product-list') + query)
+            assert response.status_code == 200
+            return sorted(p['name'] for p in response.data['products'])
+
+        assert names('?q=apple') == ["Green apple juice", "Pineapple", "Red Apple"]
+        assert names('?q=ap') == ["Apricot", "Green apple juice", "Red Apple"]  # префикс слова
+        assert names('?q=APPLE+ju') == ["Green apple juice"]
+        assert names('?q=БАН') == ["Банан"]
+        assert names('?q=pear') == []
+        assert names('?q=apple&max_price=50') == []
+
+    def test_product_list_stream(self, regular_user, admin_user):
+        """Потоковая выгрузка отдаёт все видимые товары построчно в NDJSON"""
+        products_db.clear()
+        own = [products_db.add(MockProduct(f"Product {i}", 100 + i, regular_user)) for i in range(3)]
+        products_db.add(MockProduct("Admin Product", 100, admin_user))
+
+        client = APIClient()
+        client.force_authenticate(user=regular_user)
+
+        for response in (
+            client.get(reverse('product-list') + '?stream=1'),
+            client.get(reverse('product-list'), HTTP_ACCEPT='application/x-ndjson'),
+        ):
+            assert response.status_code == 200
+            assert response['Content-Type'] == 'application/x-ndjson'
+            lines = b''.join(response.streaming_content).splitlines()
+            assert [json.loads(line)['id'] for line in lines] == [p.id for p in sorted(own, key=created_key)]
+
+    def test_product_list_etag_and_gzip(self, regular_user, admin_user):
+        """Список с If-None-Match отдаёт 304, пока хранилище не изменилось; большие ответы сжимаются"""
+        products_db.clear()
+        for i in range(20):
+            products_db.add(MockProduct(f"Product {i}", 100 + i, regular_user))
+
+        client = APIClient()
+        client.force_authenticate(user=regular_user)
+        url = reverse('product-list')
+
+        response = client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        assert response['Content-Encoding'] == 'gzip'
+        assert json.loads(gzip.decompress(response.content))['total'] == 20
+        etag = response['ETag']
+        assert etag.startswith('W/"')
+
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response['ETag'] == etag and response.content == b''
+
+        # ETag зависит от параметров запроса и пользователя
+        assert client.get(url + '?limit=5')['ETag'] != etag
+        admin_client = APIClient()
+        admin_client.force_authenticate(user=admin_user)
+        assert admin_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+        # Любая запись в хранилище (даже чужой товар) меняет ETag
+        products_db.add(MockProduct("Admin Product", 100, admin_user))
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+
+    def test_token_auth_without_user_queries(self, regular_user, admin_user, create_roles_and_resources,
+                                             django_capture_on_commit_callbacks, monkeypatch):
+        """С ClaimsJWTAuthentication пользователь и роли берутся из токена; после смены ролей - из БД"""
+        # DEFAULT_AUTHENTICATION_CLASSES читается при импорте представлений
+        monkeypatch.setattr(mock_views.ProductListView, 'authentication_classes', [ClaimsJWTAuthentication])
+        products_db.clear()
+        products_db.add(MockProduct("Admin Product", 100, admin_user))
+        products_db.add(MockProduct("My Product", 100, regular_user))
+
+        client = APIClient()
+        response = client.post(reverse('login'), {'email': 'user@test.ru', 'password': 'UserPass123'}, format='json')
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['tokens']['access']}")
+        url = reverse('product-list')
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url)
+        assert response.status_code == 200
+        assert response.data['total'] == 1
+        assert ctx.captured_queries == []
+
+        # Новая роль увеличивает версию матрицы прав - роли читаются из БД
+        with django_capture_on_commit_callbacks(execute=True):
+            UserRole.objects.create(user=regular_user, role=create_roles_and_resources['admin_role'])
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url)
+        assert response.data['total'] == 2
+        assert any('user_roles' in query['sql'] for query in ctx.captured_queries)
+
+        # Созданный товар принадлежит пользователю из токена
+        response = client.post(url, {'name': 'New', 'price': 10}, format='json')
+        assert response.status_code == 201
+        assert response.data['owner'] == 'user@test.ru'
+
+    def test_update_with_if_match(self, regular_user):
+        """PUT с устаревшей версией в If-Match отклоняется с 412"""
+        products_db.clear()
+        product = products_db.add(MockProduct("My Product", 500, regular_user))
+
+        client = APIClient()
+        client.force_authenticate(user=regular_user)
+        url = reverse('product-detail', args=[product.id])
+
+        etag = client.get(url)['ETag']
+        response = client.put(url, {'name': 'First'}, format='json', HTTP_IF_MATCH=etag)
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+
+        # Второй писатель со старой версией не затирает изменения
+        response = client.put(url, {'name': 'Second'}, format='json', HTTP_IF_MATCH=etag)
+        assert response.status_code == 412
+        assert products_db[product.id].name == 'First'
+
+    def test_admin_product_delete_releases_orders(self, regular_user, monkeypatch):
+        """Удаление товаров в админке (по одному и пачкой) отменяет их незавершённые заказы"""
+        orders = ORMStore(Order, StoreVersion, aggregates=GroupAggregates(('product_id', 'owner_id')))
+        monkeypatch.setattr(mock_models, 'orders_db', orders)
+        products = ORMStore(Product, StoreVersion)
+        items = [products.add(MockProduct(f"Product {i}", 100, regular_user)) for i in range(3)]
+        placed = [orders.add(MockOrder(item.id, 1, regular_user)) for item in items]
+        model_admin = ProductAdmin(Product, admin.site)
+
+        model_admin.delete_model(None, Product.objects.get(pk=items[0].id))
+        model_admin.delete_queryset(None, Product.objects.filter(pk__in=[items[1].id]))
+
+        assert [orders[order.id].status for order in placed] == ['cancelled', 'cancelled', 'pending']
+        assert list(Product.objects.values_list('pk', flat=True)) == [items[2].id]
+
+    def test_orm_backend(self, regular_user, admin_user, orders_rules, monkeypatch):
+        """С хранилищем на моделях Django права и пагинация - условия в SQL, API отвечает так же"""
+        products = ORMStore(Product, StoreVersion)
+        orders = ORMStore(Order, StoreVersion, aggregates=GroupAggregates(('product_id', 'owner_id')))
+        monkeypatch.setattr(mock_views, 'products_db', products)
+        monkeypatch.setattr(mock_models, 'products_db', products)
+        monkeypatch.setattr(mock_models, 'orders_db', orders)
+
+        version = products.version
+        own = [products.add(MockProduct(f"Product {i}", 100 + i, regular_user)) for i in range(5)]
+        products.add(MockProduct("Admin Product", 100, admin_user))
+        assert products.version == version + 6
+
+        client = APIClient()
+        client.force_authenticate(user=regular_user)
+
+        seen, url = [], reverse('product-list') + '?limit=2'
+        with CaptureQueriesContext(connection) as ctx:
+            while url:
+                response = client.get(url)
+                assert response.status_code == 200
+                assert response.data['total'] == 5
+                seen.extend(p['id'] for p in response.data['products'])
+                url = response.data['next']
+        assert seen == [p.id for p in sorted(own, key=created_key)]
+        # Фильтр "только свои" и keyset-условие - в запросе, а не перебором в Python
+        page_queries = [q['sql'] for q in ctx.captured_queries if 'FROM "products"' in q['sql']]
+        assert page_queries and all('"products"."owner_id" =' in sql for sql in page_queries)
+
+        response = client.get(reverse('product-list') + '?min_price=102&q=product')
+        assert [p['price'] for p in response.data['products']] == [102.0, 103.0, 104.0]
+
+        response = client.put(
+            reverse('product-detail', args=[own[0].id]), {'name': 'Renamed'}, format='json', HTTP_IF_MATCH='"1"'
+        )
+        assert response.status_code == 200
+        assert response['ETag'] == '"2"'
+        assert client.put(
+            reverse('product-detail', args=[own[0].id]), {'name': 'Stale'}, format='json', HTTP_IF_MATCH='"1"'
+        ).status_code == 412
+
+        response = client.post(reverse('order-batch'), [{'product_id': own[1].id, 'quantity': 2}] * 3, format='json')
+        assert response.status_code == 201
+        assert client.get(reverse('order-stats')).data['owner']['quantity'] == 6
+
+        response = client.delete(reverse('product-detail', args=[own[1].id]))
+        assert response.data['orders_affected'] == 3
+        assert orders.aggregate('product_id', own[1].id)['by_status'] == {'cancelled': {'count': 3, 'quantity': 6}}
+        assert own[1].id not in products
+
+
+class TestMockStore:
+    """Тесты хранилища mock-объектов и его индексов"""
+
+    @pytest.fixture
+    def owners(self):
+        return [SimpleNamespace(pk=i, email=f'owner{i}@test.ru') for i in (1, 2)]
+
+    def test_owner_index_follows_create_update_delete(self, owners):
+        """Индекс по владельцу обновляется при создании, изменении и удалении"""
+        store = MockStore()
+        first = store.add(MockProduct("First", 100, owners[0]))
+        second = store.add(MockProduct("Second", 200, owners[0]))
+        other = store.add(MockProduct("Other", 300, owners[1]))
+
+        assert {p.id for p in store.owned_by(1)} == {first.id, second.id}
+        assert len(store.owned_by(2)) == 1
+
+        # Смена владельца переносит объект в другой индекс
+        store.update(second.id, owner=owners[1])
+        assert {p.id for p in store.owned_by(1)} == {first.id}
+        assert {p.id for p in store.owned_by(2)} == {second.id, other.id}
+
+        store.delete(other.id)
+        del store[first.id]
+        assert list(store.owned_by(1)) == []
+        assert [p.id for p in store.values()] == [second.id]
+
+    def test_compact_representation(self, owners):
+        """Товар хранит только id/email владельца и время в виде int, без __dict__"""
+        product = MockProduct("Compact", "10.5", owners[0])
+
+        assert not hasattr(product, '__dict__')
+        assert product.owner == (1, 'owner1@test.ru')
+        assert product.owner_id == 1
+        assert product.to_dict()['owner'] == 'owner1@test.ru'
+        assert product.to_dict()['price'] == 10.5
+        assert abs(product.created_at.timestamp() * 1_000_000 - product.created_ts) < 1
+
+    def test_created_at_format(self, owners):
+        """created_at в ответе - как раньше datetime.now().isoformat(): локальное время без часового пояса"""
+        product = MockProduct("Format", 10, owners[0])
+        product.created_ts = 1_700_000_000_123_456
+        created_at = product.to_dict()['created_at']
+        assert re.fullmatch(r'\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.123456', created_at)
+        assert created_at == datetime.fromtimestamp(1_700_000_000).replace(microsecond=123456).isoformat()
+
+        product.created_ts = 1_700_000_000_000_000
+        assert product.to_dict()['created_at'] == datetime.fromtimestamp(1_700_000_000).isoformat()
+        created_at = datetime.fromisoformat(MockOrder('p', 1, owners[0]).to_dict()['created_at'])
+        assert abs(created_at - datetime.now()) < timedelta(minutes=1)
+
+    def test_cached_json_invalidated_on_update(self, owners):
+        """JSON объекта сериализуется один раз и пересобирается только после изменения"""
+        store = MockStore()
+        product = store.add(MockProduct("Cached", 10, owners[0]))
+
+        encoded = product.to_json()
+        assert json.loads(encoded) == product.to_dict()
+        assert store[product.id].to_json() is encoded  # повторно не сериализуется
+
+        updated = store.update(product.id, name="Changed")
+        assert json.loads(updated.to_json())['name'] == "Changed"
+        assert json.loads(product.to_json())['name'] == "Cached"  # старая версия не тронута
+        assert '_json' not in dump_item(updated)  # кеш не попадает в снимки и журнал
+
+    def test_cached_json_rejects_nan(self, owners):
+        """Как и JSONRenderer, готовый JSON не пропускает NaN/Infinity"""
+        product = MockProduct("Broken", float('nan'), owners[0])
+        with pytest.raises(ValueError):
+            product.to_json()
+
+    def test_price_index(self, owners):
+        """Индекс цены следует за изменениями и удалениями, диапазон включает границы"""
+        store = MockStore(orderings=('price',))
+        first, second = owners
+        items = [store.add(MockProduct(f"P{price}", price, first)) for price in (10, 20, 30, 40)]
+        store.add(MockProduct("Other", 25, second))
+
+        store.update(items[0].id, price=35)
+        store.delete(items[3].id)
+
+        view = store.values().ordered_by('price', 20, 35)
+        assert [p.price for p in view] == [20, 25, 30, 35]
+        assert len(view) == 4
+        assert [p.price for p in view.owned_by(first.pk)] == [20, 30, 35]
+
+        page, next_key = view.page(limit=2)
+        assert [p.price for p in page] == [20, 25]
+        page, next_key = view.page(after=next_key, limit=2)
+        assert [p.price for p in page] == [30, 35] and next_key is None
+
+        with pytest.raises(ValueError):
+            store.values().ordered_by('name')
+
+    def test_name_search_index(self, owners):
+        """Поисковый индекс следует за переименованием и удалением"""
+        store = MockStore(search_fields=('name',))
+        first, second = owners
+        kettle = store.add(MockProduct("Electric kettle", 10, first))
+        store.add(MockProduct("Kettlebell", 20, second))
+
+        assert {p.name for p in store.search('name', 'kettle')} == {"Electric kettle", "Kettlebell"}
+        assert [p.name for p in store.values().owned_by(2).search('name', 'ttl')] == ["Kettlebell"]
+
+        store.update(kettle.id, name="Toaster")
+        assert [p.name for p in store.search('name', 'kettle')] == ["Kettlebell"]
+        assert [p.name for p in store.search('name', 'to')] == ["Toaster"]
+
+        store.delete(kettle.id)
+        assert list(store.search('name', 'toaster')) == []
+        assert store._text['name']._root.children.keys() == {'k'}  # пустые ветки дерева удалены
+
+    @pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+    def test_order_aggregates(self, owners, tmp_path, backend):
+        """Агрегаты и индекс product_id совпадают с пересчётом по всем заказам в обоих хранилищах"""
+        aggregates = GroupAggregates(('product_id', 'owner_id'))
+        if backend == 'memory':
+            store = MockStore(lookups=('product_id',), aggregates=aggregates)
+        else:
+            store = SQLiteStore(
+                tmp_path / 'orders.sqlite3', 'mock_orders', MockOrder, lookups=('product_id',), aggregates=aggregates
+            )
+
+        orders = [store.add(MockOrder(f"p{i % 3}", i + 1, owners[i % 2])) for i in range(12)]
+        store.add_many(MockOrder("p0", 5, owners[0]) for _ in range(2))
+        for order in orders[:4]:
+            store.update(order.id, status='cancelled')
+        store.delete(orders[5].id)
+
+        for field, value in (('product_id', 'p0'), ('owner_id', 1), ('product_id', 'p2')):
+            group = [o for o in store.values() if getattr(o, field) == value]
+            stats = store.aggregate(field, value)
+            assert stats['count'] == len(group)
+            assert stats['quantity'] == sum(o.quantity for o in group)
+            assert stats['by_status'].get('cancelled', {}).get('count', 0) == sum(
+                o.status == 'cancelled' for o in group
+            )
+        product_orders = store.filter_by('product_id', 'p1')
+        assert [o.id for o in product_orders] == [
+            o.id for o in sorted(store.values(), key=created_key) if o.product_id == 'p1'
+        ]
+        assert [o.owner_id for o in product_orders.owned_by(1)] == [1] * len(product_orders.owned_by(1))
+
+        store.clear()
+        assert store.aggregate('owner_id', 1) == {'count': 0, 'quantity': 0, 'by_status': {}}
+
+    @pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+    def test_store_version(self, owners, tmp_path, backend):
+        """Счётчик записей меняется при каждом изменении хранилища и не меняется при чтении"""
+        if backend == 'memory':
+            store = MockStore()
+        else:
+            store = SQLiteStore(tmp_path / 'products.sqlite3', 'mock_products', MockProduct)
+
+        versions = [store.version]
+        product = store.add(MockProduct("Kettle", 10, owners[0]))
+        versions.append(store.version)
+        store.add_many(MockProduct("Toaster", 20, owners[1]) for _ in range(3))
+        versions.append(store.version)
+        list(store.values())
+        assert store.version == versions[-1]
+        store.update(product.id, price=15)
+        versions.append(store.version)
+        with pytest.raises(VersionConflict):
+            store.update(product.id, expected_version=1, price=20)
+        assert store.version == versions[-1]
+        store.delete(product.id)
+        versions.append(store.version)
+        store.clear()
+        versions.append(store.version)
+        assert versions == sorted(set(versions))
+
+    def test_id_allocator(self, monkeypatch):
+        """ID уникальны между потоками и воркерами, растут вместе со временем даже при переводе часов назад"""
+        allocator = IdAllocator(worker_id=1)
+        results = [[] for _ in range(4)]
+
+        def worker(out):
+            for _ in range(5000):
+                out.append(allocator.next_id())
+
+        threads = [threading.Thread(target=worker, args=(out,)) for out in results]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        ids = [item_id for out in results for item_id in out]
+        assert len(set(ids)) == len(ids)
+        assert all(out == sorted(out) for out in results)
+        assert {len(item_id) for item_id in ids} == {13}
+
+        # Часы ушли назад - ID всё равно растут
+        last = allocator.next_id()
+        now = time.time_ns()
+        monkeypatch.setattr(time, 'time_ns', lambda: now - 10 ** 10)
+        assert allocator.next_id() > last
+        monkeypatch.undo()
+
+        # Другой воркер в ту же миллисекунду даёт другой ID
+        assert IdAllocator(worker_id=2).next_id() != IdAllocator(worker_id=1).next_id()
+        assert abs(id_timestamp_ms(allocator.next_id()) - time.time_ns() // 1_000_000) < 1000
+
+    def test_id_worker_slots(self, settings, tmp_path):
+        """Номер воркера - свободная блокировка на узле; явный номер вне диапазона - ошибка настройки"""
+        first, first_file = claim_worker_slot(tmp_path)
+        second, second_file = claim_worker_slot(tmp_path)
+        assert first != second
+        first_file.close()  # процесс завершился - номер снова свободен
+        assert claim_worker_slot(tmp_path)[0] == first
+
+        with pytest.raises(ImproperlyConfigured):
+            IdAllocator(worker_id=1024)
+        settings.MOCK_ID_WORKER_ID = -1
+        with pytest.raises(ImproperlyConfigured):
+            IdAllocator().next_id()
+
+    @pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+    def test_add_does_not_overwrite(self, owners, tmp_path, backend):
+        """Совпавший ID при добавлении (в том числе внутри пачки) - ошибка, а не перезапись"""
+        if backend == 'memory':
+            store = MockStore(orderings=('price',), search_fields=('name',))
+        else:
+            store = SQLiteStore(tmp_path / 'mock.sqlite3', 'products', MockProduct,
+                                orderings=('price',), search_fields=('name',))
+        product = store.add(MockProduct('First', 10, owners[0]))
+        duplicate = MockProduct('Second', 20, owners[1])
+        duplicate.id = product.id
+        with pytest.raises(sqlite3.IntegrityError):
+            store.add(duplicate)
+        with pytest.raises(sqlite3.IntegrityError):
+            store.add_many([duplicate])
+
+        fresh = MockProduct('Fresh', 30, owners[0])
+        twin = MockProduct('Twin', 40, owners[0])
+        twin.id = fresh.id
+        with pytest.raises(sqlite3.IntegrityError):
+            store.add_many([fresh, twin])
+
+        assert store[product.id].name == 'First'
+        assert fresh.id not in store
+        assert [item.name for item in store.values().ordered_by('price')] == ['First']
+        assert list(store.search('name', 'Second')) == []
+
+    def test_in_place_reassignment_rejected(self, owners):
+        """Изменённый на месте объект нельзя положить обратно: lookup-индекс и агрегаты остаются верными"""
+        store = MockStore(lookups=('product_id',), aggregates=GroupAggregates(('product_id',)))
+        order = store.add(MockOrder('p1', 2, owners[0]))
+        order.product_id = 'p2'
+        with pytest.raises(ValueError):
+            store[order.id] = order
+        order.product_id = 'p1'
+
+        assert list(store.filter_by('product_id', 'p1')) == [order]
+        assert store.aggregate('product_id', 'p1')['quantity'] == 2
+        assert store.aggregate('product_id', 'p2')['count'] == 0
+
+    @pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+    def test_update_without_changes_keeps_versions(self, owners, tmp_path, backend):
+        """update() с теми же значениями не меняет версию объекта и хранилища (ETag остаётся прежним)"""
+        if backend == 'memory':
+            store = MockStore()
+        else:
+            store = SQLiteStore(tmp_path / 'mock.sqlite3', 'products', MockProduct)
+        product = store.add(MockProduct('Same', 10, owners[0]))
+        version = store.version
+
+        assert store.update(product.id, name='Same', price=10.0).version == 1
+        assert store.update(product.id).version == 1
+        assert store.version == version
+
+        assert store.update(product.id, price=20).version == 2
+        assert store.version != version
+
+    def test_concurrent_compare_and_swap(self, owners):
+        """Параллельные CAS-обновления не теряются, индексы остаются согласованными"""
+        store = MockStore()
+        counter = store.add(MockOrder('product', 0, owners[0]))
+        threads_count, increments = 8, 200
+
+        def increment():
+            for _ in range(increments):
+                while True:
+                    current = store[counter.id]
+                    try:
+                        store.update(counter.id, expected_version=current.version,
+                                     quantity=current.quantity + 1)
+                        break
+                    except VersionConflict:
+                        continue
+
+        def churn(owner):
+            for i in range(increments):
+                product = store.add(MockOrder(f'p{i}', 1, owner))
+                store.update(product.id, status='completed')
+                if i % 2:
+                    store.delete(product.id)
+
+        threads = [threading.Thread(target=increment) for _ in range(threads_count)]
+        threads += [threading.Thread(target=churn, args=(owner,)) for owner in owners]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert store[counter.id].quantity == threads_count * increments
+        assert store[counter.id].version == threads_count * increments + 1
+        assert len(store) == 1 + len(owners) * increments // 2
+        assert len(store.values()) == len(store)
+        assert sum(len(store.owned_by(owner.pk)) for owner in owners) == len(store)
+
+    def test_sqlite_store_shared_between_workers(self, owners, tmp_path):
+        """Два экземпляра SQLiteStore на одном файле (как два воркера) видят изменения друг друга"""
+        path = tmp_path / 'mock_store.sqlite3'
+        worker_a = SQLiteStore(path, 'mock_products', MockProduct, orderings=('price',), search_fields=('name',))
+        worker_b = SQLiteStore(path, 'mock_products', MockProduct, orderings=('price',), search_fields=('name',))
+
+        created = [worker_a.add(MockProduct(f"Product {i}", 100 + i, owners[i % 2])) for i in range(5)]
+        assert len(worker_b) == 5
+        assert worker_b[created[0].id].to_dict() == created[0].to_dict()
+
+        worker_b.update(created[0].id, expected_version=1, name='Renamed')
+        assert worker_a[created[0].id].name == 'Renamed'
+        with pytest.raises(VersionConflict):
+            worker_a.update(created[0].id, expected_version=1, name='Stale')
+
+        # Выборка по владельцу и постраничный вывод идут через индексы SQLite
+        own = sorted((p for p in created if p.owner_id == 1), key=created_key)
+        page, next_key = worker_b.values().owned_by(1).page(limit=2)
+        assert [p.id for p in page] == [p.id for p in own[:2]]
+        rest, last_key = worker_b.owned_by(1).page(after=next_key, limit=2)
+        assert [p.id for p in rest] == [p.id for p in own[2:]]
+        assert last_key is None
+
+        by_price = worker_b.values().ordered_by('price', 101, 103)
+        assert [p.price for p in by_price] == [101, 102, 103]
+        assert len(by_price.owned_by(1)) == 1
+        assert [p.id for p in worker_b.search('name', 'renamed')] == [created[0].id]
+        assert len(worker_b.values().search('name', 'prod 3')) == 1
+        assert len(worker_b.values().search('name', 'prod 9')) == 0
+
+        worker_a.delete(created[1].id, expected_version=1)
+        assert created[1].id not in worker_b
+
+    def test_journal_restores_store_after_restart(self, owners, tmp_path):
+        """Снимок + журнал восстанавливают хранилище, оборванная запись в конце журнала отбрасывается"""
+        def restart():
+            return StoreJournal(tmp_path, 'mock_products', MockProduct, snapshot_every=1000).attach(MockStore())
+
+        store = restart()
+        products = [store.add(MockProduct(f"Product {i}", 100 + i, owners[i % 2])) for i in range(6)]
+        store.update(products[0].id, name='Renamed')
+        store.delete(products[1].id)
+        store.journal.compact()
+
+        # Операции после снимка попадают только в журнал
+        store.update(products[2].id, price=999)
+        store.delete(products[3].id)
+        batch = store.add_many(MockProduct(f"Batch {i}", 10, owners[0]) for i in range(3))
+        store.journal.close()
+        with open(tmp_path / 'mock_products.log', 'ab') as log:
+            log.write(b'\x10\x00\x00\x00broken')
+
+        restored = restart()
+        expected = [p.id for p in products if p.id not in (products[1].id, products[3].id)] + [p.id for p in batch]
+        assert sorted(restored.keys()) == sorted(expected)
+        assert restored[products[0].id].name == 'Renamed'
+        assert restored[products[2].id].price == 999
+        assert restored[products[2].id].version == 2
+        assert [p.id for p in restored.owned_by(1)] == [p.id for p in store.owned_by(1)]